@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Classifier', '0005_wojewodztwoanalysis_delete_wojewodztwo_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='artifacts_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='wojewodztwoanalysis',
+            name='artifacts_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', help_text='Background writer state of mask/blended/json files', max_length=16),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # models.py
 from django.db import models
 from django.utils import timezone
+from Classifier.src.writer import ARTIFACT_STATUS_CHOICES, ARTIFACTS_READY
 
 class TileSource(models.Model):
     """each tile metadata"""
@@ -32,6 +33,7 @@ class Analysis(models.Model):
     fig_path = models.CharField(max_length=1024, blank=True, null=True)
     mask_path = models.CharField(max_length=1024, blank=True, null=True)
     change_log_path = models.CharField(max_length=1024, blank=True, null=True)
+    artifacts_status = models.CharField(max_length=16, choices=ARTIFACT_STATUS_CHOICES, default=ARTIFACTS_READY)
 
     bbox_minx = models.FloatField(null=True, blank=True)
     bbox_miny = models.FloatField(null=True, blank=True)
@@ -55,6 +57,7 @@ class Analysis(models.Model):
             "adjacency": self.adjacency,
             "fig_path": self.fig_path,
             "mask_path": self.mask_path,
+            "artifacts_status": self.artifacts_status,
         }
 
 # obsolete
@@ -108,6 +111,8 @@ class WojewodztwoAnalysis(models.Model):
     stats_json = models.CharField(max_length=500, null=True, blank=True)
     metadata_json = models.CharField(max_length=500, null=True, blank=True)
     change_log_path = models.CharField(max_length=500, null=True, blank=True)
+    artifacts_status = models.CharField(max_length=16, choices=ARTIFACT_STATUS_CHOICES, default=ARTIFACTS_READY,
+                                        help_text="Background writer state of mask/blended/json files")
     total_area_km2 = models.FloatField(null=True, blank=True)
 
     # Timestamps
@@ -0,0 +1,284 @@
+# accumulators.py
+# mergeable accumulators dla analizy w kawalkach (pasy wierszy label rastra)
+# strip -> accumulator, merge sasiednich pasow, finalize -> te same dicty co compute_label_stats
+
+from functools import reduce
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from Classifier.src.landscape import label_patches, metrics_from_patches, class_edge_cells
+from Classifier.src.stats import (
+    class_row_counts, pixel_row_areas_km2, pixel_area_km2, _pair_counts, adjacency_from_pairs,
+    areas_from_counts, percentages_from_counts, density_from_counts
+)
+
+
+class ClassCountAccumulator:
+    """class pixel counts + Mercator-weighted areas (order-free)"""
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.counts_all = np.zeros(num_classes, dtype=np.int64)
+        self.counts_valid = np.zeros(num_classes, dtype=np.int64)
+        self.areas = np.zeros(num_classes, dtype=np.float64)
+        self.total_valid = 0
+        self.total_pixels = 0
+
+    def update(self, labels, valid_mask=None, row_areas=None):
+        counts_all, row_counts_valid, total_valid = class_row_counts(labels, self.num_classes, valid_mask)
+        self.counts_all += counts_all
+        self.counts_valid += row_counts_valid.sum(axis=0)
+        if row_areas is not None:
+            self.areas += row_areas @ row_counts_valid
+        self.total_valid += total_valid
+        self.total_pixels += labels.size
+        return self
+
+    def merge(self, other):
+        self.counts_all += other.counts_all
+        self.counts_valid += other.counts_valid
+        self.areas += other.areas
+        self.total_valid += other.total_valid
+        self.total_pixels += other.total_pixels
+        return self
+
+
+class AdjacencyAccumulator:
+    """
+    neighbour pair counts; same window as compute_adjacency_from_labels (y < h-1, x < w-1),
+    so the horizontal pairs of the current bottom row are kept apart until finalize
+    """
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.horizontal = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.vertical = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.bottom_horizontal = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.first_row = None
+        self.last_row = None
+
+    def update(self, labels):
+        k = self.num_classes
+        self.horizontal += _pair_counts(labels[:, :-1], labels[:, 1:], k)
+        self.vertical += _pair_counts(labels[:-1, :-1], labels[1:, :-1], k)
+        self.bottom_horizontal = _pair_counts(labels[-1:, :-1], labels[-1:, 1:], k)
+        self.first_row = labels[0].copy()
+        self.last_row = labels[-1].copy()
+        return self
+
+    def merge(self, below):
+        """self = upper strip, below = strip starting right after self"""
+        k = self.num_classes
+        self.horizontal += below.horizontal
+        self.vertical += below.vertical
+        # szew: ostatni wiersz gornego pasa z pierwszym dolnego
+        self.vertical += _pair_counts(self.last_row[None, :-1], below.first_row[None, :-1], k)
+        self.bottom_horizontal = below.bottom_horizontal
+        self.last_row = below.last_row
+        return self
+
+    def finalize(self, class_names):
+        return adjacency_from_pairs(self.horizontal - self.bottom_horizontal + self.vertical, class_names)
+
+
+class PatchAccumulator:
+    """
+    connected components (4-sasiedztwo) per strip, stitched along the seam rows;
+    keeps only per-patch class/size and the boundary rows' patch ids
+    """
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.patch_class = np.zeros(0, dtype=np.int64)
+        self.patch_cells = np.zeros(0, dtype=np.int64)
+        self.edges = np.zeros(num_classes, dtype=np.int64)
+        # ids: 0 = brak klasy, i -> patch i-1
+        self.first_ids = None
+        self.last_ids = None
+        self.first_row = None
+        self.last_row = None
+
+    def update(self, labels):
+        k = self.num_classes
+        patch_ids, patch_class, patch_cells = label_patches(labels, k)
+        self.patch_class = patch_class[1:]
+        self.patch_cells = patch_cells[1:].astype(np.int64)
+        self.edges = class_edge_cells(labels, k)
+        self.first_ids = patch_ids[0].copy()
+        self.last_ids = patch_ids[-1].copy()
+        self.first_row = labels[0].copy()
+        self.last_row = labels[-1].copy()
+        return self
+
+    def merge(self, below):
+        """self = upper strip, below = strip starting right after self"""
+        k = self.num_classes
+        n_upper = len(self.patch_class)
+        n = n_upper + len(below.patch_class)
+        if n == 0:
+            self.last_ids = below.last_ids
+            self.last_row = below.last_row
+            return self
+
+        upper, lower = self.last_row, below.first_row
+        valid = (upper < k) & (lower < k)
+        same = valid & (upper == lower)
+        diff = valid & (upper != lower)
+
+        # platy stykajace sie przez szew -> jeden komponent
+        a = self.last_ids[same] - 1
+        b = below.first_ids[same] - 1 + n_upper
+        graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+        _, component = connected_components(graph, directed=False)
+
+        cells = np.concatenate([self.patch_cells, below.patch_cells])
+        classes = np.concatenate([self.patch_class, below.patch_class])
+        num_components = component.max() + 1
+        self.patch_cells = np.bincount(component, weights=cells, minlength=num_components).astype(np.int64)
+        self.patch_class = np.zeros(num_components, dtype=np.int64)
+        self.patch_class[component] = classes
+
+        def remap(ids, offset):
+            return np.where(ids > 0, component[np.maximum(ids - 1 + offset, 0)] + 1, 0)
+
+        self.first_ids = remap(self.first_ids, 0)
+        self.last_ids = remap(below.last_ids, n_upper)
+        self.last_row = below.last_row
+
+        self.edges = self.edges + below.edges
+        self.edges += np.bincount(upper[diff], minlength=k)[:k]
+        self.edges += np.bincount(lower[diff], minlength=k)[:k]
+        return self
+
+    def finalize(self, class_names, pixel_area=None):
+        return metrics_from_patches(self.patch_class, self.patch_cells, self.edges, class_names, pixel_area)
+
+
+class ConfidenceAccumulator:
+    """confidence sums per class (order-free)"""
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.sums = np.zeros(num_classes, dtype=np.float64)
+        self.counts = np.zeros(num_classes, dtype=np.int64)
+
+    def update(self, labels, confidence):
+        k = self.num_classes
+        sel = labels < k
+        self.sums += np.bincount(labels[sel], weights=confidence[sel], minlength=k)[:k]
+        self.counts += np.bincount(labels[sel], minlength=k)[:k]
+        return self
+
+    def merge(self, other):
+        self.sums += other.sums
+        self.counts += other.counts
+        return self
+
+    def finalize(self, class_names):
+        total = self.counts.sum()
+        return {
+            "mean_confidence": float(self.sums.sum() / total) if total > 0 else 0.0,
+            "mean_confidence_per_class": {
+                cls: float(self.sums[i] / self.counts[i]) if self.counts[i] > 0 else 0.0
+                for i, cls in enumerate(class_names)
+            },
+        }
+
+
+class StatsAccumulator:
+    """
+    All accumulators for a row range [row_start, row_end) of one label raster.
+    Strips can be merged in any grouping as long as merged pieces are adjacent
+    (sharded -> reduce in row order), finalize == compute_label_stats on the whole raster.
+    """
+
+    def __init__(self, class_names, zoom=None, bounds=None, origin_px=None):
+        self.class_names = list(class_names)
+        self.zoom = zoom
+        self.bounds = bounds
+        self.origin_px = origin_px
+        k = len(self.class_names)
+        self.counts = ClassCountAccumulator(k)
+        self.adjacency = AdjacencyAccumulator(k)
+        self.patches = PatchAccumulator(k)
+        self.confidence = ConfidenceAccumulator(k)
+        self.row_start = None
+        self.row_end = None
+        self.width = None
+
+    @classmethod
+    def from_strip(cls, labels, class_names, row_offset=0, valid_mask=None, confidence=None,
+                   zoom=None, bounds=None, origin_px=None):
+        """
+        Args:
+            labels: uint8 rows [row_offset, row_offset + h) of the label raster
+            valid_mask, confidence: same rows (optional)
+            origin_px: global pixel of the raster's top-left (row 0); None -> bounds' north-west
+        """
+        acc = cls(class_names, zoom=zoom, bounds=bounds, origin_px=origin_px)
+        h, w = labels.shape
+        acc.row_start, acc.row_end, acc.width = row_offset, row_offset + h, w
+
+        acc.counts.update(labels, valid_mask, pixel_row_areas_km2(zoom, bounds, h, row_offset, origin_px))
+        acc.adjacency.update(labels)
+        acc.patches.update(labels)
+        if confidence is not None:
+            acc.confidence.update(labels, confidence)
+        return acc
+
+    def merge(self, other):
+        """merge an adjacent strip (above or below) into self; other is consumed. Returns self"""
+        if other.row_start is None:
+            return self
+        if self.row_start is None:
+            self.__dict__.update(other.__dict__)
+            return self
+        if other.class_names != self.class_names or other.width != self.width:
+            raise ValueError("Cannot merge accumulators with different classes or width")
+
+        if other.row_start == self.row_end:
+            upper, lower = self, other
+        elif other.row_end == self.row_start:
+            upper, lower = other, self
+        else:
+            raise ValueError(
+                f"Strips not adjacent: [{self.row_start}, {self.row_end}) and [{other.row_start}, {other.row_end})"
+            )
+
+        self.counts.merge(other.counts)
+        self.confidence.merge(other.confidence)
+        self.adjacency = upper.adjacency.merge(lower.adjacency)
+        self.patches = upper.patches.merge(lower.patches)
+        self.row_start, self.row_end = upper.row_start, lower.row_end
+        return self
+
+    def finalize(self):
+        """-> raw stats dict, same keys/values as compute_label_stats (+ confidence if given)"""
+        names = self.class_names
+        pixel_area = pixel_area_km2(self.zoom, self.bounds)
+        counts = self.counts
+        landscape = self.patches.finalize(names, pixel_area)
+
+        if self.zoom is not None and self.bounds is not None:
+            areas = {cls: counts.areas[i] for i, cls in enumerate(names)}
+        else:
+            areas = areas_from_counts(counts.counts_valid, names, pixel_area)
+
+        stats = {
+            "areas_sq_km": areas,
+            "areas_pct": percentages_from_counts(counts.counts_valid, names, counts.total_valid),
+            "density_default": density_from_counts(counts.counts_all, names, counts.total_pixels),
+            "fragmentation_index": landscape.pop("fragmentation_index"),
+            "adjacency_proportions": self.adjacency.finalize(names),
+            "landscape_metrics": landscape,
+        }
+        if self.confidence.counts.sum() > 0:
+            stats.update(self.confidence.finalize(names))
+        return stats
+
+
+def merge_accumulators(accumulators):
+    """reduce adjacent strip accumulators (any grouping, row order)"""
+    return reduce(lambda a, b: a.merge(b), accumulators)
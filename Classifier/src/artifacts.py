@@ -0,0 +1,142 @@
+# artifacts.py
+# artefakty pochodne (blended, thumbnails, residential, GeoTIFF, GeoJSON) liczone przy pierwszym zadaniu,
+# z label rastra zapisanego przez save_analysis_outputs; potem cache na dysku
+
+import os
+import threading
+
+import cv2
+
+from Classifier.src.postprocess import (
+    analysis_artifact_path, create_thumbnail, save_residential_area, thumbnail_path
+)
+from Classifier.src.export import (
+    export_confidence_geotiff, export_label_geotiff, landcover_features, write_geojson
+)
+from Classifier.src.utils.atomic import atomic_imwrite, atomic_path
+from Classifier.src.render import (
+    labels_path_for_mask, load_analysis_labels, load_label_raster, pixel_confidence, render_labels,
+    tile_grid_labels
+)
+
+BLENDED_ALPHA = 0.8
+
+# staly zestaw blokad wybieranych po hashu sciezki (slownik blokad per sciezka rosl bez konca);
+# kolizja dwoch sciezek = tylko serializacja ich budowania
+ARTIFACT_LOCK_STRIPES = 64
+_locks = tuple(threading.RLock() for _ in range(ARTIFACT_LOCK_STRIPES))
+
+
+def _artifact_lock(path):
+    return _locks[hash(path) % ARTIFACT_LOCK_STRIPES]
+
+
+def materialize_artifact(path, build):
+    """
+    Returns path, building it first if missing. One build per artifact at a time,
+    concurrent requests for the same path wait for it instead of recomputing.
+    Args:
+        build: build(path) -> path or None (nothing to produce)
+    """
+    if os.path.exists(path):
+        return path
+    with _artifact_lock(path):
+        if os.path.exists(path):
+            return path
+        print(f"[ARTIFACT] Materializing {os.path.basename(path)}")
+        return build(path)
+
+
+def _load_original(image_path):
+    if not image_path or not os.path.exists(image_path):
+        print(f"[ARTIFACT] Original image missing: {image_path}")
+        return None
+    return cv2.imread(image_path)
+
+
+def blended_artifact(mask_path, image_path, blended_path=None):
+    """original + palette mask overlay (alpha 0.8), built from the stored label raster"""
+    blended_path = blended_path or analysis_artifact_path(mask_path, "blended")
+
+    def build(path):
+        original = _load_original(image_path)
+        if original is None:
+            return None
+        labels, class_names = load_analysis_labels(mask_path)
+        if labels.shape != original.shape[:2]:
+            print(f"[ARTIFACT] Label raster {labels.shape} does not match {image_path}")
+            return None
+        classification_mask = render_labels(labels, class_names)
+        blended = cv2.addWeighted(original, BLENDED_ALPHA, classification_mask, 1 - BLENDED_ALPHA, 0)
+        return atomic_imwrite(path, blended)
+
+    return materialize_artifact(blended_path, build)
+
+
+def thumbnail_artifact(source_path, max_size=(800, 800), quality=85):
+    """_thumb.jpg of an existing image (reduced-resolution decode)"""
+    if not source_path or not os.path.exists(source_path):
+        return None
+    return materialize_artifact(
+        thumbnail_path(source_path),
+        lambda path: create_thumbnail(source_path, max_size=max_size, quality=quality)
+    )
+
+
+def residential_artifact(mask_path, image_path):
+    """Residential pixels of the original, cropped to their bbox (None if the class is absent)"""
+    def build(path):
+        original = _load_original(image_path)
+        if original is None:
+            return None
+        labels, class_names = load_analysis_labels(mask_path)
+        if labels.shape != original.shape[:2]:
+            print(f"[ARTIFACT] Label raster {labels.shape} does not match {image_path}")
+            return None
+        return save_residential_area(original, labels, class_names, path)
+
+    return materialize_artifact(analysis_artifact_path(mask_path, "residential"), build)
+
+
+def geotiff_artifact(mask_path, kind, zoom, origin_px):
+    """
+    kind: "labels" / "confidence" -> tiled GeoTIFF (EPSG:3857) next to the mask
+    Raises RuntimeError without rasterio.
+    """
+    def build(path):
+        if kind == "labels":
+            labels, class_names = load_analysis_labels(mask_path)
+            with atomic_path(path) as tmp_path:
+                export_label_geotiff(tmp_path, labels, zoom, origin_px, class_names)
+            return path
+
+        labels_path = labels_path_for_mask(mask_path)
+        if not os.path.exists(labels_path):
+            print(f"[ARTIFACT] No stored confidence for {mask_path}")
+            return None
+        confidence = pixel_confidence(load_label_raster(labels_path))
+        if confidence is None:
+            return None
+        with atomic_path(path) as tmp_path:
+            export_confidence_geotiff(tmp_path, confidence, zoom, origin_px)
+        return path
+
+    return materialize_artifact(analysis_artifact_path(mask_path, kind, ".tif"), build)
+
+
+def landcover_artifact(mask_path, zoom, origin_px):
+    """class region polygons of the tile grid -> _landcover.geojson (lon/lat, streamed)"""
+    def build(path):
+        labels_path = labels_path_for_mask(mask_path)
+        if os.path.exists(labels_path):
+            raster = load_label_raster(labels_path)
+            grid, cell_size = tile_grid_labels(raster)
+            class_names = raster["class_names"]
+        else:
+            # stara analiza bez .npz: siatka = piksele maski
+            grid, class_names = load_analysis_labels(mask_path)
+            cell_size = 1
+        features = landcover_features(grid, cell_size, zoom, origin_px, class_names)
+        return write_geojson(path, features)[0]
+
+    return materialize_artifact(analysis_artifact_path(mask_path, "landcover", ".geojson"), build)
@@ -0,0 +1,249 @@
+# export.py
+# eksport georeferencyjny wynikow analizy (GeoTIFF w EPSG:3857, poligony GeoJSON)
+
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+import shapely
+
+from Classifier.src.render import class_palette
+from Classifier.src.stats import LABEL_NODATA, meters_per_pixel_at_zoom
+from Classifier.src.utils.atomic import atomic_path
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# polowa obwodu rownika w EPSG:3857 (m)
+WEB_MERCATOR_HALF_WORLD = math.pi * 6378137.0
+GEOTIFF_BLOCK_SIZE = 256
+# coverage_simplify w komorkach siatki: < ~0.7 usuwa tylko punkty wspolliniowe (granice komorek bez zmian),
+# wieksze scina narozniki schodkow (kosztem pojedynczych komorek); ~0.1 m precyzji wspolrzednych
+LANDCOVER_SIMPLIFY_TOLERANCE = 0.5
+# coverage_simplify trzyma w pamieci wszystkie poligony naraz -> wieksze siatki (np. maski per piksel) probkowane
+LANDCOVER_MAX_CELLS = 2048 * 2048
+GEOJSON_COORD_DECIMALS = 6
+
+
+def geotiff_available():
+    return rasterio is not None
+
+
+def _require_rasterio():
+    if rasterio is None:
+        raise RuntimeError("GeoTIFF export requires rasterio (pip install rasterio)")
+
+
+def web_mercator_transform(zoom, origin_px, tile_size=256):
+    """
+    Affine (a, b, c, d, e, f) of an image whose top-left pixel is origin_px = (x, y)
+    in the global pixel grid at zoom (2^zoom * tile_size pixels per world width), EPSG:3857 metres
+    """
+    resolution = 2 * WEB_MERCATOR_HALF_WORLD / (tile_size * 2 ** zoom)
+    x0, y0 = origin_px
+    return (
+        resolution, 0.0, -WEB_MERCATOR_HALF_WORLD + x0 * resolution,
+        0.0, -resolution, WEB_MERCATOR_HALF_WORLD - y0 * resolution,
+    )
+
+
+def overview_factors(shape, block_size=GEOTIFF_BLOCK_SIZE):
+    """2, 4, 8, ... while the overview is still larger than one block"""
+    factors = []
+    factor = 2
+    while max(shape) / factor >= block_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _geotiff_profile(shape, dtype, zoom, origin_px, nodata):
+    h, w = shape
+    return {
+        "driver": "GTiff",
+        "width": w,
+        "height": h,
+        "count": 1,
+        "dtype": dtype,
+        "crs": "EPSG:3857",
+        "transform": Affine(*web_mercator_transform(zoom, origin_px)),
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": GEOTIFF_BLOCK_SIZE,
+        "blockysize": GEOTIFF_BLOCK_SIZE,
+        "compress": "deflate",
+    }
+
+
+def export_label_geotiff(path, labels, zoom, origin_px, class_names):
+    """
+    uint8 label raster -> tiled, deflate GeoTIFF with palette, class names tag
+    and mode-resampled overviews (LABEL_NODATA = nodata)
+    """
+    _require_rasterio()
+    # COLORS w BGR -> kolormapa RGBA
+    palette = class_palette(class_names)[:, ::-1]
+    colormap = {i: tuple(int(c) for c in palette[i]) + (255,) for i in range(len(class_names))}
+    colormap[LABEL_NODATA] = (0, 0, 0, 0)
+
+    profile = _geotiff_profile(labels.shape, "uint8", zoom, origin_px, LABEL_NODATA)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.asarray(labels, dtype=np.uint8), 1)
+        dst.write_colormap(1, colormap)
+        dst.update_tags(class_names=json.dumps(list(class_names)), zoom=zoom)
+        factors = overview_factors(labels.shape)
+        if factors:
+            dst.build_overviews(factors, Resampling.mode)
+            dst.update_tags(ns="rio_overview", resampling="mode")
+    print(f"[EXPORT] Labels GeoTIFF {path} ({labels.shape[1]}x{labels.shape[0]}, overviews {factors})")
+    return path
+
+
+def export_confidence_geotiff(path, confidence, zoom, origin_px):
+    """float confidence raster (NaN = nodata) -> tiled GeoTIFF with averaged overviews"""
+    _require_rasterio()
+    profile = _geotiff_profile(confidence.shape, "float32", zoom, origin_px, float("nan"))
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.asarray(confidence, dtype=np.float32), 1)
+        factors = overview_factors(confidence.shape)
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+            dst.update_tags(ns="rio_overview", resampling="average")
+    print(f"[EXPORT] Confidence GeoTIFF {path}")
+    return path
+
+
+def read_geotiff_window(path, col_off, row_off, width, height, overview_level=None):
+    """Reads one window (only the intersecting internal tiles are decoded)"""
+    _require_rasterio()
+    kwargs = {} if overview_level is None else {"overview_level": overview_level}
+    with rasterio.open(path, **kwargs) as src:
+        return src.read(1, window=Window(col_off, row_off, width, height))
+
+
+def class_region_polygons(mask):
+    """
+    bool cell mask -> exact polygons of its regions in cell corner coordinates (x right, y down).
+    Traced with cv2.findContours on the 2x upsampled mask: every boundary pixel c
+    maps to cell corner ceil(c / 2), so one-cell regions keep their area and holes come from RETR_CCOMP.
+    Every corner along the boundary is kept, neighbouring classes share vertices (valid coverage).
+    """
+    up = np.repeat(np.repeat(mask.astype(np.uint8), 2, axis=0), 2, axis=1)
+    contours, hierarchy = cv2.findContours(up, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy[0]
+
+    def ring(i):
+        return np.ceil(contours[i][:, 0, :] / 2)
+
+    polygons = []
+    for i, (next_i, _, child, parent) in enumerate(hierarchy):
+        if parent != -1:
+            continue
+        holes = []
+        while child != -1:
+            holes.append(ring(child))
+            child = hierarchy[child][0]
+        polygon = shapely.remove_repeated_points(shapely.Polygon(ring(i), holes))
+        # regiony stykajace sie rogiem -> pierscien z punktem wspolnym
+        if not polygon.is_valid:
+            polygon = shapely.make_valid(polygon, method="structure", keep_collapsed=False)
+        polygons.append(polygon)
+    return polygons
+
+
+def _pixel_to_lonlat(coords, world_px):
+    lon = coords[:, 0] / world_px * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * coords[:, 1] / world_px))))
+    return np.round(np.column_stack([lon, lat]), GEOJSON_COORD_DECIMALS)
+
+
+def landcover_features(grid_labels, cell_size, zoom, origin_px, class_names,
+                       tolerance=LANDCOVER_SIMPLIFY_TOLERANCE, tile_size=256, max_cells=LANDCOVER_MAX_CELLS):
+    """
+    Generator of GeoJSON feature dicts, one per connected class region of the tile grid.
+    Regions are traced on grid cells (not pixels), simplified together as one coverage
+    (shared borders stay shared), then projected to lon/lat.
+    Memory: all region polygons are built before the first feature is yielded (the coverage has to be
+    simplified as a whole), O(boundary cells); grids above max_cells are sampled every n-th cell
+    (cell_size * n, trailing partial cells dropped) to keep that bounded.
+    Args:
+        grid_labels: uint8 grid (LABEL_NODATA = no region)
+        cell_size: pixels per grid cell
+        origin_px: global pixel (x, y) of the grid's top-left corner at zoom
+    Feature properties: class, class_index, cells, area_km2 (exact cell count, Mercator scale at the centroid)
+    """
+    step = math.ceil(math.sqrt(grid_labels.size / max_cells)) if grid_labels.size > max_cells else 1
+    if step > 1:
+        h, w = grid_labels.shape
+        grid_labels = grid_labels[:h - h % step:step, :w - w % step:step]
+        print(f"[EXPORT] Landcover grid {w}x{h} > {max_cells} cells, sampled every {step} cells")
+        cell_size *= step
+
+    polygons, classes = [], []
+    for k in np.unique(grid_labels):
+        if k >= len(class_names):
+            continue
+        regions = class_region_polygons(grid_labels == k)
+        polygons.extend(regions)
+        classes.extend([int(k)] * len(regions))
+    if not polygons:
+        return
+
+    cells = shapely.area(polygons)
+    if tolerance:
+        polygons = shapely.coverage_simplify(np.array(polygons, dtype=object), tolerance)
+
+    world_px = tile_size * 2 ** zoom
+    x0, y0 = origin_px
+    for polygon, k, n_cells in zip(polygons, classes, cells):
+        geometry = shapely.transform(
+            polygon, lambda c: _pixel_to_lonlat(c * cell_size + (x0, y0), world_px)
+        )
+        lat = shapely.get_y(shapely.centroid(geometry))
+        area_km2 = n_cells * (cell_size * meters_per_pixel_at_zoom(lat, zoom)) ** 2 / 1_000_000
+        yield {
+            "type": "Feature",
+            "properties": {
+                "class": class_names[k],
+                "class_index": k,
+                "cells": int(n_cells),
+                "area_km2": round(float(area_km2), 6),
+            },
+            "geometry": geometry,
+        }
+
+
+def iter_geojson(features):
+    """features (geometry = shapely) -> FeatureCollection text chunks, one feature at a time"""
+    yield '{"type": "FeatureCollection", "features": ['
+    for i, feature in enumerate(features):
+        properties = json.dumps(feature["properties"])
+        geometry = shapely.to_geojson(feature["geometry"])
+        yield f'{"," if i else ""}\n{{"type": "Feature", "properties": {properties}, "geometry": {geometry}}}'
+    yield "\n]}\n"
+
+
+def write_geojson(path, features):
+    """Streams the FeatureCollection to path (tmp file + rename). Returns: (path, feature count)"""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for feature in features:
+            count += 1
+            yield feature
+
+    with atomic_path(path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in iter_geojson(counted()):
+            f.write(chunk)
+    print(f"[EXPORT] Land cover GeoJSON {path} ({count} features, {os.path.getsize(path) / 1024:.0f} KB)")
+    return path, count
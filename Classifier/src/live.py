@@ -0,0 +1,232 @@
+# live.py
+# klasyfikacja pojedynczych kafelkow MBTiles na zadanie (podglad pokrycia podczas przesuwania mapy)
+# rownolegle zadania -> jedno model.predict na okno czasowe, wyniki w tile_predictions.sqlite
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from Classifier.src.config import CLASS_NAMES, DEFAULT_CONFIG
+from Classifier.src.overlay import OVERLAY_TILE_SIZE, empty_overlay_tile, encode_palette_png
+from Classifier.src.render import class_palette
+from Classifier.src.utils.mbtiles_pool import mbtiles_identity
+from Classifier.src.utils.tile_cache import cached_tile
+
+# kafelek 256 px -> 4x4 patche jak w analizie (IMG_SIZE 64)
+LIVE_PATCH_SIZE = 64
+LIVE_BATCH_WINDOW = 0.025  # s
+LIVE_MAX_BATCH = 512  # patche na jedno predict
+LIVE_STORE_PATH = os.path.join(os.path.dirname(__file__), "..", "outputs", "tile_predictions.sqlite")
+
+
+def live_model_key(model_path, mbtiles_path):
+    """
+    store / batcher key: model file + MBTiles file, each as path@mtime_ns:size
+    (retrained model saved under the same path or a replaced MBTiles -> new key, old rows never served)
+    """
+    return "|".join(f"{path}@{mtime_ns}:{size}"
+                    for path, mtime_ns, size in (mbtiles_identity(model_path), mbtiles_identity(mbtiles_path)))
+
+
+class TilePredictionStore:
+    """
+    (model, z, x, y) -> class grid + confidence of one MBTiles tile; SQLite, one connection per thread
+    model: live_model_key of the model + MBTiles pair
+    """
+
+    def __init__(self, path=LIVE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tile_predictions ("
+                "model TEXT, z INTEGER, x INTEGER, y INTEGER, grid_size INTEGER, labels BLOB, confidence BLOB, "
+                "PRIMARY KEY (model, z, x, y))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, model, z, x, y):
+        """-> (labels uint8 (n, n), confidence float16 (n, n)) or None"""
+        row = self._conn().execute(
+            "SELECT grid_size, labels, confidence FROM tile_predictions WHERE model=? AND z=? AND x=? AND y=?",
+            (model, z, x, y)
+        ).fetchone()
+        if row is None:
+            return None
+        n, labels, confidence = row
+        return (
+            np.frombuffer(labels, dtype=np.uint8).reshape(n, n),
+            np.frombuffer(confidence, dtype=np.float16).reshape(n, n),
+        )
+
+    def put(self, model, z, x, y, labels, confidence):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tile_predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, z, x, y, labels.shape[0], np.asarray(labels, dtype=np.uint8).tobytes(),
+                 np.asarray(confidence, dtype=np.float16).tobytes())
+            )
+
+
+class PredictionBatcher:
+    """
+    Collects patch batches of concurrent requests for `window` seconds (from the first one)
+    and runs a single model.predict over all of them in a worker thread.
+    """
+
+    def __init__(self, model, window=LIVE_BATCH_WINDOW, max_batch=LIVE_MAX_BATCH):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="live-predict", daemon=True).start()
+
+    def predict(self, arr):
+        """(n, img, img, 3) preprocessed patches -> Future of (n, K) probabilities"""
+        future = Future()
+        self._queue.put((arr, future))
+        return future
+
+    def _collect(self):
+        items = [self._queue.get()]
+        n = len(items[0][0])
+        deadline = time.monotonic() + self.window
+        while n < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            n += len(item[0])
+        return items, n
+
+    def _run(self):
+        while True:
+            items, n = self._collect()
+            try:
+                probs = self.model.predict(np.concatenate([arr for arr, _ in items]), verbose=0)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for arr, future in items:
+                future.set_result(probs[offset:offset + len(arr)])
+                offset += len(arr)
+            print(f"[LIVE] predict: {len(items)} tiles, {n} patches")
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+_store = None
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _batcher(model_path, model_key):
+    # tensorflow dopiero przy pierwszym modelu (store / batcher bez niego)
+    from Classifier.src.pipeline import load_classification_model
+
+    with _batchers_lock:
+        batcher = _batchers.get(model_key)
+        if batcher is None:
+            print(f"[LIVE] Loading model {model_path}")
+            batcher = _batchers[model_key] = PredictionBatcher(load_classification_model(model_path))
+        return batcher
+
+
+def prediction_store():
+    global _store
+    if _store is None:
+        _store = TilePredictionStore()
+    return _store
+
+
+def tile_patches(tile, img_size, patch_size=LIVE_PATCH_SIZE):
+    """BGR tile (256, 256, 3) -> (n*n, img_size, img_size, 3) preprocessed patches, row-major"""
+    from Classifier.src.utils.classifier_utils import preprocess_patch
+
+    n = tile.shape[0] // patch_size
+    return np.concatenate([
+        preprocess_patch(tile[r * patch_size:(r + 1) * patch_size, c * patch_size:(c + 1) * patch_size], img_size)
+        for r in range(n) for c in range(n)
+    ])
+
+
+def _classify_tile(mbtiles_path, model_path, model_key, z, x, y, img_size):
+    data = cached_tile(mbtiles_path, z, x, y)
+    if data is None:
+        return None
+    tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if tile is None:
+        return None
+    if tile.shape[:2] != (OVERLAY_TILE_SIZE, OVERLAY_TILE_SIZE):
+        tile = cv2.resize(tile, (OVERLAY_TILE_SIZE, OVERLAY_TILE_SIZE))
+
+    probs = _batcher(model_path, model_key).predict(tile_patches(tile, img_size)).result()
+    n = OVERLAY_TILE_SIZE // LIVE_PATCH_SIZE
+    labels = np.argmax(probs, axis=1).astype(np.uint8).reshape(n, n)
+    confidence = np.max(probs, axis=1).reshape(n, n)
+    prediction_store().put(model_key, z, x, y, labels, confidence)
+    return labels, confidence
+
+
+def tile_prediction(mbtiles_path, model_path, z, x, y, img_size=DEFAULT_CONFIG["IMG_SIZE"]):
+    """
+    (labels, confidence) grid of one MBTiles tile: from the store, else classified
+    (concurrent requests for the same tile share one classification). None if the tile is missing.
+    """
+    model_key = live_model_key(model_path, mbtiles_path)
+    stored = prediction_store().get(model_key, z, x, y)
+    if stored is not None:
+        return stored
+
+    key = (model_key, z, x, y)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        result = _classify_tile(mbtiles_path, model_path, model_key, z, x, y, img_size)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def live_tile(mbtiles_path, model_path, z, x, y):
+    """PNG bytes of the live classification tile (COLORS palette), transparent if the tile is missing"""
+    prediction = tile_prediction(mbtiles_path, model_path, z, x, y)
+    if prediction is None:
+        return empty_overlay_tile()
+    labels, _ = prediction
+    scale = OVERLAY_TILE_SIZE // labels.shape[0]
+    indices = np.repeat(np.repeat(labels, scale, axis=0), scale, axis=1)
+    # COLORS w BGR -> paleta PNG w RGB
+    palette = np.ascontiguousarray(class_palette(CLASS_NAMES)[:, ::-1]).tobytes()
+    return encode_palette_png(indices, palette)
@@ -0,0 +1,104 @@
+# overlay.py
+# kafelki XYZ (256 px) nakladki klasyfikacji, kolorowane na biezaco z zapisanego label rastra
+# (paleta zamiast RGB, poza analiza przezroczyste)
+
+import io
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from Classifier.src.render import class_palette, labels_path_for_mask, load_analysis_labels, load_label_raster
+from Classifier.src.stats import LABEL_NODATA
+
+OVERLAY_TILE_SIZE = 256
+OVERLAY_TILE_CACHE_SIZE = 1024
+# rastry trzymane w pamieci (duze wojewodztwa ~ setki MB przy rastrze per piksel)
+OVERLAY_RASTER_CACHE_SIZE = 4
+
+
+@lru_cache(maxsize=OVERLAY_RASTER_CACHE_SIZE)
+def _overlay_raster(mask_path, mtime):
+    """
+    (labels, cell_size, palette bytes) of a stored analysis; tile rasters are kept as their tile grid
+    (one cell per tile), per-pixel rasters as-is. mtime only invalidates the cache.
+    """
+    labels_path = labels_path_for_mask(mask_path)
+    if os.path.exists(labels_path):
+        raster = load_label_raster(labels_path)
+        labels, class_names, tile_size = raster["labels"], raster["class_names"], raster["tile_size"]
+        if tile_size:
+            h, w = labels.shape
+            labels = labels[:h - h % tile_size:tile_size, :w - w % tile_size:tile_size]
+        cell_size = tile_size or 1
+    else:
+        labels, class_names = load_analysis_labels(mask_path)
+        cell_size = 1
+
+    # COLORS w BGR -> paleta PNG w RGB
+    palette = np.ascontiguousarray(class_palette(class_names)[:, ::-1]).tobytes()
+    return labels, cell_size, palette
+
+
+def encode_palette_png(indices, palette):
+    """uint8 index array + RGB palette bytes -> PNG bytes (LABEL_NODATA transparent)"""
+    img = Image.fromarray(indices)
+    img.putpalette(palette)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", transparency=LABEL_NODATA, compress_level=1)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=1)
+def empty_overlay_tile():
+    """fully transparent tile (outside the analysis)"""
+    buf = io.BytesIO()
+    Image.new("LA", (OVERLAY_TILE_SIZE, OVERLAY_TILE_SIZE)).save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def _sample_axis(tile, n, scale, origin, cell_size):
+    """
+    raster cell index sampled at the centre of each of the tile's output pixels
+    (scale = analysis pixels per output pixel: > 1 downsamples, < 1 upsamples), -1 outside
+    """
+    px = tile * OVERLAY_TILE_SIZE * scale + (np.arange(OVERLAY_TILE_SIZE) + 0.5) * scale - origin
+    idx = np.floor(px / cell_size).astype(np.int64)
+    idx[(idx < 0) | (idx >= n)] = -1
+    return idx
+
+
+@lru_cache(maxsize=OVERLAY_TILE_CACHE_SIZE)
+def _render_overlay_tile(mask_path, mtime, zoom, origin_px, z, x, y):
+    labels, cell_size, palette = _overlay_raster(mask_path, mtime)
+    # piksele analizy (zoom) na piksel kafelka (z)
+    scale = 2.0 ** (zoom - z)
+    cols = _sample_axis(x, labels.shape[1], scale, origin_px[0], cell_size)
+    rows = _sample_axis(y, labels.shape[0], scale, origin_px[1], cell_size)
+
+    valid_cols, valid_rows = cols >= 0, rows >= 0
+    if not valid_cols.any() or not valid_rows.any():
+        return empty_overlay_tile()
+
+    # mniejsze zoomy: co n-ty piksel (nearest), tylko 256x256 odczytow niezaleznie od zoomu
+    indices = np.full((OVERLAY_TILE_SIZE, OVERLAY_TILE_SIZE), LABEL_NODATA, dtype=np.uint8)
+    indices[np.ix_(valid_rows, valid_cols)] = labels[np.ix_(rows[valid_rows], cols[valid_cols])]
+    if (indices == LABEL_NODATA).all():
+        return empty_overlay_tile()
+    return encode_palette_png(indices, palette)
+
+
+def overlay_tile(mask_path, zoom, origin_px, z, x, y):
+    """
+    PNG bytes of XYZ tile (z, x, y) of the analysis overlay.
+    Args:
+        zoom, origin_px: analysis zoom and global pixel of the label raster's top-left corner
+    Rendered tiles are kept in an LRU (per mask file version).
+    """
+    mtime = os.path.getmtime(mask_path)
+    return _render_overlay_tile(mask_path, mtime, int(zoom), tuple(int(v) for v in origin_px), z, x, y)
+
+
+def overlay_cache_info():
+    return {"tiles": _render_overlay_tile.cache_info()._asdict(), "rasters": _overlay_raster.cache_info()._asdict()}
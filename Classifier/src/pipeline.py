@@ -3,12 +3,14 @@ from Classifier.src.utils.classifier_utils import classify_image_with_mask
 from Classifier.src.smoothing import smooth_predictions
 from Classifier.src.postprocess import save_analysis_outputs
 from Classifier.src.stats import *
-from Classifier.src.config import CLASS_NAMES, COLORS, DEFAULT_CONFIG
+from Classifier.src.render import build_label_raster
+from Classifier.src.config import CLASS_NAMES, DEFAULT_CONFIG
 from Classifier.src.utils.convert import convert_to_float, to_serializable
 from tensorflow.keras.models import load_model
 
 from Classifier.src.config import CLASS_MAPPING
 from Classifier.src.utils.classifier_utils import classify_image_with_interpolation
+from Classifier.src.utils.change_log import empty_change_log, sealake_changes_to_records
 
 def load_classification_model(model_path):
     """Load Keras model"""
@@ -61,14 +63,22 @@ def get_analysis_mode_config(analysis_mode):
         return get_analysis_mode_config("detailed")
 
 
-def run_analysis(image_path, model_path=None, options=None):
+def run_analysis(image_path=None, model_path=None, options=None, image=None):
     """
     main entrypoint for analysis.
     handle classify + stats
+    Args:
+        image_path: input image; with image given only names the outputs (display JPEG)
+        image: already decoded BGR array (no JPEG round trip), image_path may also be an array
     Returns (stats_dict, outputs_dict)
     """
     if options is None:
         options = {}
+    if isinstance(image_path, np.ndarray):
+        image, image_path = image_path, None
+    if image is None and image_path is None:
+        raise ValueError("run_analysis: image_path or image required")
+    source = image if image is not None else image_path
 
     cfg = {**DEFAULT_CONFIG, **options}
     analysis_mode = cfg.get("ANALYSIS_MODE", "detailed")
@@ -105,7 +115,7 @@ def run_analysis(image_path, model_path=None, options=None):
     if use_interpolation:
         print("[INFO] Detailed")
         results = classify_image_with_interpolation(
-            image_path=image_path,
+            image_path=source,
             model=model,
             img_size=cfg["IMG_SIZE"],
             tile_size=tile_size,
@@ -118,11 +128,10 @@ def run_analysis(image_path, model_path=None, options=None):
             class_priorities=class_priorities  # NEW: i to!
         )
         active_class_names = results.get("active_class_names", CLASS_NAMES)
-        active_colors = {cls: COLORS[cls] for cls in active_class_names if cls in COLORS}
     else:
         print("[INFO] Using hierarchical classification")
         results = classify_image_with_mask(
-            image_path=image_path,
+            image_path=source,
             model=model,
             img_size=cfg["IMG_SIZE"],
             tile_size=tile_size,
@@ -135,7 +144,6 @@ def run_analysis(image_path, model_path=None, options=None):
             min_forest_prob=mode_config.get("min_forest_prob", 0.15)
         )
         active_class_names = CLASS_NAMES
-        active_colors = COLORS
 
     pred_grid = results["pred_grid"]
     conf_grid = results["conf_grid"]
@@ -152,7 +160,7 @@ def run_analysis(image_path, model_path=None, options=None):
     global_prob = compute_global_context(results["pred_probs"])
     results["global_prob"] = global_prob
 
-    change_log = []
+    change_log = empty_change_log()
     if cfg.get("APPLY_SMOOTHING", True) and not use_interpolation:
         print(f"[INFO] Applying spatial smoothing")
         valid_mask = pred_grid != -1
@@ -174,70 +182,52 @@ def run_analysis(image_path, model_path=None, options=None):
                          "full_res_class_indices" in results and
                          "full_res_confidence" in results)
 
+    # label raster (uint8 class index) zamiast RGB - statystyki bez mapowania kolorow
     if use_full_res_mask:
-        print("[INFO] full-resolution classification mask")
+        print("[INFO] full-resolution classification labels")
         full_res_indices = results["full_res_class_indices"]
         full_res_confidence = results["full_res_confidence"]
 
-        classification_mask = np.zeros((h, w, 3), dtype=np.uint8)
-        valid_tiles_mask = np.ones((h, w), dtype=np.uint8) * 255  
+        labels = build_label_raster(
+            pred_grid, tile_size, (h, w), active_class_names, full_res_indices=full_res_indices
+        )
+        valid_tiles_mask = np.ones((h, w), dtype=np.uint8) * 255
+
+        print(f"[INFO] Valid pixels: {np.sum(valid_tiles_mask > 0)}")
+        print(f"[INFO] Masked pixels: {np.sum(valid_tiles_mask == 0)}")
 
-        for i, cls_name in enumerate(active_class_names):
-            if cls_name not in active_colors:
-                continue
-            color = active_colors[cls_name]
-            class_pixels = (full_res_indices == i)
-            classification_mask[class_pixels] = color
+        raw_stats = compute_label_stats(
+            labels, active_class_names,
+            valid_mask=valid_tiles_mask,
+            zoom=cfg.get('zoom'),
+            bounds=cfg.get('bounds'),
+            origin_px=cfg.get('origin_px')
+        )
 
         cfg['full_res_indices'] = full_res_indices
         cfg['full_res_confidence'] = full_res_confidence
     else:
-        print("[INFO] tile-based classification mask")
+        # kazdy kafelek = jeden kolor -> statystyki na pred_grid (tile_size^2 mniej pracy)
+        print("[INFO] tile-uniform mask, stats on pred_grid")
         tile_size_actual = h // pred_grid.shape[0] if pred_grid.shape[0] > 0 else tile_size
-        classification_mask = np.zeros((h, w, 3), dtype=np.uint8)
-        valid_tiles_mask = np.zeros((h, w), dtype=np.uint8)
-
-        grid_h, grid_w = pred_grid.shape
         print(f"[DEBUG] pred_grid shape: {pred_grid.shape}, image shape: {h}x{w}, tile_size: {tile_size}")
 
-        for yi in range(grid_h):
-            for xi in range(grid_w):
-                y = yi * tile_size_actual
-                x = xi * tile_size_actual
-                if y + tile_size_actual > h or x + tile_size_actual > w:
-                    continue
-
-                cls = pred_grid[yi, xi]
-                if cls == -1 or cls >= len(active_class_names):
-                    continue
-
-                color = active_colors[active_class_names[cls]]
-                classification_mask[y:y + tile_size_actual, x:x + tile_size_actual] = color
-                valid_tiles_mask[y:y + tile_size_actual, x:x + tile_size_actual] = 255
-
-    print(f"[INFO] Valid pixels: {np.sum(valid_tiles_mask > 0)}")
-    print(f"[INFO] Masked pixels: {np.sum(valid_tiles_mask == 0)}")
-
-    zoom = cfg.get('zoom')
-    bounds = cfg.get('bounds')
-    raw_stats = {
-        "areas_sq_km": compute_class_areas(
-            classification_mask, active_class_names,
-            valid_mask=valid_tiles_mask,
-            zoom=zoom,
-            bounds=bounds
-        ),
-        "areas_pct": compute_class_areas_percentage(
-            classification_mask, active_class_names,
-            valid_mask=valid_tiles_mask
-        ),
-        "density_default": compute_density(classification_mask, active_class_names),
-        "fragmentation_index": compute_fragmentation_index(classification_mask, active_class_names),
-        "adjacency_proportions": compute_boundary_analysis(classification_mask, active_class_names),
-    }
+        labels = build_label_raster(pred_grid, tile_size_actual, (h, w), active_class_names)
+        valid_pixels = int(np.count_nonzero(labels != LABEL_NODATA))
+        print(f"[INFO] Valid pixels: {valid_pixels}")
+        print(f"[INFO] Masked pixels: {h * w - valid_pixels}")
+
+        raw_stats = compute_grid_stats(
+            pred_grid, tile_size_actual, (h, w), active_class_names,
+            zoom=cfg.get('zoom'),
+            bounds=cfg.get('bounds'),
+            origin_px=cfg.get('origin_px')
+        )
+
     stats = convert_to_float(raw_stats)
+    # wspolny raster dla zapisu masek
+    results["labels"] = labels
 
-    cfg['valid_mask_computed'] = valid_tiles_mask
     cfg['analysis_mode'] = analysis_mode
     cfg['tile_size'] = tile_size
     cfg['hierarchical_weight'] = hierarchical_weight
@@ -257,8 +247,8 @@ def run_analysis(image_path, model_path=None, options=None):
         model_path=model_path
     )
 
-    if sealake_changes:
-        outputs['sealake_changes'] = sealake_changes
+    if len(sealake_changes):
+        outputs['sealake_changes'] = sealake_changes_to_records(sealake_changes)
 
     print(f"[INFO] Analysis complete!")
     if use_full_res_mask:
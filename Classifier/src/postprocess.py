@@ -3,100 +3,164 @@ import cv2
 import json
 import numpy as np
 from datetime import datetime
-from Classifier.src.config import CLASS_NAMES, COLORS, DEFAULT_CONFIG
+from Classifier.src.config import CLASS_NAMES, DEFAULT_CONFIG
+from Classifier.src.render import build_label_raster, save_indexed_png, save_label_raster
+from Classifier.src.utils.atomic import atomic_imwrite, atomic_write
+from Classifier.src.utils.change_log import save_change_log
+from Classifier.src.stats import grid_to_labels
+from Classifier.src.writer import ARTIFACTS_PENDING, ARTIFACTS_READY
 from PIL import Image
 from shapely.geometry import shape
 
 
-def draw_wojewodztwo_boundary(image_path, geometry, bounds, zoom, output_path=None, color=(255, 0, 0), thickness=3):
-    img = cv2.imread(image_path)
-    h, w = img.shape[:2]
-    geom = shape(geometry)
-
+def _geometry_rings(geometry):
+    """GeoJSON / shapely geometry -> list of (n, 2) lon/lat exterior rings"""
+    geom = shape(geometry) if isinstance(geometry, dict) else geometry
     if geom.geom_type == 'Polygon':
-        coords_list = [list(geom.exterior.coords)]
+        polygons = [geom]
     elif geom.geom_type == 'MultiPolygon':
-        coords_list = [list(poly.exterior.coords) for poly in geom.geoms]
+        polygons = list(geom.geoms)
     else:
-        return image_path
-    minx, miny, maxx, maxy = bounds
+        return []
+    return [np.asarray(poly.exterior.coords)[:, :2] for poly in polygons]
 
-    def latlon_to_pixel(lon, lat):
-        x_norm = (lon - minx) / (maxx - minx)
-        y_norm = (maxy - lat) / (maxy - miny)
-        px = int(x_norm * w)
-        py = int(y_norm * h)
 
-        return (px, py)
-    for coords in coords_list:
-        pixel_coords = [latlon_to_pixel(lon, lat) for lon, lat in coords]
-        pts = np.array(pixel_coords, dtype=np.int32)
-        cv2.polylines(img, [pts], isClosed=True, color=color, thickness=thickness)
-    if output_path is None:
-        output_path = image_path.replace('.jpg', '_boundary.jpg')
+def project_rings(rings, bounds, frame_size):
+    """lon/lat rings -> pixel coords in a (w, h) frame spanning bounds (same linear mapping as the crop mask)"""
+    minx, miny, maxx, maxy = bounds
+    w, h = frame_size
+    scale = np.array([w / (maxx - minx), -h / (maxy - miny)])
+    origin = np.array([minx, maxy])
+    return [((ring - origin) * scale).astype(np.int32) for ring in rings]
 
-    cv2.imwrite(output_path, img)
-    print(f"[BOUNDARY] Drawn boundary on {output_path}")
 
-    return output_path
+def boundary_crop_offset(geometry, bounds, stitched_size):
+    """
+    crop offset of crop_image_by_mask from the projected vertices
+    (bounding rect of the filled mask, +-1 px where polygons are clipped at the image edge)
+    """
+    rings = project_rings(_geometry_rings(geometry), bounds, stitched_size)
+    if not rings:
+        return 0, 0
+    points = np.concatenate(rings)
+    x0, y0 = points.min(axis=0)
+    return int(max(x0, 0)), int(max(y0, 0))
 
 
-def create_boundary_version(cropped_image_path, geometry, bounds, zoom):
-    try:
-        base, ext = os.path.splitext(cropped_image_path)
-        boundary_path = f"{base}_boundary{ext}"
-        if os.path.exists(boundary_path):
-            return boundary_path
-        boundary_path = draw_wojewodztwo_boundary(
-            image_path=cropped_image_path,
-            geometry=geometry,
-            bounds=bounds,
-            zoom=zoom,
-            output_path=boundary_path,
-            color=(0, 0, 255),  # Red in BGR
-            thickness=4
-        )
+def boundary_overlay_svg(geometry, bounds, image_size, stitched_size=None, color="#ff0000", thickness=4):
+    """
+    Boundary of the region as a transparent SVG overlay for the cropped image.
+    Args:
+        image_size: (w, h) of the cropped image (SVG viewBox)
+        stitched_size: (w, h) of the stitched image the crop was cut from; None -> bounds span the crop
+    Returns: SVG document (str)
+    """
+    w, h = image_size
+    rings = _geometry_rings(geometry)
+    if stitched_size is not None:
+        offset = np.array(boundary_crop_offset(geometry, bounds, stitched_size))
+        rings = [ring - offset for ring in project_rings(rings, bounds, stitched_size)]
+    else:
+        rings = project_rings(rings, bounds, (w, h))
 
-        return boundary_path
+    paths = " ".join(
+        "M" + " L".join(f"{x},{y}" for x, y in ring.tolist()) + " Z" for ring in rings if len(ring)
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">'
+        f'<path d="{paths}" fill="none" stroke="{color}" stroke-width="{thickness}" '
+        f'stroke-linejoin="round" vector-effect="non-scaling-stroke"/></svg>'
+    )
 
-    except Exception as e:
+
+def create_boundary_overlay(cropped_image_path, geometry, bounds, stitched_image_path=None, stitched_size=None):
+    """
+    Cached SVG boundary next to the cropped image, one file per (region, zoom, crop offset)
+    stitched_size: (w, h) of the mosaic the crop was cut from, when its JPEG was not saved
+    Returns: svg path or None
+    """
+    try:
+        with Image.open(cropped_image_path) as header:
+            image_size = header.size
+        if stitched_image_path and os.path.exists(stitched_image_path):
+            with Image.open(stitched_image_path) as header:
+                stitched_size = header.size
+
+        offset = boundary_crop_offset(geometry, bounds, stitched_size) if stitched_size else (0, 0)
+        base, _ = os.path.splitext(cropped_image_path)
+        svg_path = f"{base}_boundary_{offset[0]}_{offset[1]}.svg"
+        if os.path.exists(svg_path):
+            return svg_path
+
+        svg = boundary_overlay_svg(geometry, bounds, image_size, stitched_size)
+        atomic_write(svg_path, svg)
+        print(f"[BOUNDARY] Overlay {svg_path}")
+        return svg_path
+
+    except Exception:
         import traceback
         traceback.print_exc()
-        return cropped_image_path
+        return None
+
+
+def thumbnail_path(image_path):
+    base, _ = os.path.splitext(image_path)
+    return f"{base}_thumb.jpg"
+
+
+# cv2 reduced decode (JPEG skaluje w DCT, bez dekodowania pelnej rozdzielczosci)
+_REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                       (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def _thumbnail_size(size, max_size):
+    w, h = size
+    scale = min(1.0, max_size[0] / w, max_size[1] / h)
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+
+def thumbnail_from_array(image, thumb_path, max_size=(800, 800), quality=80):
+    """
+    In-memory image (BGR, as written with cv2) -> JPEG thumbnail, area downscaling.
+    Returns: thumb_path or None
+    """
+    h, w = image.shape[:2]
+    tw, th = _thumbnail_size((w, h), max_size)
+    thumb = cv2.resize(image, (tw, th), interpolation=cv2.INTER_AREA) if (tw, th) != (w, h) else image
+    if atomic_imwrite(thumb_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, quality]) is None:
+        return None
+
+    print(f"[THUMBNAIL] {os.path.basename(thumb_path)}: {w}x{h} -> {tw}x{th}")
+    return thumb_path
 
 
 def create_thumbnail(image_path, max_size=(800, 800), quality=80):
+    """
+    Thumbnail of an existing image file; decodes at 1/2, 1/4 or 1/8 resolution
+    when that still covers max_size, so large JPEGs are never decoded in full.
+    """
     try:
         if not os.path.exists(image_path):
             print(f"[ERROR] Image path doesn't exist: {image_path}")
             return None
 
-        img = Image.open(image_path)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            if img.mode in ('RGBA', 'LA'):
-                background.paste(img, mask=img.split()[-1])
-            img = background
-
-        original_size = img.size
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        # tylko naglowek
+        with Image.open(image_path) as header:
+            w, h = header.size
+        tw, th = _thumbnail_size((w, h), max_size)
 
-        base, ext = os.path.splitext(image_path)
-        thumb_path = f"{base}_thumb.jpg"
+        flags = cv2.IMREAD_COLOR
+        for factor, reduced in _REDUCED_READ_FLAGS:
+            if w // factor >= tw and h // factor >= th:
+                flags = reduced
+                break
 
-        img.save(thumb_path, 'JPEG', quality=quality, optimize=True)
-
-        original_mb = os.path.getsize(image_path) / (1024 * 1024)
-        thumb_mb = os.path.getsize(thumb_path) / (1024 * 1024)
-        reduction = 100 * (1 - thumb_mb / original_mb)
-
-        print(f"[THUMBNAIL] {os.path.basename(image_path)}")
-        print(f"  Original: {original_size[0]}x{original_size[1]} ({original_mb:.2f}MB)")
-        print(f"  Thumb: {img.size[0]}x{img.size[1]} ({thumb_mb:.2f}MB) - {reduction:.1f}%")
+        img = cv2.imread(image_path, flags)
+        if img is None:
+            print(f"[ERROR] Failed to decode {image_path}")
+            return None
 
-        return thumb_path
+        return thumbnail_from_array(img, thumbnail_path(image_path), max_size=max_size, quality=quality)
 
     except Exception as e:
         import traceback
@@ -108,8 +172,10 @@ def create_thumbnail(image_path, max_size=(800, 800), quality=80):
 
 def save_analysis_outputs(classification_results, stats, change_log, config, image_path, model_path):
     """
-    Generates the final classification mask and saves metadata.
-    + thumbnails dla display
+    Saves the canonical outputs: paletted mask (label raster), labels .npz, change log, stats, metadata.
+    Blended image and thumbnails are only registered (paths) and materialized on request (artifacts.py).
+    config["ASYNC_OUTPUTS"]: nothing is written here, outputs["write_artifacts"] is returned
+    for the background writer (outputs["artifacts_status"] = pending)
     """
     pred_grid = classification_results["pred_grid"]
     conf_grid = classification_results["conf_grid"]
@@ -119,56 +185,26 @@ def save_analysis_outputs(classification_results, stats, change_log, config, ima
 
     # active or uproszczone
     active_class_names = config.get('active_class_names', CLASS_NAMES)
-    active_colors = {cls: COLORS[cls] for cls in active_class_names if cls in COLORS}
 
     full_res_indices = config.get('full_res_indices', None)
     full_res_confidence = config.get('full_res_confidence', None)
-    use_full_res = full_res_indices is not None
 
     APPLY_SMOOTHING = config.get("APPLY_SMOOTHING", DEFAULT_CONFIG["APPLY_SMOOTHING"])
     CONF_THRESH = config.get("CONF_THRESH", DEFAULT_CONFIG["CONF_THRESH"])
     NEIGHBORHOOD = config.get("NEIGHBORHOOD", DEFAULT_CONFIG["NEIGHBORHOOD"])
 
-    image_name = os.path.splitext(os.path.basename(image_path))[0]
+    # analiza z tablicy bez pliku -> nazwa ogolna
+    image_name = os.path.splitext(os.path.basename(image_path))[0] if image_path else "analysis"
 
     h, w, _ = original.shape
 
-    if use_full_res:
-        classification_mask = np.zeros((h, w, 3), dtype=np.uint8)
-        valid_tiles_mask = np.ones((h, w), dtype=np.uint8) * 255
-
-        for i, cls_name in enumerate(active_class_names):
-            if cls_name not in active_colors:
-                continue
-            color = active_colors[cls_name]
-            class_pixels = (full_res_indices == i)
-            classification_mask[class_pixels] = color
-    else:
-        tile_size = h // pred_grid.shape[0] if pred_grid.shape[0] > 0 else 0
-        classification_mask = np.zeros((h, w, 3), dtype=np.uint8)
-        valid_tiles_mask = np.zeros((h, w), dtype=np.uint8)
-
-        grid_h, grid_w = pred_grid.shape
-        print(f"[DEBUG postprocess] pred_grid shape: {pred_grid.shape}, image: {h}x{w}, tile_size: {tile_size}")
-
-        for yi in range(grid_h):
-            for xi in range(grid_w):
-                y = yi * tile_size
-                x = xi * tile_size
-
-                if y + tile_size > h or x + tile_size > w:
-                    continue
-
-                cls = pred_grid[yi, xi]
-                if cls == -1 or cls >= len(active_class_names):
-                    continue
-
-                color = active_colors.get(active_class_names[cls], (128, 128, 128))
-                classification_mask[y:y + tile_size, x:x + tile_size] = color
-                valid_tiles_mask[y:y + tile_size, x:x + tile_size] = 255
-
-    alpha = 0.8
-    blended = cv2.addWeighted(original, alpha, classification_mask, 1 - alpha, 0)
+    # label raster z run_analysis (budowany raz); fallback gdy wywolane bezposrednio
+    labels = classification_results.get("labels")
+    tile_size = h // pred_grid.shape[0] if pred_grid.shape[0] > 0 else 0
+    if labels is None:
+        labels = build_label_raster(
+            pred_grid, tile_size, (h, w), active_class_names, full_res_indices=full_res_indices
+        )
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir_relative = config.get("OUTPUT_BASE_DIR", DEFAULT_CONFIG["OUTPUT_BASE_DIR"])
@@ -177,23 +213,17 @@ def save_analysis_outputs(classification_results, stats, change_log, config, ima
     os.makedirs(base_dir, exist_ok=True)
 
     mask_path = os.path.join(base_dir, f"{image_name}_{timestamp}_mask.png")
-    blended_path = os.path.join(base_dir, f"{image_name}_{timestamp}_blended.png")
-
-    cv2.imwrite(mask_path, classification_mask)
-    cv2.imwrite(blended_path, blended)
-
-    print("[DEBUG] Generating thumbnails")
-    mask_thumb = create_thumbnail(mask_path, max_size=(800, 800), quality=85)
-    blended_thumb = create_thumbnail(blended_path, max_size=(800, 800), quality=85)
+    labels_path = os.path.join(base_dir, f"{image_name}_{timestamp}_labels.npz")
+    # blended/thumbnails: materializowane przy pierwszym zadaniu (artifacts.py)
+    blended_path = analysis_artifact_path(mask_path, "blended")
+    mask_thumb = thumbnail_path(mask_path)
+    blended_thumb = thumbnail_path(blended_path)
+    # poligony klas (GeoJSON) - potrzebna georeferencja obrazu, zapis: artifacts.landcover_artifact
+    landcover_path = analysis_artifact_path(mask_path, "landcover", ".geojson")
 
     metadata_json_path = os.path.join(base_dir, f"{image_name}_{timestamp}_metadata.json")
     stats_json_path = os.path.join(base_dir, f"{image_name}_{timestamp}_stats.json")
-    log_path = os.path.join(base_dir, f"{image_name}_{timestamp}_change_log.json")
-
-    with open(log_path, "w") as f:
-        json.dump(change_log, f, indent=4)
-    with open(stats_json_path, "w") as f:
-        json.dump(stats, f, indent=4)
+    log_path = os.path.join(base_dir, f"{image_name}_{timestamp}_change_log.npz")
 
     metadata = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -213,76 +243,104 @@ def save_analysis_outputs(classification_results, stats, change_log, config, ima
         "active_classes": active_class_names,  # NEW: Add to metadata
         "use_interpolation": config.get('use_interpolation', False),  # NEW
         "use_simplified": config.get('use_simplified', False),  # NEW
+        "zoom": config.get('zoom'),
+        "bounds": config.get('bounds'),
+        # globalny piksel (x, y) lewego gornego rogu analizowanego obrazu (georeferencja eksportow / kafelkow)
+        "origin_px": [int(v) for v in config['origin_px']] if config.get('origin_px') is not None else None,
         "output_files": {
             "mask": mask_path,
             "mask_thumb": mask_thumb,
+            "labels": labels_path,
             "blended": blended_path,
             "blended_thumb": blended_thumb,
+            "landcover": landcover_path,
             "metadata_json": metadata_json_path,
             "stats_json": stats_json_path,
             "change_log": log_path
         }
     }
 
-    with open(metadata_json_path, "w") as f:
-        json.dump(metadata, f, indent=4)
-
-    active_class_names = config.get('active_class_names', CLASS_NAMES)
-    residential_b64 = extract_residential_area(original, classification_mask, active_class_names)
+    def write_artifacts():
+        # maska = 8-bit PNG z paleta (indeksy klas), RGB tylko w pamieci dla blended
+        save_indexed_png(mask_path, labels, active_class_names)
+        if full_res_confidence is not None:
+            # siatka kafelkow obok rastra per piksel (poligony GeoJSON)
+            grid = grid_to_labels(pred_grid, tile_size, (h, w), len(active_class_names)) if tile_size else None
+            save_label_raster(
+                labels_path, labels, full_res_confidence, active_class_names,
+                grid=grid, grid_tile_size=tile_size
+            )
+        else:
+            save_label_raster(labels_path, labels, conf_grid, active_class_names, tile_size=tile_size)
+
+        save_change_log(
+            log_path,
+            change_log,
+            sealake=classification_results.get("sealake_changes"),
+            class_names=CLASS_NAMES
+        )
+        with open(stats_json_path, "w") as f:
+            json.dump(stats, f, indent=4)
+        with open(metadata_json_path, "w") as f:
+            json.dump(metadata, f, indent=4)
 
-    print(f"[INFO] Results saved to {base_dir}")
-    print(f"[INFO] Mask: {mask_path}")
-    print(f"[INFO] Blended: {blended_path}")
-    print(f"[DEBUG] Residential extraction: {'generated' if residential_b64 else 'none'}")
+        print(f"[INFO] Results saved to {base_dir}")
+        print(f"[INFO] Mask: {mask_path}")
 
-    return {
+    outputs = {
         "mask": mask_path,
         "mask_thumb": mask_thumb,
+        "labels": labels_path,
         "blended": blended_path,
         "blended_thumb": blended_thumb,
+        "landcover": landcover_path,
         "metadata_json": metadata_json_path,
         "stats_json": stats_json_path,
-        "change_log": log_path,
-        "valid_mask": valid_tiles_mask,
-        "residential_image": residential_b64  # NEW
+        "change_log": log_path
     }
 
+    # ASYNC_OUTPUTS: zapis zostawiony wywolujacemu (writer.submit_artifacts), sciezki znane od razu
+    if config.get("ASYNC_OUTPUTS", False):
+        outputs["write_artifacts"] = write_artifacts
+        outputs["artifacts_status"] = ARTIFACTS_PENDING
+    else:
+        write_artifacts()
+        outputs["artifacts_status"] = ARTIFACTS_READY
+    return outputs
+
 
-def extract_residential_area(original, classification_mask, class_names):
+def analysis_artifact_path(mask_path, kind, ext=".png"):
+    """{name}_{timestamp}_mask.png -> {name}_{timestamp}_{kind}{ext}"""
+    base, _ = os.path.splitext(mask_path)
+    if base.endswith("_mask"):
+        base = base[:-len("_mask")]
+    return f"{base}_{kind}{ext}"
+
+
+def save_residential_area(original, labels, class_names, output_path):
     """
-    Returns base64 encoded PNG with
+    RGBA PNG of the original image under Residential pixels, cropped to their bounding box.
+    Returns: output_path, or None when there are no residential pixels
     """
-    import base64
-    from Classifier.src.config import COLORS
-
     if "Residential" not in class_names:
         print("[DEBUG] Residential not found in cnames")
         return None
 
-    residential_idx = class_names.index("Residential")
-    residential_color = np.array(COLORS["Residential"])
-
-    print(f"[DEBUG] MATCH: {residential_color}")
-
-    residential_mask = np.all(classification_mask == residential_color, axis=-1)
-
-    residential_pixel_count = np.sum(residential_mask)
-    print(f"[DEBUG] pixel count {residential_pixel_count}")
-
-    if residential_pixel_count == 0:
+    residential_mask = labels == class_names.index("Residential")
+    rows = np.flatnonzero(residential_mask.any(axis=1))
+    if rows.size == 0:
         print("[DEBUG] No pixels")
         return None
+    cols = np.flatnonzero(residential_mask.any(axis=0))
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
 
-    h, w = residential_mask.shape
-    output = np.zeros((h, w, 4), dtype=np.uint8)  # RGBA
-
-    output[residential_mask, :3] = original[residential_mask]
-    output[residential_mask, 3] = 255  # rgba+alpha
+    crop_mask = residential_mask[y0:y1, x0:x1]
+    output = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)  # RGBA
+    output[crop_mask, :3] = original[y0:y1, x0:x1][crop_mask]
+    output[crop_mask, 3] = 255  # rgba+alpha
 
-    print(f"[DEBUG] output: {output.shape}")
-    _, buffer = cv2.imencode('.png', output)
-    img_b64 = base64.b64encode(buffer).decode('utf-8')
-
-    print("[DEBUG] to base64 PNG")
-
-    return f"data:image/png;base64,{img_b64}"
\ No newline at end of file
+    # zapis atomowy - rownolegle zadania widza albo caly plik albo brak
+    if atomic_imwrite(output_path, output) is None:
+        return None
+    print(f"[DEBUG] residential {output.shape} (bbox x={x0}:{x1}, y={y0}:{y1}) -> {output_path}")
+    return output_path
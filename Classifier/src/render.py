@@ -0,0 +1,189 @@
+# render.py
+# label raster (uint8 class index) -> RGB przez jedna tablice palety, budowany raz na analize
+
+import os
+import numpy as np
+from PIL import Image
+from Classifier.src.config import CLASS_NAMES, COLORS
+from Classifier.src.stats import LABEL_NODATA, grid_to_labels, mask_to_labels
+
+
+def class_palette(class_names=CLASS_NAMES, default=(128, 128, 128)):
+    """
+    (256, 3) uint8 lookup table: index i -> COLORS[class_names[i]],
+    LABEL_NODATA and unused indices -> black (masked)
+    """
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    for i, cls in enumerate(class_names):
+        palette[i] = COLORS.get(cls, default)
+    return palette
+
+
+def tile_labels_to_pixels(grid_labels, tile_size, image_shape):
+    """
+    uint8 grid labels -> (h, w) pixel raster, each cell repeated tile_size x tile_size;
+    the strip not covered by full tiles stays LABEL_NODATA
+    """
+    h, w = image_shape[:2]
+    labels = np.full((h, w), LABEL_NODATA, dtype=np.uint8)
+    if tile_size <= 0:
+        return labels
+
+    # tylko kafelki mieszczace sie w obrazie
+    grid_h = min(grid_labels.shape[0], h // tile_size)
+    grid_w = min(grid_labels.shape[1], w // tile_size)
+    block = np.repeat(np.repeat(grid_labels[:grid_h, :grid_w], tile_size, axis=0), tile_size, axis=1)
+    labels[:block.shape[0], :block.shape[1]] = block
+    return labels
+
+
+def build_label_raster(pred_grid, tile_size, image_shape, class_names=CLASS_NAMES, full_res_indices=None):
+    """
+    Class-index raster of the whole analysis (pixel resolution).
+    Args:
+        full_res_indices: interpolated per-pixel classes (takes precedence over pred_grid)
+    """
+    k = len(class_names)
+    if full_res_indices is not None:
+        labels = full_res_indices.astype(np.uint8)
+        labels[(full_res_indices < 0) | (full_res_indices >= k)] = LABEL_NODATA
+        return labels
+
+    grid_labels = grid_to_labels(pred_grid, tile_size, image_shape, k)
+    return tile_labels_to_pixels(grid_labels, tile_size, image_shape)
+
+
+def render_labels(labels, class_names=CLASS_NAMES, palette=None):
+    """label raster -> (h, w, 3) uint8 mask, single palette lookup"""
+    if palette is None:
+        palette = class_palette(class_names)
+    return palette[labels]
+
+
+def save_indexed_png(path, labels, class_names=CLASS_NAMES):
+    """
+    label raster -> 8-bit paletted PNG (COLORS embedded, LABEL_NODATA black as before).
+    Pixel values stay class indices, so the file is both the display mask and the label raster.
+    """
+    # COLORS sa w kolejnosci BGR (cv2), paleta PNG jest RGB
+    palette = np.ascontiguousarray(class_palette(class_names)[:, ::-1])
+    # L + putpalette -> tryb P
+    img = Image.fromarray(np.ascontiguousarray(labels, dtype=np.uint8))
+    img.putpalette(palette.tobytes())
+    # compress_level 3: ~2x mniejszy i ~3x szybszy zapis niz RGB przez cv2
+    img.save(path, format="PNG", compress_level=3)
+    return path
+
+
+def save_label_raster(path, labels, confidence=None, class_names=CLASS_NAMES, tile_size=None,
+                      grid=None, grid_tile_size=None):
+    """
+    Compressed .npz: uint8 labels, float16 confidence (pixel or tile grid), class names, palette
+    Args:
+        tile_size: labels are tile_size x tile_size blocks (confidence is per tile)
+        grid, grid_tile_size: tile grid labels of a per-pixel (interpolated) raster
+    Returns: path
+    """
+    arrays = {
+        "labels": np.asarray(labels, dtype=np.uint8),
+        "class_names": np.array(class_names),
+        "palette": class_palette(class_names),
+    }
+    if confidence is not None:
+        arrays["confidence"] = np.asarray(confidence, dtype=np.float16)
+    if tile_size:
+        arrays["tile_size"] = np.int32(tile_size)
+    if grid is not None and grid_tile_size:
+        arrays["grid"] = np.asarray(grid, dtype=np.uint8)
+        arrays["grid_tile_size"] = np.int32(grid_tile_size)
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_label_raster(path):
+    """
+    .npz written by save_label_raster
+    Returns: dict labels, class_names, confidence (None if not stored), tile_size (None = per pixel),
+        grid, grid_tile_size (None if not stored)
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return {
+            "labels": data["labels"],
+            "class_names": data["class_names"].tolist(),
+            "confidence": data["confidence"] if "confidence" in data.files else None,
+            "tile_size": int(data["tile_size"]) if "tile_size" in data.files else None,
+            "grid": data["grid"] if "grid" in data.files else None,
+            "grid_tile_size": int(data["grid_tile_size"]) if "grid_tile_size" in data.files else None,
+        }
+
+
+def tile_grid_labels(raster):
+    """
+    Tile grid of a loaded label raster -> (grid labels, cell size in pixels).
+    Tile rasters are sampled one pixel per tile; per-pixel rasters without a stored grid -> (labels, 1)
+    """
+    if raster.get("grid") is not None:
+        return raster["grid"], raster["grid_tile_size"]
+    tile_size = raster["tile_size"]
+    labels = raster["labels"]
+    if not tile_size:
+        return labels, 1
+    h, w = labels.shape
+    return labels[:h - h % tile_size:tile_size, :w - w % tile_size:tile_size], tile_size
+
+
+def pixel_confidence(raster):
+    """confidence of a loaded label raster at pixel resolution (tile grid repeated, NaN outside tiles)"""
+    confidence = raster["confidence"]
+    if confidence is None:
+        return None
+    h, w = raster["labels"].shape
+    tile_size = raster["tile_size"]
+    if not tile_size:
+        return confidence.astype(np.float32)
+
+    out = np.full((h, w), np.nan, dtype=np.float32)
+    grid_h = min(confidence.shape[0], h // tile_size)
+    grid_w = min(confidence.shape[1], w // tile_size)
+    block = np.repeat(np.repeat(confidence[:grid_h, :grid_w], tile_size, axis=0), tile_size, axis=1)
+    out[:block.shape[0], :block.shape[1]] = block
+    out[raster["labels"] == LABEL_NODATA] = np.nan
+    return out
+
+
+def load_labels(path, class_names=CLASS_NAMES):
+    """
+    Stored mask -> uint8 label raster.
+    Paletted PNG / .npz are read as-is, legacy RGB masks are mapped back through COLORS.
+    """
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as data:
+            return data["labels"]
+
+    with Image.open(path) as img:
+        if img.mode == "P":
+            return np.asarray(img, dtype=np.uint8)
+        rgb = np.asarray(img.convert("RGB"))
+    # stare maski zapisane przez cv2 (BGR)
+    return mask_to_labels(rgb[..., ::-1], class_names)
+
+
+def labels_path_for_mask(mask_path):
+    """{name}_{timestamp}_mask.png -> {name}_{timestamp}_labels.npz (written next to it)"""
+    base, _ = os.path.splitext(mask_path)
+    if base.endswith("_mask"):
+        base = base[:-len("_mask")]
+    return f"{base}_labels.npz"
+
+
+def load_analysis_labels(mask_path, class_names=CLASS_NAMES):
+    """
+    Label raster of a stored analysis: the .npz next to the mask (with its own class names),
+    else the mask itself (paletted or legacy RGB) with class_names.
+    Returns: (labels, class_names)
+    """
+    labels_path = labels_path_for_mask(mask_path)
+    if os.path.exists(labels_path):
+        with np.load(labels_path, allow_pickle=False) as data:
+            return data["labels"], data["class_names"].tolist()
+    return load_labels(mask_path, class_names), list(class_names)
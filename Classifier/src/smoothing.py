@@ -1,58 +1,98 @@
 # smoothing.py
 
 import numpy as np
+from scipy import ndimage as ndi
 from Classifier.src.config import CLASS_NAMES, CLASS_PRIORITY
+from Classifier.src.utils.change_log import CHANGE_LOG_DTYPE, SEALAKE_CHANGE_DTYPE
 
 
 def smooth_predictions(pred_grid, conf_grid, global_prob, confidence_thresh, neighborhood,
                        class_priority=CLASS_PRIORITY, valid_mask=None):
-    smoothed = pred_grid.copy()
+    """
+    Low-confidence tiles -> majority class of the neighborhood window (if it scores higher).
+    Returns:
+        (smoothed, change_log) - change_log as CHANGE_LOG_DTYPE array
+    """
     h, w = pred_grid.shape
     r = neighborhood // 2
-    change_log = []
 
     # +valid mask if need
     if valid_mask is None:
         valid_mask = pred_grid != -1
 
-    for y in range(h):
-        for x in range(w):
-            if not valid_mask[y, x] or pred_grid[y, x] == -1:
-                continue
-
-            cls = pred_grid[y, x]
-            conf = conf_grid[y, x]
-            if conf >= confidence_thresh:
-                continue
-
-            y1, y2 = max(0, y - r), min(h, y + r + 1)
-            x1, x2 = max(0, x - r), min(w, x + r + 1)
-            window = pred_grid[y1:y2, x1:x2].flatten()
-            if window.size == 0:
-                continue
-            valid_window = window[window >= 0]  # only non-negative class indices
-
-            # +1 valid sasiad minimum
-            if valid_window.size == 0:
-                continue
-
-            majority_class = np.bincount(valid_window).argmax()
-
-            cls_name = CLASS_NAMES[cls]
-            neigh_name = CLASS_NAMES[majority_class]
-            local_score = conf * global_prob[cls] * class_priority.get(cls_name, 1.0)
-            neigh_score = global_prob[majority_class] * class_priority.get(neigh_name, 1.0)
-
-            if neigh_score > local_score:
-                smoothed[y, x] = majority_class
-                change_log.append({
-                    "tile": (y, x),
-                    "from": cls_name,
-                    "to": neigh_name,
-                    "confidence": float(conf),
-                    "local_score": float(local_score),
-                    "neigh_score": float(neigh_score)
-                })
+    candidates = valid_mask & (pred_grid != -1) & (conf_grid < confidence_thresh)
+    ys, xs = np.nonzero(candidates)
+    if len(ys) == 0:
+        print("[SMOOTHING] Changed 0 tiles")
+        return pred_grid.copy(), np.empty(0, dtype=CHANGE_LOG_DTYPE)
+
+    # liczniki klas w oknie (przyciete na brzegach, -1 pomijane)
+    num_classes = len(CLASS_NAMES)
+    kernel = np.ones((2 * r + 1, 2 * r + 1), dtype=np.int32)
+    counts = np.empty((num_classes, len(ys)), dtype=np.int32)
+    for k in range(num_classes):
+        plane = (pred_grid == k).astype(np.int32)
+        counts[k] = ndi.correlate(plane, kernel, mode="constant", cval=0)[ys, xs]
+    # argmax -> najmniejszy indeks przy remisie, jak bincount().argmax()
+    majority = counts.argmax(axis=0)
+
+    priorities = np.array([class_priority.get(name, 1.0) for name in CLASS_NAMES])
+    cls = pred_grid[ys, xs]
+    conf = conf_grid[ys, xs]
+    local_score = conf * global_prob[cls] * priorities[cls]
+    neigh_score = global_prob[majority] * priorities[majority]
+
+    changed = neigh_score > local_score
+    change_log = np.empty(int(changed.sum()), dtype=CHANGE_LOG_DTYPE)
+    change_log["y"] = ys[changed]
+    change_log["x"] = xs[changed]
+    change_log["from"] = cls[changed]
+    change_log["to"] = majority[changed]
+    change_log["confidence"] = conf[changed]
+    change_log["local_score"] = local_score[changed]
+    change_log["neigh_score"] = neigh_score[changed]
+
+    smoothed = pred_grid.copy()
+    smoothed[change_log["y"], change_log["x"]] = change_log["to"]
 
     print(f"[SMOOTHING] Changed {len(change_log)} tiles")
-    return smoothed, change_log
\ No newline at end of file
+    return smoothed, change_log
+
+
+# 8-sasiedztwo bez srodka
+_NEIGHBOR_KERNEL = np.array([[1, 1, 1],
+                             [1, 0, 1],
+                             [1, 1, 1]], dtype=np.int16)
+
+
+def fix_isolated_sealake(pred_grid, conf_grid, raw_probs, class_names,
+                         isolation_threshold=2, min_forest_prob=0.15):
+    """
+    SeaLake tiles with <= isolation_threshold SeaLake neighbours (3x3) -> Forest,
+    if forest prob >= min_forest_prob. One convolution over the grid, no per-tile loop.
+    Returns:
+        (smoothed, changes) - changes as SEALAKE_CHANGE_DTYPE array,
+        dict list only via sealake_changes_to_records
+    """
+    sealake_idx = class_names.index("SeaLake")
+    forest_idx = class_names.index("Forest")
+
+    sealake = pred_grid == sealake_idx
+    # poza gridem = brak sasiada (jak przyciete okno)
+    neighbors = ndi.correlate(sealake.astype(np.int16), _NEIGHBOR_KERNEL, mode="constant", cval=0)
+    forest_prob = raw_probs[..., forest_idx]
+
+    to_fix = sealake & (neighbors <= isolation_threshold) & (forest_prob >= min_forest_prob)
+    ys, xs = np.nonzero(to_fix)
+
+    smoothed = pred_grid.copy()
+    smoothed[ys, xs] = forest_idx
+
+    changes = np.empty(len(ys), dtype=SEALAKE_CHANGE_DTYPE)
+    changes["y"] = ys
+    changes["x"] = xs
+    changes["sealake_neighbors"] = neighbors[ys, xs]
+    changes["forest_prob"] = forest_prob[ys, xs]
+    changes["sealake_confidence"] = conf_grid[ys, xs]
+
+    return smoothed, changes
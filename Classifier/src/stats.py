@@ -1,8 +1,14 @@
 import numpy as np
 import cv2
-from scipy import ndimage as ndi
 from Classifier.src.config import COLORS
+from Classifier.src.landscape import compute_landscape_metrics
 import math
+from functools import lru_cache
+from Classifier.src.utils.mbtiles_extract import lonlat_to_pixel
+
+# label raster: uint8 class index, 255 = brak klasy (maska / poza kafelkami)
+LABEL_NODATA = 255
+
 
 def meters_per_pixel_at_zoom(lat, zoom):
     """
@@ -18,126 +24,288 @@ def meters_per_pixel_at_zoom(lat, zoom):
     return meters_per_pixel
 
 
-def compute_class_areas(classification_mask, class_names, valid_mask=None, zoom=None, bounds=None):
-    """
-    Args:
-        classification_mask, class_names: List of class names
-        valid_mask: (255=valid, 0=masked) poza maska usuwa
-        zoom, bounds: [minx, miny, maxx, maxy] bounding box
-
-    Returns:
-        Dict of {class_name: area_km2}
-    """
-    h, w, _ = classification_mask.shape
-
+def pixel_area_km2(zoom=None, bounds=None):
+    """area of one pixel at bbox center lat"""
     if zoom is not None and bounds is not None:
         # center of lat
         center_lat = (bounds[1] + bounds[3]) / 2
         meters_per_pixel = meters_per_pixel_at_zoom(center_lat, zoom)
         pixel_area_m2 = meters_per_pixel ** 2
-        pixel_area_km2 = pixel_area_m2 / 1_000_000
+        return pixel_area_m2 / 1_000_000
+
+    # 10m/pixel
+    print("[WARN] No zoom/bounds provided, using rough estimate for pixel size")
+    return (10 ** 2) / 1_000_000
+
+
+@lru_cache(maxsize=32)
+def _mercator_row_areas_km2(zoom, top_row, n_rows, tile_size=256):
+    """km2 per pixel for global pixel rows [top_row, top_row + n_rows) at zoom (Web Mercator)"""
+    world_px = tile_size * 2 ** zoom
+    # srodek piksela -> lat
+    y = top_row + np.arange(n_rows) + 0.5
+    lat = np.arctan(np.sinh(np.pi * (1 - 2 * y / world_px)))
+    meters_per_pixel = 40075017 / world_px * np.cos(lat)
+    areas = meters_per_pixel ** 2 / 1_000_000
+    areas.flags.writeable = False
+    return areas
+
+
+def pixel_row_areas_km2(zoom, bounds, n_rows, row_offset=0, origin_px=None):
+    """
+    Per-row pixel area of an image at zoom whose top-left corner is global pixel origin_px
+    (None -> top edge at bounds' north, i.e. an exact bbox crop). row_offset: first image row, for strips.
+    Cached per (zoom, top row, n_rows), shared across analyses of the same extent.
+    Returns None when zoom/bounds missing.
+    """
+    if zoom is None or bounds is None:
+        return None
+    if origin_px is not None:
+        y_top = origin_px[1]
     else:
-        # 10m/pixel
-        pixel_area_km2 = (10 ** 2) / 1_000_000
-        print("[WARN] No zoom/bounds provided, using rough estimate for pixel size")
+        _, y_top = lonlat_to_pixel(bounds[0], bounds[3], zoom)
+    return _mercator_row_areas_km2(int(zoom), int(y_top) + int(row_offset), int(n_rows))
 
-    areas = {}
-    for i, cls in enumerate(class_names):
-        color = np.array(list(COLORS[cls]))
-        mask = np.all(classification_mask == color, axis=-1)
-        if valid_mask is not None:
-            mask = mask & (valid_mask > 0)
 
-        n_pixels = np.sum(mask)
-        areas[cls] = n_pixels * pixel_area_km2
+def mask_to_labels(classification_mask, class_names):
+    """RGB mask -> uint8 class index raster (LABEL_NODATA = color not in class_names)"""
+    colors = np.array([COLORS[c] for c in class_names], dtype=np.uint32)
+    codes = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+    order = np.argsort(codes)
+    sorted_codes = codes[order]
 
-    return areas
+    m = classification_mask.astype(np.uint32)
+    pixel_codes = (m[..., 0] << 16) | (m[..., 1] << 8) | m[..., 2]
 
+    pos = np.searchsorted(sorted_codes, pixel_codes)
+    pos = np.minimum(pos, len(sorted_codes) - 1)
+    labels = order[pos].astype(np.uint8)
+    labels[sorted_codes[pos] != pixel_codes] = LABEL_NODATA
+    return labels
 
-def compute_class_areas_percentage(classification_mask, class_names, valid_mask=None):
-    """Returns area per class in % of whole image."""
 
+def class_row_counts(labels, num_classes, valid_mask=None):
+    """
+    One bincount over the label raster, per row.
+    Returns:
+        (counts_all, row_counts_valid (h, K), total_valid) - counts_all ignores valid_mask
+    """
+    h = labels.shape[0]
+    codes = labels.astype(np.uint32)
     if valid_mask is not None:
-        total_valid_pixels = np.sum(valid_mask > 0)
+        codes |= (valid_mask > 0).astype(np.uint32) << 8
     else:
-        total_valid_pixels = classification_mask.shape[0] * classification_mask.shape[1]
+        codes |= 1 << 8
+    # [0,256) -> poza valid_mask, [256,512) -> valid; + 512 * wiersz
+    codes += (np.arange(h, dtype=np.uint32) * 512)[:, None]
+    bins = np.bincount(codes.ravel(), minlength=h * 512).reshape(h, 512)
+
+    row_counts_valid = bins[:, 256:256 + num_classes]
+    counts_all = bins[:, :num_classes].sum(axis=0) + row_counts_valid.sum(axis=0)
+    total_valid = int(bins[:, 256:].sum())
+    return counts_all, row_counts_valid, total_valid
+
+
+def class_pixel_counts(labels, num_classes, valid_mask=None):
+    """
+    Returns:
+        (counts_all, counts_valid, total_valid) - counts_all ignores valid_mask
+    """
+    counts_all, row_counts_valid, total_valid = class_row_counts(labels, num_classes, valid_mask)
+    return counts_all, row_counts_valid.sum(axis=0), total_valid
+
+
+def areas_from_counts(counts, class_names, pixel_area):
+    return {cls: counts[i] * pixel_area for i, cls in enumerate(class_names)}
 
+
+def areas_from_row_counts(row_counts, class_names, row_areas):
+    """row_areas (h,) km2 per pixel of each row -> weighted sum per class"""
+    areas = row_areas @ row_counts
+    return {cls: areas[i] for i, cls in enumerate(class_names)}
+
+
+def percentages_from_counts(counts, class_names, total_valid_pixels):
     if total_valid_pixels == 0:
         return {cls: 0.0 for cls in class_names}
+    return {cls: (counts[i] / total_valid_pixels) * 100 for i, cls in enumerate(class_names)}
+
+
+def density_from_counts(counts, class_names, total_pixels, target_classes=None):
+    """density = (sum of target_class pixels / total pixels)"""
+    if target_classes is None:
+        target_classes = ["Residential", "Industrial"]
+    target_sum = sum(counts[class_names.index(cls)] for cls in target_classes if cls in class_names)
+    return target_sum / total_pixels
+
+
+def compute_fragmentation_from_labels(labels, class_names):
+    """patches / area per class (one connected-components pass for all classes)"""
+    return compute_landscape_metrics(labels, class_names)["fragmentation_index"]
+
 
-    perc = {}
-    for cls in class_names:
-        color = np.array(list(COLORS[cls]))
-        class_pixels = np.all(classification_mask == color, axis=-1)
+def _pair_counts(a, b, k, weights=None):
+    """KxK counts of neighbour pairs a-b with different, valid classes"""
+    diff = (a != b) & (a < k) & (b < k)
+    codes = a[diff].astype(np.int64) * k + b[diff]
+    if weights is not None:
+        weights = np.broadcast_to(weights, a.shape)[diff]
+    return np.bincount(codes, weights=weights, minlength=k * k).reshape(k, k)
 
-        if valid_mask is not None:
-            class_pixels = class_pixels & (valid_mask > 0)
 
-        perc[cls] = (np.sum(class_pixels) / total_valid_pixels) * 100
+def adjacency_from_pairs(pairs, class_names):
+    """symmetric pair counts -> proportions dict"""
+    pairs = pairs + pairs.T
 
-    return perc
+    # ++ adjacency by total granic
+    total = pairs.sum()
+    adjacency = {}
+    for i, c in enumerate(class_names):
+        adjacency[c] = {c2: pairs[i, j] / total if total > 0 else 0 for j, c2 in enumerate(class_names)}
+
+    return adjacency
+
+
+def compute_adjacency_from_labels(labels, class_names):
+    """Returns adjacency proportions between classes (label raster)."""
+    k = len(class_names)
+
+    # pary (y,x)-(y,x+1) i (y,x)-(y+1,x) dla y < h-1, x < w-1 (bez ostatniego wiersza/kolumny)
+    base = labels[:-1, :-1]
+    pairs = _pair_counts(base, labels[:-1, 1:], k) + _pair_counts(base, labels[1:, :-1], k)
+    return adjacency_from_pairs(pairs, class_names)
+
+
+def compute_label_stats(labels, class_names, valid_mask=None, zoom=None, bounds=None, origin_px=None):
+    """
+    All stats from a uint8 class-index raster (LABEL_NODATA = no class), counts from one bincount.
+    Returns raw stats dict (areas_sq_km, areas_pct, density_default, fragmentation_index,
+    adjacency_proportions, landscape_metrics)
+    """
+    h, w = labels.shape
+    counts_all, row_counts_valid, total_valid = class_row_counts(labels, len(class_names), valid_mask)
+    counts_valid = row_counts_valid.sum(axis=0)
+    pixel_area = pixel_area_km2(zoom, bounds)
+    row_areas = pixel_row_areas_km2(zoom, bounds, h, origin_px=origin_px)
+    landscape = compute_landscape_metrics(labels, class_names, pixel_area=pixel_area)
+
+    return {
+        "areas_sq_km": areas_from_row_counts(row_counts_valid, class_names, row_areas)
+        if row_areas is not None else areas_from_counts(counts_valid, class_names, pixel_area),
+        "areas_pct": percentages_from_counts(counts_valid, class_names, total_valid),
+        "density_default": density_from_counts(counts_all, class_names, h * w),
+        "fragmentation_index": landscape.pop("fragmentation_index"),
+        "adjacency_proportions": compute_adjacency_from_labels(labels, class_names),
+        "landscape_metrics": landscape,
+    }
+
+
+def grid_to_labels(pred_grid, tile_size, image_shape, num_classes):
+    """
+    pred_grid -> uint8 grid labels, tiles painted in the pixel raster only
+    (LABEL_NODATA for -1, unknown class and partial edge tiles that don't fit)
+    """
+    h, w = image_shape[:2]
+    grid_h, grid_w = pred_grid.shape
+    fits_y = (np.arange(grid_h) + 1) * tile_size <= h
+    fits_x = (np.arange(grid_w) + 1) * tile_size <= w
+
+    valid = (pred_grid >= 0) & (pred_grid < num_classes) & fits_y[:, None] & fits_x[None, :]
+    grid_labels = np.full(pred_grid.shape, LABEL_NODATA, dtype=np.uint8)
+    grid_labels[valid] = pred_grid[valid]
+    return grid_labels
+
+
+def compute_grid_stats(pred_grid, tile_size, image_shape, class_names, zoom=None, bounds=None, origin_px=None):
+    """
+    Same stats as compute_label_stats on the tile-uniform pixel raster, computed on pred_grid
+    (each tile = tile_size x tile_size pixels of one class, partial edge tiles skipped).
+    """
+    h, w = image_shape[:2]
+    k = len(class_names)
+    grid_labels = grid_to_labels(pred_grid, tile_size, image_shape, k)
+    grid_h, grid_w = grid_labels.shape
+
+    tile_pixels = tile_size * tile_size
+    counts, row_counts, valid_tiles = class_row_counts(grid_labels, k, grid_labels != LABEL_NODATA)
+    counts = counts * tile_pixels
+    total_valid = valid_tiles * tile_pixels
+
+    # pary pikseli przez granice kafelkow: tile_size na wiersz/kolumne,
+    # -1 gdy kafelek konczy sie na ostatnim wierszu/kolumnie obrazu (jak y < h-1, x < w-1)
+    row_weights = tile_size - ((np.arange(grid_h) + 1) * tile_size == h)
+    col_weights = tile_size - ((np.arange(grid_w) + 1) * tile_size == w)
+    pairs = (_pair_counts(grid_labels[:, :-1], grid_labels[:, 1:], k, row_weights[:, None]) +
+             _pair_counts(grid_labels[:-1, :], grid_labels[1:, :], k, col_weights[None, :]))
+
+    pixel_area = pixel_area_km2(zoom, bounds)
+    row_areas = pixel_row_areas_km2(zoom, bounds, grid_h * tile_size, origin_px=origin_px)
+    if row_areas is not None:
+        # kafelek = tile_size wierszy x tile_size kolumn
+        tile_row_areas = row_areas.reshape(grid_h, tile_size).sum(axis=1) * tile_size
+        areas = areas_from_row_counts(row_counts, class_names, tile_row_areas)
+    else:
+        areas = areas_from_counts(counts, class_names, pixel_area)
+    # 4-sasiedztwo na gridzie == 4-sasiedztwo pikseli dla pelnych kafelkow
+    landscape = compute_landscape_metrics(grid_labels, class_names, cell_size=tile_size, pixel_area=pixel_area)
+
+    return {
+        "areas_sq_km": areas,
+        "areas_pct": percentages_from_counts(counts, class_names, total_valid),
+        "density_default": density_from_counts(counts, class_names, h * w),
+        "fragmentation_index": landscape.pop("fragmentation_index"),
+        "adjacency_proportions": adjacency_from_pairs(pairs, class_names),
+        "landscape_metrics": landscape,
+    }
+
+
+def compute_class_areas(classification_mask, class_names, valid_mask=None, zoom=None, bounds=None,
+                        origin_px=None):
+    """
+    Args:
+        classification_mask, class_names: List of class names
+        valid_mask: (255=valid, 0=masked) poza maska usuwa
+        zoom, bounds: [minx, miny, maxx, maxy] bounding box
+        origin_px: global pixel of the image's top-left (None -> bounds' north-west)
+
+    Returns:
+        Dict of {class_name: area_km2}
+    """
+    labels = mask_to_labels(classification_mask, class_names)
+    _, row_counts_valid, _ = class_row_counts(labels, len(class_names), valid_mask)
+    row_areas = pixel_row_areas_km2(zoom, bounds, labels.shape[0], origin_px=origin_px)
+    if row_areas is None:
+        return areas_from_counts(row_counts_valid.sum(axis=0), class_names, pixel_area_km2(zoom, bounds))
+    return areas_from_row_counts(row_counts_valid, class_names, row_areas)
+
+
+def compute_class_areas_percentage(classification_mask, class_names, valid_mask=None):
+    """Returns area per class in % of whole image."""
+    labels = mask_to_labels(classification_mask, class_names)
+    _, counts_valid, total_valid = class_pixel_counts(labels, len(class_names), valid_mask)
+    return percentages_from_counts(counts_valid, class_names, total_valid)
 
 
 def compute_density(classification_mask, class_names, target_classes=None):
     """Example: density = (sum of target_class pixels / total pixels)."""
     if target_classes is None:
         target_classes = ["Residential", "Industrial"]
+    # target klasy moga byc spoza class_names (uproszczone)
+    names = list(dict.fromkeys(list(class_names) + list(target_classes)))
+    labels = mask_to_labels(classification_mask, names)
+    counts_all, _, _ = class_pixel_counts(labels, len(names))
     total_pixels = classification_mask.shape[0] * classification_mask.shape[1]
-    mask_sum = np.zeros(classification_mask.shape[:2], dtype=bool)
-    for cls in target_classes:
-        color = np.array(list(COLORS[cls]))
-        mask_sum |= np.all(classification_mask == color, axis=-1)
-    density = np.sum(mask_sum) / total_pixels
-    return density
+    return density_from_counts(counts_all, names, total_pixels, target_classes)
 
 
 def compute_fragmentation_index(classification_mask, class_names):
-    frag = {}
-    print("\n[FRAGMENTATION DEBUG]")
-    for cls in class_names:
-        color = np.array(list(COLORS[cls]))
-        mask = np.all(classification_mask == color, axis=-1)
-        labeled, num_features = ndi.label(mask)
-        area = np.sum(mask)
-        frag_value = num_features / area if area > 0 else 0
-
-        print(f"{cls:20s}: {num_features:4d} patches, {area:8d} pixels → {frag_value:.8f}")
-        frag[cls] = frag_value
-    #     AnnualCrop : 6 patches, 24576 pixels → 0.00024414
-    #     Forest : 10 patches, 65536 pixels → 0.00015259
-    return frag
+    labels = mask_to_labels(classification_mask, class_names)
+    return compute_fragmentation_from_labels(labels, class_names)
 
 
 def compute_boundary_analysis(classification_mask, class_names):
     """Returns adjacency proportions between classes."""
-    h, w, _ = classification_mask.shape
-    adjacency = {cls: {cls2: 0 for cls2 in class_names} for cls in class_names}
-
-    mask_idx = np.zeros((h, w), dtype=int)
-    color_to_idx = {tuple(v): i for i, v in enumerate([COLORS[c] for c in class_names])}
-
-    for y in range(h):
-        for x in range(w):
-            color = tuple(classification_mask[y, x])
-            mask_idx[y, x] = color_to_idx.get(color, -1)
-    for y in range(h - 1):
-        for x in range(w - 1):
-            c1, c2 = mask_idx[y, x], mask_idx[y, x + 1]
-            c3, c4 = mask_idx[y, x], mask_idx[y + 1, x]
-            if c1 != c2 and c1 >= 0 and c2 >= 0:
-                adjacency[class_names[c1]][class_names[c2]] += 1
-                adjacency[class_names[c2]][class_names[c1]] += 1
-            if c3 != c4 and c3 >= 0 and c4 >= 0:
-                adjacency[class_names[c3]][class_names[c4]] += 1
-                adjacency[class_names[c4]][class_names[c3]] += 1
-
-    # ++ adjacency by total granic
-    total = sum(sum(v.values()) for v in adjacency.values())
-    for c in adjacency:
-        for c2 in adjacency[c]:
-            adjacency[c][c2] = adjacency[c][c2] / total if total > 0 else 0
-
-    return adjacency
+    return compute_adjacency_from_labels(mask_to_labels(classification_mask, class_names), class_names)
 
 
 def normalize_stats(stats: dict):
@@ -153,6 +321,7 @@ def normalize_stats(stats: dict):
     fragmentation = stats.get("fragmentation_index", {})
     adjacency = stats.get("adjacency_proportions", {})
     density = stats.get("density_default", 0)
+    landscape = stats.get("landscape_metrics", {})
 
     # upd cleaned up
     clean = {
@@ -164,6 +333,13 @@ def normalize_stats(stats: dict):
             for c1, c2dict in adjacency.items()
         } if adjacency else {},
         "density": round(density, 4) if isinstance(density, (int, float)) else 0,
+        "landscape": {
+            "patch_sizes": {
+                c: round_values(v) for c, v in landscape.get("patch_sizes", {}).items()
+            },
+            "largest_patch_index": round_values(landscape.get("largest_patch_index", {})),
+            "edge_density": round_values(landscape.get("edge_density", {})),
+        } if landscape else {},
     }
 
     return clean
\ No newline at end of file
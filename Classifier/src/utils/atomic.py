@@ -0,0 +1,52 @@
+# atomic.py
+# zapis atomowy plikow wynikowych: tmp obok celu + os.replace
+# rownolegle zadania / workery widza albo caly plik albo brak
+
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+
+
+def atomic_tmp_path(path):
+    """per process/thread tmp name next to path, same extension (cv2 / rasterio pick the format from it)"""
+    base, ext = os.path.splitext(path)
+    return f"{base}.{os.getpid()}_{threading.get_ident()}.tmp{ext}"
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    yields a tmp path to write to; renamed onto path when the block exits normally and wrote it,
+    removed when it raises (path left untouched)
+    """
+    tmp_path = atomic_tmp_path(path)
+    try:
+        yield tmp_path
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write(path, data):
+    """bytes / str -> path"""
+    mode = "wb" if isinstance(data, (bytes, bytearray, memoryview)) else "w"
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            f.write(data)
+    return path
+
+
+def atomic_imwrite(path, image, params=None):
+    """cv2.imwrite through a tmp file; None (path untouched) when encoding fails"""
+    with atomic_path(path) as tmp_path:
+        if not cv2.imwrite(tmp_path, image, params or []):
+            print(f"[ERROR] Failed to write {path}")
+            # niepelny tmp nie trafia pod path
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+    return path
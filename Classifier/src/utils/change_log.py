@@ -0,0 +1,90 @@
+import json
+import numpy as np
+from Classifier.src.config import CLASS_NAMES
+
+# kolumnowy log zmian (smoothing), jeden rekord = jeden zmieniony tile
+CHANGE_LOG_DTYPE = np.dtype([
+    ("y", np.int32),
+    ("x", np.int32),
+    ("from", np.int16),
+    ("to", np.int16),
+    ("confidence", np.float32),
+    ("local_score", np.float32),
+    ("neigh_score", np.float32),
+])
+
+SEALAKE_CHANGE_DTYPE = np.dtype([
+    ("y", np.int32),
+    ("x", np.int32),
+    ("sealake_neighbors", np.uint8),
+    ("forest_prob", np.float32),
+    ("sealake_confidence", np.float32),
+])
+
+
+def empty_change_log():
+    return np.empty(0, dtype=CHANGE_LOG_DTYPE)
+
+
+def save_change_log(path, smoothing, sealake=None, class_names=CLASS_NAMES):
+    """
+    Saves change logs as compressed .npz (smoothing + sealake arrays, class names)
+    Returns: path
+    """
+    arrays = {
+        "smoothing": smoothing if smoothing is not None else empty_change_log(),
+        "class_names": np.array(class_names),
+    }
+    if sealake is not None:
+        arrays["sealake"] = sealake
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_change_log(path):
+    """
+    Returns dict: {"smoothing": arr, "sealake": arr|None, "class_names": list}
+    Legacy .json logs (list of dicts) are returned as-is under "smoothing".
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            return {"smoothing": json.load(f), "sealake": None, "class_names": CLASS_NAMES}
+
+    with np.load(path, allow_pickle=False) as data:
+        return {
+            "smoothing": data["smoothing"],
+            "sealake": data["sealake"] if "sealake" in data.files else None,
+            "class_names": data["class_names"].tolist(),
+        }
+
+
+def change_log_to_records(changes, class_names=CLASS_NAMES):
+    """compact array -> list of dicts (old JSON format)"""
+    if isinstance(changes, list):
+        return changes
+    return [
+        {
+            "tile": (int(c["y"]), int(c["x"])),
+            "from": class_names[c["from"]],
+            "to": class_names[c["to"]],
+            "confidence": float(c["confidence"]),
+            "local_score": float(c["local_score"]),
+            "neigh_score": float(c["neigh_score"])
+        }
+        for c in changes
+    ]
+
+
+def sealake_changes_to_records(changes):
+    """compact array -> list of dicts (JSON log)"""
+    if isinstance(changes, list):
+        return changes
+    return [
+        {
+            "position": (int(c["y"]), int(c["x"])),
+            "sealake_neighbors": int(c["sealake_neighbors"]),
+            "forest_prob": float(c["forest_prob"]),
+            "sealake_confidence": float(c["sealake_confidence"])
+        }
+        for c in changes
+    ]
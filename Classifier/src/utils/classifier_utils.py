@@ -5,6 +5,9 @@ import numpy as np
 from keras.src.applications.mobilenet_v2 import preprocess_input
 from tensorflow.keras.preprocessing.image import img_to_array
 from Classifier.src.utils.interpolation import apply_interpolation, simplify_predictions
+from Classifier.src.utils.change_log import SEALAKE_CHANGE_DTYPE
+# korekta SeaLake na siatce kafelkow (bez tensorflow) - w smoothing, tu dla dotychczasowych importow
+from Classifier.src.smoothing import fix_isolated_sealake
 
 def pad_incomplete_patch(patch, target_size, method='reflect'):
     """
@@ -160,44 +163,15 @@ def get_coarse_context_at_position(coarse_grid, coarse_probs, y, x, fine_tile_si
     return coarse_grid[coarse_y, coarse_x], coarse_probs[coarse_y, coarse_x]
 
 
-def fix_isolated_sealake(pred_grid, conf_grid, raw_probs, class_names,
-                         isolation_threshold=2, min_forest_prob=0.15):
-    sealake_idx = class_names.index("SeaLake")
-    forest_idx = class_names.index("Forest")
-    smoothed = pred_grid.copy()
-    h, w = pred_grid.shape
-    changes = []
-
-    for y in range(h):
-        for x in range(w):
-            current_class = pred_grid[y, x]
-
-            if current_class == -1:
-                continue
-
-            if current_class != sealake_idx:
-                continue
-            y1, y2 = max(0, y - 1), min(h, y + 2)
-            x1, x2 = max(0, x - 1), min(w, x + 2)
-            window = pred_grid[y1:y2, x1:x2]
-
-            sealake_neighbors = np.sum(window == sealake_idx) - 1  # -1 to exclude self
-
-            if sealake_neighbors > isolation_threshold:
-                continue
-            forest_prob = raw_probs[y, x, forest_idx]
-            if forest_prob < min_forest_prob:
-                continue
-
-            smoothed[y, x] = forest_idx
-            changes.append({
-                "position": (y, x),
-                "sealake_neighbors": int(sealake_neighbors),
-                "forest_prob": float(forest_prob),
-                "sealake_confidence": float(conf_grid[y, x])
-            })
-
-    return smoothed, changes
+def load_image(image):
+    """BGR uint8 array as-is (already decoded, e.g. extracted from MBTiles), else read from path"""
+    if isinstance(image, np.ndarray):
+        return image
+    print(f"[DEBUG] loading : {image}")
+    original = cv2.imread(image)
+    if original is None:
+        raise FileNotFoundError(f"Cannot read image: {image}")
+    return original
 
 
 def classify_image_with_mask(image_path, model, img_size, tile_size, class_names,
@@ -207,6 +181,7 @@ def classify_image_with_mask(image_path, model, img_size, tile_size, class_names
     """
     mask+ hierarchicall classification (full)
     :arg
+        image_path: path or BGR array (load_image)
         get_coarse_context args
         ...
         hierarchical_weight: weight for 64x64 context (0.0-1.0)
@@ -216,10 +191,7 @@ def classify_image_with_mask(image_path, model, img_size, tile_size, class_names
     :return
         Dict with pred_grid, conf_grid, pred_probs, original, metadata
     """
-    print(f"[DEBUG] loading : {image_path}")
-    original = cv2.imread(image_path)
-    if original is None:
-        raise FileNotFoundError(f"Cannot read image: {image_path}")
+    original = load_image(image_path)
 
     h, w, _ = original.shape
     print(f"[INFO] Image size: {w}x{h}")
@@ -312,7 +284,7 @@ def classify_image_with_mask(image_path, model, img_size, tile_size, class_names
 
     print(f"[INFO] Processed: {processed_tiles}, Skipped: {skipped_tiles}")
 
-    sealake_changes = []
+    sealake_changes = np.empty(0, dtype=SEALAKE_CHANGE_DTYPE)
     if fix_sealake:
         print(f"[INFO] Fixing isolated SeaLake tiles")
         pred_grid, sealake_changes = fix_isolated_sealake(
@@ -372,10 +344,7 @@ def classify_image_with_interpolation(
 ):
     from Classifier.src.utils.interpolation import apply_interpolation, simplify_predictions
 
-    print(f"[DEBUG] Loading image: {image_path}")
-    original = cv2.imread(image_path)
-    if original is None:
-        raise FileNotFoundError(f"Cannot read image: {image_path}")
+    original = load_image(image_path)
 
     h, w, _ = original.shape
     print(f"[INFO] Image size: {w}x{h}")
@@ -501,7 +470,7 @@ def classify_image_with_interpolation(
         "raw_probs_grid": full_res_probs,
         "original": original,
         "metadata": metadata,
-        "sealake_changes": [],
+        "sealake_changes": np.empty(0, dtype=SEALAKE_CHANGE_DTYPE),
         "full_res_class_indices": final_class_indices,
         "full_res_confidence": final_confidence_map,
         "active_class_names": active_class_names
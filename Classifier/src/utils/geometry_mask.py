@@ -0,0 +1,89 @@
+# geometry_mask.py
+# maska wojewodztwa (shapely geometry -> piksele mozaiki) i wyciecie okna; bez geopandas
+
+import cv2
+import numpy as np
+from shapely.geometry import MultiPolygon, Polygon
+
+
+def _pixel_polygons(geometry, bounds, w, h):
+    """(exterior, holes) int32 pixel rings of geometry in a (w, h) frame spanning bounds"""
+    minx, miny, maxx, maxy = bounds
+
+    def lonlat_to_pixel(lon, lat):
+        x_pct = (lon - minx) / (maxx - minx)
+        y_pct = (maxy - lat) / (maxy - miny)  # Flip Y
+        return int(x_pct * w), int(y_pct * h)
+
+    if isinstance(geometry, MultiPolygon):
+        polygons = list(geometry.geoms)
+    elif isinstance(geometry, Polygon):
+        polygons = [geometry]
+    else:
+        return []
+
+    def ring(coords):
+        return np.array([lonlat_to_pixel(lon, lat) for lon, lat in coords], dtype=np.int32)
+
+    return [
+        (ring(polygon.exterior.coords), [ring(interior.coords) for interior in polygon.interiors])
+        for polygon in polygons
+    ]
+
+
+def _fill_polygons(mask, polygons, offset=(0, 0)):
+    shift = np.array(offset, dtype=np.int32)
+    for exterior, holes in polygons:
+        cv2.fillPoly(mask, [exterior - shift], 255)
+        # holes
+        for hole in holes:
+            cv2.fillPoly(mask, [hole - shift], 0)
+    return mask
+
+
+def create_mask_from_geometry(image_shape, geometry, bounds, zoom):
+    """
+    Args:
+        image_shape: (height, width) of the image, shape geometry
+        [minx, miny, maxx, maxy] in lat/lon, zoom
+    Returns:
+        Binary mask (0/255) --- 255 = inside województwo
+    """
+    h, w = image_shape[:2]
+    mask = np.zeros((h, w), dtype=np.uint8)
+    return _fill_polygons(mask, _pixel_polygons(geometry, bounds, w, h))
+
+
+def mask_crop_window(image_shape, geometry, bounds):
+    """
+    (crop_mask, crop_offset) as crop_array_by_mask(img, create_mask_from_geometry(...)) gives,
+    without the full-size mask or image: window from the projected vertices, mask filled only inside it
+    """
+    h, w = image_shape[:2]
+    polygons = _pixel_polygons(geometry, bounds, w, h)
+    if not polygons:
+        raise ValueError("No valid contours found in mask")
+    points = np.concatenate([exterior for exterior, _ in polygons])
+    x0, y0 = np.maximum(points.min(axis=0), 0)
+    x1, y1 = np.minimum(points.max(axis=0), [w - 1, h - 1])
+    if x1 < x0 or y1 < y0:
+        raise ValueError("No valid contours found in mask")
+
+    window = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+    _fill_polygons(window, polygons, (x0, y0))
+    # dokladny prostokat wypelnionych pikseli (jak boundingRect na pelnej masce)
+    _, crop_mask, (dx, dy) = crop_array_by_mask(window, window)
+    return crop_mask, (int(x0 + dx), int(y0 + dy))
+
+
+def crop_array_by_mask(img, mask):
+    """
+    BGR array + binary mask (0/255) -> (cropped_img, crop_mask, crop_offset), nothing written
+    crop_offset: (x_offset, y_offset) for coordinate translation
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        raise ValueError("No valid contours found in mask")
+
+    x, y, w, h = cv2.boundingRect(np.concatenate(contours))
+    return img[y:y + h, x:x + w], mask[y:y + h, x:x + w], (x, y)
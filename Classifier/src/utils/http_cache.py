@@ -0,0 +1,45 @@
+# http_cache.py
+# walidacja HTTP (ETag / Last-Modified / Cache-Control) dla plikow wynikowych i kafelkow MBTiles
+# ETag z mtime + rozmiaru - bez czytania pliku
+
+import os
+
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# kafelki MBTiles sie nie zmieniaja (nowy plik -> nowy mtime -> nowy ETag)
+TILE_MAX_AGE = 30 * 86400
+ARTIFACT_MAX_AGE = 86400
+
+
+def file_etag(path, *parts):
+    """ETag from file mtime + size (+ parts, e.g. tile z/x/y), no file read"""
+    st = os.stat(path)
+    return '"' + "-".join(f"{v:x}" if isinstance(v, int) else str(v)
+                          for v in (st.st_mtime_ns, st.st_size, *parts)) + '"'
+
+
+def tile_etag(mbtiles_path, *parts):
+    """file_etag, None when the MBTiles file is missing (no conditional handling)"""
+    try:
+        return file_etag(mbtiles_path, *parts)
+    except OSError:
+        return None
+
+
+def conditional_file_response(request, path, content_type=None, as_attachment=False, max_age=ARTIFACT_MAX_AGE):
+    """
+    FileResponse with ETag / Last-Modified / Cache-Control;
+    304 when If-None-Match / If-Modified-Since match (file not opened)
+    """
+    etag = file_etag(path)
+    last_modified = int(os.path.getmtime(path))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type,
+                                as_attachment=as_attachment, filename=os.path.basename(path))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
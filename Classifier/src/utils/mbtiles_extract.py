@@ -1,9 +1,18 @@
-import sqlite3
 import mercantile
 from PIL import Image
-from io import BytesIO
 import os
 import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from Classifier.src.utils.mbtiles_pool import TILE_RANGE_SQL, mbtiles_identity, mbtiles_pool
+from Classifier.src.utils.tile_cache import tile_cache
+
+# dekodowanie JPEG (cv2 zwalnia GIL) rownolegle
+_decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="tile-decode")
 
 def bbox_to_tiles(bbox, zoom):
     """return: all tile coordinates for a bounding -rectangle with data box."""
@@ -23,34 +32,45 @@ def lonlat_to_pixel(lon, lat, zoom, tile_size=256):
         / 2.0 * (2.0 ** zoom * tile_size))
     return x, y
 
-def crop_to_bbox(stitched_path, bbox, zoom, tile_size=256):
-    """Crop stitched to exact bbox [dla wlasciwej strony]"""
-    ''' 1. switch y input |~ na |_
-    2. ~
-    3. crop znajdując różnicę między narożnikami 
-    docelowego иBox a początkiem zszytego obrazu.'''
-    west, south, east, north = bbox
+def bbox_pixel_origin(bbox, zoom, cropped=True, tile_size=256):
+    """
+    Global Web Mercator pixel (x, y) of the top-left corner of the image made for bbox:
+    the stitched mosaic (first tile corner) or, cropped=True, the crop_to_bbox result.
+    """
+    window = bbox_pixel_window(bbox, zoom, tile_size) if cropped else bbox_mosaic_window(bbox, zoom, tile_size)
+    return window[:2]
 
-    img = Image.open(stitched_path)
+
+def bbox_crop_window(bbox, zoom, tile_size=256):
+    """(left, top, right, bottom) of the exact bbox inside the stitched mosaic of its tiles"""
+    west, south, east, north = bbox
     x0_global, y1_global = lonlat_to_pixel(west, south, zoom, tile_size)
     x1_global, y0_global = lonlat_to_pixel(east, north, zoom, tile_size)
 
     # ~top left pixel of first tile
-    tiles = list(mercantile.tiles(west, south, east, north, zoom))
-    x_tiles = sorted({t.x for t in tiles})
-    y_tiles = sorted({t.y for t in tiles})
-
-    min_tile_x = min(x_tiles) * tile_size
-    min_tile_y = min(y_tiles) * tile_size
-    max_tile_x = (max(x_tiles) + 1) * tile_size
-    max_tile_y = (max(y_tiles) + 1) * tile_size
+    min_tile_x, min_tile_y, _, _ = bbox_mosaic_window(bbox, zoom, tile_size)
 
     left = int(x0_global - min_tile_x)
     right = int(x1_global - min_tile_x)
     top = int(y0_global - min_tile_y)
     bottom = int(y1_global - min_tile_y)
+    return left, top, right, bottom
+
 
-    cropped = img.crop((left, top, right, bottom))
+def crop_array_to_bbox(mosaic, bbox, zoom, tile_size=256):
+    """stitched BGR mosaic -> view of the exact bbox (no copy, no re-encode)"""
+    left, top, right, bottom = bbox_crop_window(bbox, zoom, tile_size)
+    return mosaic[top:bottom, left:right]
+
+
+def crop_to_bbox(stitched_path, bbox, zoom, tile_size=256):
+    """Crop stitched to exact bbox [dla wlasciwej strony]"""
+    ''' 1. switch y input |~ na |_
+    2. ~
+    3. crop znajdując różnicę między narożnikami 
+    docelowego иBox a początkiem zszytego obrazu.'''
+    img = Image.open(stitched_path)
+    cropped = img.crop(bbox_crop_window(bbox, zoom, tile_size))
 
     cropped_path = os.path.splitext(stitched_path)[0] + "_cropped.jpg"
     cropped.save(cropped_path, "JPEG", quality=90)
@@ -59,63 +79,152 @@ def crop_to_bbox(stitched_path, bbox, zoom, tile_size=256):
     return cropped_path
 
 
-def extract_tiles_from_mbtiles(mbtiles_path, bbox, zoom, output_path, debug_dir=None):
-    """Extract and stitch tiles that cover bbox. Optionally dump individual tiles."""
-    conn = sqlite3.connect(mbtiles_path)
-    cursor = conn.cursor()
-    # tiles == lista indeksow {[x1,y1], ... [xn,yn]}
-    tiles = bbox_to_tiles(bbox, zoom)
+def write_display_jpeg(path, image, quality=90):
+    """BGR array -> JPEG for display / download only (analysis runs on the array); returns encoded bytes"""
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f"Cannot encode {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = buf.tobytes()
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
 
-    # if not tiles:
-    #     raise ValueError("No tiles found for bbox")
+def bbox_mosaic_window(bbox, zoom, tile_size=256):
+    """global pixel window (left, top, right, bottom) of the full stitched mosaic of bbox's tiles"""
+    tiles = bbox_to_tiles(bbox, zoom)
     if not tiles:
         raise ValueError(f"[DEBUG]: No tiles for bbox, {tiles}")
-    if debug_dir:
-        os.makedirs(debug_dir, exist_ok=True)
+    return (
+        min(t.x for t in tiles) * tile_size, min(t.y for t in tiles) * tile_size,
+        (max(t.x for t in tiles) + 1) * tile_size, (max(t.y for t in tiles) + 1) * tile_size,
+    )
+
+
+def bbox_pixel_window(bbox, zoom, tile_size=256):
+    """global pixel window of the exact bbox (same rounding as crop_to_bbox)"""
+    x0, y0, _, _ = bbox_mosaic_window(bbox, zoom, tile_size)
+    left, top, right, bottom = bbox_crop_window(bbox, zoom, tile_size)
+    return x0 + left, y0 + top, x0 + right, y0 + bottom
+
+
+def _decode_into(out, data, window, tile_x, tile_y, tile_size):
+    """JPEG/PNG bytes -> the part of the tile inside window, written into out (BGR); False if undecodable"""
+    tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if tile is None:
+        return False
+    if tile.shape[:2] != (tile_size, tile_size):
+        tile = cv2.resize(tile, (tile_size, tile_size))
+    left, top, right, bottom = window
+    tx0, ty0 = tile_x * tile_size, tile_y * tile_size
+    x0, y0 = max(left, tx0), max(top, ty0)
+    x1, y1 = min(right, tx0 + tile_size), min(bottom, ty0 + tile_size)
+    out[y0 - top:y1 - top, x0 - left:x1 - left] = tile[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0]
+    return True
+
+
+def _fetch_tile_rows(mbtiles_path, cursor, zoom, wanted, stats):
+    """
+    (tile_column, tile_row, data) of the wanted tiles (set of (x, tile_row), tile_row = TMS y):
+    cached ones from the tile cache, the rest with one range query over their extent,
+    each fetched (or missing) tile stored back in the cache. stats: dict filled with cached/queried counts
+    """
+    source = mbtiles_identity(mbtiles_path)
+    cache = tile_cache()
+    missing = set()
+    for x, row in wanted:
+        data = cache.lookup((source, zoom, x, row))
+        if data is None:
+            missing.add((x, row))
+        elif data:
+            yield x, row, data
+    stats["cached"] = len(wanted) - len(missing)
+    stats["queried"] = len(missing)
+    if not missing:
+        return
+
+    xs = [x for x, _ in missing]
+    rows = [row for _, row in missing]
+    cursor.execute(TILE_RANGE_SQL, (zoom, min(xs), max(xs), min(rows), max(rows)))
+    for x, row, data in cursor:
+        if (x, row) in missing:
+            missing.discard((x, row))
+            cache.store((source, zoom, x, row), data)
+            yield x, row, data
+    # brak w pliku tez zapamietany
+    for x, row in missing:
+        cache.store((source, zoom, x, row), None)
 
-    # Read one tile to get size
-    cursor.execute("SELECT tile_data FROM tiles WHERE zoom_level=? LIMIT 1", (zoom,))
-    first_tile = cursor.fetchone()
-    if not first_tile:
-        raise ValueError(f"[DEBUG] No tiles for zoom {zoom}")
-    tile_size = Image.open(BytesIO(first_tile[0])).width
-
-    x_tiles = sorted({t.x for t in tiles})
-    y_tiles = sorted({t.y for t in tiles})
-    width = len(x_tiles) * tile_size
-    height = len(y_tiles) * tile_size
-    stitched = Image.new("RGB", (width, height))
-    # {256x256}  zoom, column, row
-    # bydgoszcz z=10, x=563, y=332
-    print(f"[DEBUG] Tiles to stitch ({len(tiles)}):")
-    for t in tiles:
-        print(f"  -> z={t.z}, x={t.x}, y={t.y}")
-        #  fix flipa y
-        cursor.execute(
-            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
-            (t.z, t.x, (1 << t.z) - 1 - t.y)
-        )
-        row = cursor.fetchone()
-        if not row:
-            print(f"[DEBUG] {t.z}/{t.x}/{t.y}") # w wyszukiwarce
-            continue
-
-        tile_img = Image.open(BytesIO(row[0])).convert("RGB")
 
-        if debug_dir:
-            tile_path = os.path.join(debug_dir, f"tile_{t.z}_{t.x}_{t.y}.jpg")
-            tile_img.save(tile_path)
-            print(f"     saved: {tile_path}")
+def extract_tiles_from_mbtiles(mbtiles_path, bbox, zoom, output_path, debug_dir=None):
+    """
+    Extract and stitch tiles that cover bbox into a JPEG (full mosaic). Optionally dump individual tiles.
+    """
+    mosaic = extract_tiles_array(mbtiles_path, bbox, zoom, debug_dir)
+    write_display_jpeg(output_path, mosaic)
+    return output_path
 
-        x_idx = x_tiles.index(t.x)
-        y_idx = y_tiles.index(t.y)
-        stitched.paste(tile_img, (x_idx * tile_size, y_idx * tile_size))
 
-    print(f"[DEBUG] Stitched image shape: {stitched.width}x{stitched.height}")
-    print(f"[DEBUG] Xs: {min(x_tiles)}–{max(x_tiles)} / Ys: {min(y_tiles)}–{max(y_tiles)}")
+def extract_tiles_array(mbtiles_path, bbox, zoom, debug_dir=None, cropped=False):
+    """
+    BGR array (numpy) of bbox, nothing written: the stitched mosaic of its tiles
+    or, cropped=True, only the exact bbox pixels (crop_to_bbox window).
+    """
+    window = bbox_pixel_window(bbox, zoom) if cropped else bbox_mosaic_window(bbox, zoom)
+    return extract_window_array(mbtiles_path, zoom, window, debug_dir=debug_dir)
 
-    conn.close()
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    stitched.save(output_path, "JPEG", quality=90)
 
-    return output_path
+def extract_window_array(mbtiles_path, zoom, window, tile_size=256, debug_dir=None):
+    """
+    Pixels of a global Web Mercator window (left, top, right, bottom) at zoom, as a BGR array.
+    Only tiles intersecting the window are fetched (tile cache, one range query for the rest) and decoded
+    in a thread pool; each writes just its part of the window. Missing tiles stay black.
+    """
+    with mbtiles_pool(mbtiles_path).connection() as conn:
+        return _extract_window(mbtiles_path, conn.cursor(), zoom, window, tile_size, debug_dir)
+
+
+def _extract_window(mbtiles_path, cursor, zoom, window, tile_size=256, debug_dir=None):
+    left, top, right, bottom = (int(v) for v in window)
+    if right <= left or bottom <= top:
+        raise ValueError(f"[DEBUG]: Empty window {window}")
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    # kafelki przecinajace okno (XYZ)
+    tile_range = (left // tile_size, top // tile_size, (right - 1) // tile_size, (bottom - 1) // tile_size)
+    tx0, ty0, tx1, ty1 = tile_range
+    #  fix flipa y: MBTiles tile_row = TMS
+    n = (1 << zoom) - 1
+    wanted = {(x, n - y) for x in range(tx0, tx1 + 1) for y in range(ty0, ty1 + 1)}
+    fetch_stats = {}
+    rows = _fetch_tile_rows(mbtiles_path, cursor, zoom, wanted, fetch_stats)
+
+    out = np.zeros((bottom - top, right - left, 3), dtype=np.uint8)
+    window = (left, top, right, bottom)
+    futures = []
+    for x, row, data in rows:
+        if debug_dir:
+            with open(os.path.join(debug_dir, f"tile_{zoom}_{x}_{n - row}.jpg"), "wb") as f:
+                f.write(data)
+        futures.append(_decode_pool.submit(_decode_into, out, data, window, x, n - row, tile_size))
+
+    if not futures:
+        # brak kafelkow w oknie -> czarny obraz jak wczesniej; brak calego zoomu -> blad
+        cursor.execute("SELECT 1 FROM tiles WHERE zoom_level=? LIMIT 1", (zoom,))
+        if not cursor.fetchone():
+            raise ValueError(f"[DEBUG] No tiles for zoom {zoom}")
+    fetch_time = time.perf_counter() - start
+    undecodable = sum(not f.result() for f in futures)
+    decode_time = time.perf_counter() - start - fetch_time
+
+    print(
+        f"[EXTRACT] z={zoom} x {tx0}-{tx1}, y {ty0}-{ty1}: "
+        f"{len(futures)}/{len(wanted)} tiles ({fetch_stats['cached']} cached, {fetch_stats['queried']} queried), "
+        f"{len(wanted) - len(futures)} missing, {undecodable} undecodable; "
+        f"{out.shape[1]}x{out.shape[0]} px window, fetch+submit {fetch_time:.2f}s, decode {decode_time:.2f}s, "
+        f"total {time.perf_counter() - start:.2f}s"
+    )
+    return out
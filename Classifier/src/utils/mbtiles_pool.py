@@ -0,0 +1,136 @@
+# mbtiles_pool.py
+# pula polaczen read-only do plikow MBTiles (per proces), wspolna dla widokow kafelkow i ekstrakcji
+# immutable=1: plik nie zmienia sie w trakcie dzialania serwera (brak blokad / sprawdzania zmian);
+# podmieniony plik (nowy mtime / rozmiar) -> nowa pula
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+MBTILES_MMAP_SIZE = 256 * 1024 * 1024
+# bezczynne polaczenia trzymane na plik; wiecej jednoczesnych zadan -> dodatkowe, zamykane po uzyciu
+MBTILES_POOL_SIZE = 8
+
+# stale teksty zapytan -> prepared statement z cache polaczenia (sqlite3 cached_statements)
+TILE_SQL = "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?"
+MAX_ZOOM_SQL = "SELECT MAX(zoom_level) FROM tiles"
+TILE_RANGE_SQL = (
+    "SELECT tile_column, tile_row, tile_data FROM tiles "
+    "WHERE zoom_level=? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?"
+)
+
+
+def mbtiles_identity(path):
+    """
+    (abs path, mtime_ns, size) - a replaced MBTiles file gets a new identity
+    (new pool, new tile cache keys, new ETag); (abs path, None, None) when it does not exist
+    """
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, st.st_mtime_ns, st.st_size
+
+
+class MBTilesPool:
+    """Read-only connections to one MBTiles file, reused across requests and threads"""
+
+    def __init__(self, path, max_idle=MBTILES_POOL_SIZE, mmap_size=MBTILES_MMAP_SIZE):
+        self.identity = mbtiles_identity(path)
+        self.path = self.identity[0]
+        self.max_idle = max_idle
+        self.mmap_size = mmap_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "reused": 0, "closed": 0, "in_use": 0, "queries": 0, "query_seconds": 0.0}
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"MBTiles not found: {self.path}")
+        uri = f"file:{quote(self.path)}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """borrowed connection (one thread at a time), returned to the pool afterwards"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self._stats["reused" if conn is not None else "opened"] += 1
+            self._stats["in_use"] += 1
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+                keep = len(self._idle) < self.max_idle
+                if keep:
+                    self._idle.append(conn)
+                else:
+                    self._stats["closed"] += 1
+            if not keep:
+                conn.close()
+
+    def _query(self, sql, params=()):
+        start = time.perf_counter()
+        with self.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["query_seconds"] += time.perf_counter() - start
+        return row
+
+    def tile(self, z, x, tile_row):
+        """tile blob (MBTiles addressing, tile_row = TMS y) or None"""
+        row = self._query(TILE_SQL, (z, x, tile_row))
+        return row[0] if row else None
+
+    def max_zoom(self):
+        row = self._query(MAX_ZOOM_SQL)
+        return row[0] if row else None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, idle=len(self._idle), path=self.path)
+        stats["avg_query_ms"] = 1000 * stats["query_seconds"] / stats["queries"] if stats["queries"] else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def mbtiles_pool(path):
+    """per-process pool for path (created on first use, recreated when the file was replaced)"""
+    identity = mbtiles_identity(path)
+    key = identity[0]
+    stale = None
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and pool.identity != identity:
+            # immutable=1 -> stare polaczenia czytalyby poprzedni plik
+            stale, pool = pool, None
+        if pool is None:
+            pool = _pools[key] = MBTilesPool(key)
+    if stale is not None:
+        stale.close()
+    return pool
+
+
+def mbtiles_pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -0,0 +1,131 @@
+# tile_cache.py
+# LRU surowych kafelkow MBTiles (bajty JPEG) przed zapytaniami SQLite, limit w bajtach;
+# opcjonalnie wspolny katalog na dysku (kilka workerow)
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from Classifier.src.utils.atomic import atomic_write
+from Classifier.src.utils.mbtiles_pool import TILE_SQL, mbtiles_identity, mbtiles_pool
+
+TILE_CACHE_BYTES = 64 * 1024 * 1024
+# brak kafelka tez jest zapamietywany (mapa pyta o obszary poza plikiem)
+_MISSING = b""
+
+
+class TileCache:
+    """
+    (mbtiles_identity, z, x, tile_row) -> tile bytes, byte-budgeted LRU + optional disk tier.
+    Identity = path + mtime + size: a replaced file never gets the old bytes (memory or disk)
+    """
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _disk_path(self, key):
+        (path, mtime_ns, size), z, x, y = key
+        digest = hashlib.sha1(f"{path}|{mtime_ns}|{size}".encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.disk_dir, digest, str(z), str(x), f"{y}.tile")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def lookup(self, key):
+        """-> bytes (b"" = known missing tile) or None when not cached"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return data
+        data = self._read_disk(key)
+        with self._lock:
+            self._stats["disk_hits" if data is not None else "misses"] += 1
+        if data is not None:
+            self._remember(key, data)
+        return data
+
+    def store(self, key, data):
+        data = _MISSING if data is None else bytes(data)
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes,
+                         max_bytes=self.max_bytes, disk_dir=self.disk_dir)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_cache = TileCache()
+
+
+def configure_tile_cache(max_bytes=TILE_CACHE_BYTES, disk_dir=None):
+    """replaces the process cache (settings: TILE_CACHE_BYTES, TILE_CACHE_DIR)"""
+    global _cache
+    _cache = TileCache(max_bytes, disk_dir)
+    return _cache
+
+
+def tile_cache():
+    return _cache
+
+
+def cached_tile(mbtiles_path, z, x, tile_row, cursor=None):
+    """
+    tile bytes (MBTiles addressing) through the cache, else SQLite; None if missing
+    Args:
+        cursor: already borrowed connection's cursor (extraction), else the pool is used
+    """
+    key = (mbtiles_identity(mbtiles_path), int(z), int(x), int(tile_row))
+    cache = _cache
+    data = cache.lookup(key)
+    if data is None:
+        if cursor is not None:
+            row = cursor.execute(TILE_SQL, (z, x, tile_row)).fetchone()
+            data = row[0] if row else None
+        else:
+            data = mbtiles_pool(mbtiles_path).tile(z, x, tile_row)
+        cache.store(key, data)
+    return data or None
@@ -2,13 +2,16 @@ import json
 import os
 import cv2
 import numpy as np
-from shapely.geometry import shape, MultiPolygon, Polygon
-import geopandas as gpd
 from shapely.geometry import shape
+import geopandas as gpd
 import hashlib
 import unicodedata
 import re
 
+from Classifier.src.utils.geometry_mask import (
+    create_mask_from_geometry, crop_array_by_mask, mask_crop_window
+)
+
 
 def unify_lang_file(filename):
     normalized = unicodedata.normalize('NFKD', filename)
@@ -42,45 +45,6 @@ def load_wojewodztwa_geojson(geojson_path):
     return wojewodztwa
 
 
-def create_mask_from_geometry(image_shape, geometry, bounds, zoom):
-    """
-    Args:
-        image_shape: (height, width) of the image, shape geometry
-        [minx, miny, maxx, maxy] in lat/lon, zoom
-    Returns:
-        Binary mask (0/255) --- 255 = inside województwo
-    """
-    h, w = image_shape[:2]
-    mask = np.zeros((h, w), dtype=np.uint8)
-
-    minx, miny, maxx, maxy = bounds
-
-    def lonlat_to_pixel(lon, lat):
-        x_pct = (lon - minx) / (maxx - minx)
-        y_pct = (maxy - lat) / (maxy - miny)  # Flip Y
-        return int(x_pct * w), int(y_pct * h)
-
-    if isinstance(geometry, MultiPolygon):
-        polygons = list(geometry.geoms)
-    elif isinstance(geometry, Polygon):
-        polygons = [geometry]
-    else:
-        return mask
-
-    for polygon in polygons:
-        exterior_coords = list(polygon.exterior.coords)
-        pts = np.array([lonlat_to_pixel(lon, lat) for lon, lat in exterior_coords], dtype=np.int32)
-        cv2.fillPoly(mask, [pts], 255)
-
-        # holes
-        for interior in polygon.interiors:
-            interior_coords = list(interior.coords)
-            pts = np.array([lonlat_to_pixel(lon, lat) for lon, lat in interior_coords], dtype=np.int32)
-            cv2.fillPoly(mask, [pts], 0)
-
-    return mask
-
-
 def crop_image_by_mask(image_path, mask, output_path):
     """
     Crop by binary mask
@@ -97,20 +61,14 @@ def crop_image_by_mask(image_path, mask, output_path):
     if img is None:
         raise ValueError(f"Cannot read image: {image_path}")
 
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
-        raise ValueError("No valid contours found in mask")
-
-    x, y, w, h = cv2.boundingRect(np.concatenate(contours))
-    cropped_img = img[y:y + h, x:x + w]
-    cropped_mask = mask[y:y + h, x:x + w]
+    cropped_img, cropped_mask, crop_offset = crop_array_by_mask(img, mask)
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     cv2.imwrite(output_path, cropped_img)
     mask_output_path = output_path.replace('.jpg', '_mask.png')
     cv2.imwrite(mask_output_path, cropped_mask)
 
-    return output_path, cropped_mask, (x, y)
+    return output_path, cropped_mask, crop_offset
 
 
 def make_wojewodztwo_cache_key(wojewodztwo_id, model_path, params, zoom):
@@ -0,0 +1,71 @@
+# writer.py
+# zapis artefaktow analizy w tle (thread pool) - odpowiedz HTTP nie czeka na PNG/JSON
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+ARTIFACTS_PENDING = "pending"
+ARTIFACTS_READY = "ready"
+ARTIFACTS_FAILED = "failed"
+
+ARTIFACT_STATUS_CHOICES = [
+    (ARTIFACTS_PENDING, "Pending"),
+    (ARTIFACTS_READY, "Ready"),
+    (ARTIFACTS_FAILED, "Failed"),
+]
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="artifact-writer")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def submit_artifacts(key, write_fn, on_status=None):
+    """
+    Runs write_fn() in the background writer.
+    Args:
+        key: artifact set id (mask path), used by artifacts_job/wait_for_artifacts
+        on_status: called in the writer thread with ARTIFACTS_READY / ARTIFACTS_FAILED
+    Returns: Future
+    """
+    def job():
+        try:
+            write_fn()
+            status = ARTIFACTS_READY
+        except Exception as e:
+            print(f"[WRITER] Failed to write artifacts {key}: {e}")
+            traceback.print_exc()
+            status = ARTIFACTS_FAILED
+        if on_status is not None:
+            on_status(status)
+        return status
+
+    future = _executor.submit(job)
+    with _jobs_lock:
+        _jobs[key] = future
+    future.add_done_callback(lambda f: _forget(key, f))
+    print(f"[WRITER] Queued artifacts {key}")
+    return future
+
+
+def _forget(key, future):
+    with _jobs_lock:
+        if _jobs.get(key) is future:
+            del _jobs[key]
+
+
+def artifacts_job(key):
+    """-> Future of a queued/running write in this process, or None"""
+    with _jobs_lock:
+        return _jobs.get(key)
+
+
+def wait_for_artifacts(key, timeout=None):
+    """
+    Blocks until the in-process write for key finishes.
+    Returns: final status, or None when no job for key runs in this process
+    """
+    future = artifacts_job(key)
+    if future is None:
+        return None
+    return future.result(timeout=timeout)
@@ -1,11 +1,13 @@
 import { setProgress, displayResults } from './ui.js';
+import { showClassificationOverlay } from './map.js';
 /**
  * + backend requset analysis
  * @param {L.LatLngBounds} rectBounds - bbox
  * @param {number} zoom - zoom
+ * @param {L.Map} [map] - map for the classification tile overlay
  * @returns {Promise<boolean>} - return success
  */
-export async function runAnalysis(rectBounds, zoom) {
+export async function runAnalysis(rectBounds, zoom, map) {
   console.log('[DEBUG] Frontend start');
   console.log('[DEBUG] bbox:', rectBounds);
   console.log('[DEBUG] zoom:', zoom);
@@ -82,6 +84,9 @@ export async function runAnalysis(rectBounds, zoom) {
     setProgress(3);
     console.log('[DEBUG] Displaying results...');
     displayResults(j);
+    if (map && j.overlay_tiles) {
+      showClassificationOverlay(map, j.overlay_tiles, rectBounds);
+    }
     console.log('[DEBUG] analysis done');
     return true;
 
@@ -59,6 +59,13 @@ document.addEventListener("DOMContentLoaded", function() {
         loadImage(originalImg, 'original_thumb', 'original_url');
     }
 
+    // granica wojewodztwa - SVG nakladany na oryginal
+    const boundaryOverlay = document.getElementById('boundaryOverlay');
+    if (boundaryOverlay && imageData.boundary_url) {
+        boundaryOverlay.src = imageData.boundary_url;
+        boundaryOverlay.onload = () => { boundaryOverlay.style.display = 'block'; };
+    }
+
     if (imageData.has_mask && imageData.mask_thumb) {
         loadImage(maskImg, 'mask_thumb', 'mask_url');
     }
@@ -73,6 +80,9 @@ document.addEventListener("DOMContentLoaded", function() {
         Object.values(images).forEach(img => {
             img.style.transform = `scale(${currentScale})`;
         });
+        if (boundaryOverlay) {
+            boundaryOverlay.style.transform = `scale(${currentScale})`;
+        }
 
         document.getElementById('zoomLevel').textContent = `${Math.round(currentScale * 100)}%`;
 
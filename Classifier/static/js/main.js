@@ -90,7 +90,7 @@ document.addEventListener('DOMContentLoaded', () => {
             statsBars.innerHTML = '<div style="text-align:center; padding: 20px;">Analiza w toku...</div>';
 
             try {
-                await runAnalysis(lastRectBounds, map.getZoom());
+                await runAnalysis(lastRectBounds, map.getZoom(), map);
             } catch (error) {
                 console.error('Analysis error:', error);
                 statsBars.innerHTML = `<div style="color: red;">Error: ${error.message}</div>`;
@@ -34,6 +34,16 @@ export function initMap() {
     pane: 'labels',
   }).addTo(map);
 
+  // klasyfikacja kafelkow na zywo (domyslny model), tylko przy duzych zoomach
+  const liveClassificationLayer = L.tileLayer('/classify_tiles/{z}/{x}/{y}.png', {
+    minZoom: 11,
+    maxZoom: 13,
+    tms: true,
+    noWrap: true,
+    bounds: [[49, 14], [55, 25]],
+    opacity: 0.5
+  });
+
   addPolandBorders(map);
 
   const drawnItems = new L.FeatureGroup();
@@ -54,12 +64,45 @@ export function initMap() {
   map.addControl(drawControl);
 
   const baseLayers = { "Powierzchnia satelitarna": satelliteLayer };
-  const overlays = { "Miasta": labelOverlay };
+  const overlays = { "Miasta": labelOverlay, "Klasyfikacja na żywo": liveClassificationLayer };
   L.control.layers(baseLayers, overlays).addTo(map);
 
   return { map, drawnItems };
 }
 
+let classificationOverlay = null;
+
+/**
+ * Classification result as XYZ tiles (/analysis/<id>/overlay/{z}/{x}/{y}.png),
+ * replaces the previous overlay
+ * @param {L.Map} map
+ * @param {string} url - tile URL template
+ * @param {L.LatLngBounds} bounds - analysed area (no requests outside)
+ */
+export function showClassificationOverlay(map, url, bounds) {
+  if (classificationOverlay) {
+    map.removeLayer(classificationOverlay);
+  }
+  classificationOverlay = L.tileLayer(url, {
+    maxZoom: 13,
+    noWrap: true,
+    bounds: bounds,
+    opacity: 0.6
+  }).addTo(map);
+  // maska jeszcze zapisywana w tle -> 202, ponowienie kafelka po chwili (kilka prob)
+  classificationOverlay.on('tileerror', ({ tile }) => {
+    const attempt = Number(tile.dataset.retry || 0) + 1;
+    if (attempt > 5) return;
+    tile.dataset.retry = attempt;
+    setTimeout(() => {
+      const src = new URL(tile.src, window.location.href);
+      src.searchParams.set('retry', attempt);
+      tile.src = src.toString();
+    }, 2000);
+  });
+  return classificationOverlay;
+}
+
 /**
  * @param {L.Map} map
  */
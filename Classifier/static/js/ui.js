@@ -86,18 +86,20 @@ function displayImages(images) {
     originalImg.src = images.original;
     setupImageZoom(originalImg);
   }
+  // maska/overlay/zabudowa materializowane na serwerze przy pierwszym zadaniu ->
+  // URL w data-src, ladowany dopiero po otwarciu zakladki
   if (images.mask && maskImg) {
-    maskImg.src = images.mask;
+    deferImage(maskImg, images.mask);
     setupImageZoom(maskImg);
   }
   if (images.blended && blendedImg) {
-    blendedImg.src = images.blended;
+    deferImage(blendedImg, images.blended);
     setupImageZoom(blendedImg);
   }
 
   // NEW: Handle residential image
   if (images.residential && residentialImg && residentialBtn) {
-    residentialImg.src = images.residential;
+    deferImage(residentialImg, images.residential);
     residentialBtn.style.display = 'inline-block';
     setupImageZoom(residentialImg);
     console.log('[DEBUG] Residential image loaded and button shown');
@@ -115,6 +117,9 @@ function displayImages(images) {
     return activeBtn ? activeBtn.dataset.view : 'original';
   }
 
+  // zakladka otwarta przed nowym wynikiem
+  loadLayerImage(getActiveView());
+
   if (downloadActiveBtn) {
     downloadActiveBtn.onclick = () => {
       const view = getActiveView();
@@ -158,10 +163,24 @@ function displayImages(images) {
         targetLayer.classList.add('active');
         targetLayer.style.opacity = '1';
       }
+      loadLayerImage(view);
     });
   });
 }
 
+function deferImage(img, url) {
+  img.removeAttribute('src');
+  img.dataset.src = url;
+}
+
+function loadLayerImage(view) {
+  const img = document.querySelector(`[data-layer="${view}"] img`);
+  if (img && img.dataset.src) {
+    img.src = img.dataset.src;
+    delete img.dataset.src;
+  }
+}
+
 function setupImageZoom(img) {
   let zoomed = false;
 
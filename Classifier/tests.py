@@ -1,3 +1,840 @@
-from django.test import TestCase
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
 
-# Create your tests here.
+import cv2
+import numpy as np
+import shapely
+from PIL import Image
+from django.test import RequestFactory, SimpleTestCase
+from scipy import ndimage as ndi
+
+from Classifier.src.artifacts import (
+    ARTIFACT_LOCK_STRIPES, BLENDED_ALPHA, _artifact_lock, blended_artifact, materialize_artifact,
+    residential_artifact
+)
+from Classifier.src.config import CLASS_NAMES, CLASS_PRIORITY, COLORS
+from Classifier.src.export import (
+    export_confidence_geotiff, export_label_geotiff, geotiff_available, landcover_features, read_geotiff_window
+)
+from Classifier.src import live
+from Classifier.src.accumulators import StatsAccumulator, merge_accumulators
+from Classifier.src.landscape import label_patches
+from Classifier.src.overlay import empty_overlay_tile, overlay_tile
+from Classifier.src.live import PredictionBatcher, TilePredictionStore, live_model_key, tile_prediction
+from Classifier.src.render import render_labels, save_indexed_png
+from Classifier.src.stats import (
+    compute_boundary_analysis, compute_grid_stats, compute_label_stats, pixel_row_areas_km2
+)
+from Classifier.src.smoothing import fix_isolated_sealake, smooth_predictions
+from Classifier.src.utils.change_log import change_log_to_records, load_change_log, save_change_log
+from Classifier.src.utils.atomic import atomic_imwrite, atomic_path
+from Classifier.src.utils.geometry_mask import create_mask_from_geometry, crop_array_by_mask, mask_crop_window
+from Classifier.src.utils.http_cache import conditional_file_response, file_etag, tile_etag
+from Classifier.src.utils.mbtiles_extract import (
+    bbox_crop_window, bbox_mosaic_window, bbox_pixel_origin, crop_array_to_bbox, crop_to_bbox, extract_tiles_array,
+    extract_window_array, lonlat_to_pixel, write_display_jpeg
+)
+from Classifier.src.utils.mbtiles_pool import MBTilesPool, mbtiles_pool
+from Classifier.src.utils.tile_cache import TileCache, cached_tile, configure_tile_cache, tile_cache
+from Classifier.src.writer import (
+    ARTIFACTS_FAILED, ARTIFACTS_READY, artifacts_job, submit_artifacts, wait_for_artifacts
+)
+
+LABEL_NODATA = 255
+BOUNDS = [17.0, 50.0, 18.0, 51.0]
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def assert_stats_close(test, a, b, path="stats"):
+    if isinstance(a, dict):
+        test.assertEqual(set(a), set(b), path)
+        for key in a:
+            assert_stats_close(test, a[key], b[key], f"{path}.{key}")
+    elif isinstance(a, (list, tuple, str)) or a is None:
+        test.assertEqual(a, b, path)
+    else:
+        test.assertAlmostEqual(float(a), float(b), delta=1e-9 * max(1.0, abs(float(a))), msg=path)
+
+
+def write_mbtiles(path, tiles, mtime=None):
+    """{(z, x, y): BGR array} -> MBTiles at path (tile_row = TMS y)"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS tiles "
+                 "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+    for (z, x, y), tile in tiles.items():
+        data = cv2.imencode(".png", tile)[1].tobytes()
+        conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, (1 << z) - 1 - y, data))
+    conn.commit()
+    conn.close()
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def solid_tile(color, size=256):
+    tile = np.zeros((size, size, 3), dtype=np.uint8)
+    tile[:] = color
+    return tile
+
+
+class TempDirTestCase(SimpleTestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+
+class LabelPatchesTests(SimpleTestCase):
+    def test_same_partition_as_per_class_labelling(self):
+        rng = np.random.default_rng(4)
+        for shape in ((1, 1), (1, 9), (9, 1), (40, 55)):
+            labels = rng.integers(0, 4, shape).astype(np.uint8)
+            labels[rng.random(shape) < 0.1] = LABEL_NODATA
+            patch_ids, patch_class, patch_cells = label_patches(labels, 4)
+
+            self.assertTrue((patch_ids[labels == LABEL_NODATA] == 0).all())
+            self.assertEqual(patch_class[0], -1)
+            expected_patches = 0
+            for c in range(4):
+                ids, n = ndi.label(labels == c)
+                expected_patches += n
+                # kazdy plat klasy = dokladnie jedno id
+                for i in range(1, n + 1):
+                    found = np.unique(patch_ids[ids == i])
+                    self.assertEqual(len(found), 1)
+                    self.assertEqual(patch_class[found[0]], c)
+                    self.assertEqual(patch_cells[found[0]], (ids == i).sum())
+            self.assertEqual(len(patch_class) - 1, expected_patches)
+
+
+class TileCacheTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.previous_cache = tile_cache()
+
+    def tearDown(self):
+        configure_tile_cache(self.previous_cache.max_bytes, self.previous_cache.disk_dir)
+        super().tearDown()
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        cache = TileCache(max_bytes=10)
+        cache.store(("a", 0, 0, 0), b"12345")
+        cache.store(("a", 0, 0, 1), b"12345")
+        cache.lookup(("a", 0, 0, 0))
+        cache.store(("a", 0, 0, 2), b"12345")
+        self.assertIsNone(cache.lookup(("a", 0, 0, 1)))
+        self.assertEqual(cache.lookup(("a", 0, 0, 0)), b"12345")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_missing_tile_remembered(self):
+        path = os.path.join(self.tmp, "a.mbtiles")
+        write_mbtiles(path, {(1, 0, 0): solid_tile((1, 2, 3))})
+        cache = configure_tile_cache(disk_dir=os.path.join(self.tmp, "cache"))
+        self.assertIsNone(cached_tile(path, 1, 1, 1))
+        self.assertIsNone(cached_tile(path, 1, 1, 1))
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_replaced_file_not_served_from_cache(self):
+        path = os.path.join(self.tmp, "a.mbtiles")
+        disk_dir = os.path.join(self.tmp, "cache")
+        write_mbtiles(path, {(1, 0, 0): solid_tile((10, 10, 10))}, mtime=1_000_000)
+        configure_tile_cache(disk_dir=disk_dir)
+        old = cached_tile(path, 1, 0, 1)
+        extracted = quiet(extract_window_array, path, 1, (0, 0, 256, 256))
+        self.assertEqual(tuple(extracted[0, 0]), (10, 10, 10))
+
+        # nowy plik pod ta sama sciezka (os.replace) -> nowy mtime / rozmiar
+        new_path = os.path.join(self.tmp, "b.mbtiles")
+        write_mbtiles(new_path, {(1, 0, 0): solid_tile((200, 100, 50)), (1, 1, 0): solid_tile((0, 0, 0))},
+                      mtime=2_000_000)
+        os.replace(new_path, path)
+
+        # restart: pusty LRU, ten sam katalog na dysku
+        configure_tile_cache(disk_dir=disk_dir)
+        self.assertNotEqual(cached_tile(path, 1, 0, 1), old)
+        extracted = quiet(extract_window_array, path, 1, (0, 0, 256, 256))
+        self.assertEqual(tuple(extracted[0, 0]), (200, 100, 50))
+        self.assertEqual(mbtiles_pool(path).identity[2], os.path.getsize(path))
+
+
+class ArtifactTests(TempDirTestCase):
+    def test_concurrent_requests_build_once(self):
+        path = os.path.join(self.tmp, "x_blended.png")
+        builds = []
+
+        def build(out):
+            builds.append(out)
+            time.sleep(0.05)
+            with open(out, "wb") as f:
+                f.write(b"png")
+            return out
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(quiet(materialize_artifact, path, build)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(builds, [path])
+        self.assertEqual(results, [path] * 8)
+
+    def test_lock_set_is_bounded(self):
+        locks = {id(_artifact_lock(f"/media/a_{i}_mask.png")) for i in range(1000)}
+        self.assertLessEqual(len(locks), ARTIFACT_LOCK_STRIPES)
+        self.assertIs(_artifact_lock("/media/a_1_mask.png"), _artifact_lock("/media/a_1_mask.png"))
+
+    def test_atomic_write_leaves_nothing_on_error(self):
+        path = os.path.join(self.tmp, "out.png")
+        with self.assertRaises(RuntimeError):
+            with atomic_path(path) as tmp_path:
+                with open(tmp_path, "wb") as f:
+                    f.write(b"partial")
+                raise RuntimeError("encoder failed")
+        self.assertEqual(os.listdir(self.tmp), [])
+        self.assertEqual(atomic_imwrite(path, np.zeros((2, 2, 3), dtype=np.uint8)), path)
+        self.assertEqual(os.listdir(self.tmp), ["out.png"])
+
+    def test_blended_and_residential_from_label_raster(self):
+        rng = np.random.default_rng(6)
+        labels = rng.integers(0, len(CLASS_NAMES), (20, 30)).astype(np.uint8)
+        original = rng.integers(0, 255, (20, 30, 3), dtype=np.uint8)
+        mask_path = os.path.join(self.tmp, "a_20240101_mask.png")
+        image_path = os.path.join(self.tmp, "a.png")
+        save_indexed_png(mask_path, labels)
+        cv2.imwrite(image_path, original)
+
+        blended_path = quiet(blended_artifact, mask_path, image_path)
+        expected = cv2.addWeighted(original, BLENDED_ALPHA, render_labels(labels), 1 - BLENDED_ALPHA, 0)
+        np.testing.assert_array_equal(cv2.imread(blended_path), expected)
+
+        residential = cv2.imread(quiet(residential_artifact, mask_path, image_path), cv2.IMREAD_UNCHANGED)
+        ys, xs = np.nonzero(labels == CLASS_NAMES.index("Residential"))
+        self.assertEqual(residential.shape[:2], (ys.max() - ys.min() + 1, xs.max() - xs.min() + 1))
+        self.assertEqual(int((residential[..., 3] == 255).sum()), len(ys))
+
+
+class LiveTileTests(TempDirTestCase):
+    class CountingModel:
+        def __init__(self):
+            self.calls = []
+
+        def predict(self, arr, verbose=0):
+            self.calls.append(len(arr))
+            # wiersz i -> prawdopodobienstwa z i w pierwszej kolumnie (kolejnosc wynikow sprawdzalna)
+            return np.column_stack([arr[:, 0], np.zeros(len(arr))])
+
+    def setUp(self):
+        super().setUp()
+        self.previous_store = live._store
+        live._store = TilePredictionStore(os.path.join(self.tmp, "predictions.sqlite"))
+        self.model_path = os.path.join(self.tmp, "model.keras")
+        self.mbtiles_path = os.path.join(self.tmp, "map.mbtiles")
+        for path in (self.model_path, self.mbtiles_path):
+            with open(path, "wb") as f:
+                f.write(b"v1")
+            os.utime(path, (1_000_000, 1_000_000))
+
+    def tearDown(self):
+        live._store = self.previous_store
+        super().tearDown()
+
+    def test_store_round_trip(self):
+        labels = np.arange(16, dtype=np.uint8).reshape(4, 4)
+        confidence = np.linspace(0, 1, 16).reshape(4, 4)
+        live._store.put("k", 5, 1, 2, labels, confidence)
+        got_labels, got_confidence = live._store.get("k", 5, 1, 2)
+        np.testing.assert_array_equal(got_labels, labels)
+        np.testing.assert_allclose(got_confidence, confidence, atol=1e-3)
+        self.assertIsNone(live._store.get("k", 5, 1, 3))
+
+    def test_stored_prediction_served_until_model_changes(self):
+        labels, confidence = np.ones((4, 4), dtype=np.uint8), np.ones((4, 4))
+        key = live_model_key(self.model_path, self.mbtiles_path)
+        live._store.put(key, 5, 1, 2, labels, confidence)
+        np.testing.assert_array_equal(tile_prediction(self.mbtiles_path, self.model_path, 5, 1, 2)[0], labels)
+
+        # model przetrenowany i zapisany pod ta sama sciezka
+        with open(self.model_path, "wb") as f:
+            f.write(b"v2 retrained")
+        self.assertNotEqual(live_model_key(self.model_path, self.mbtiles_path), key)
+        self.assertIsNone(live._store.get(live_model_key(self.model_path, self.mbtiles_path), 5, 1, 2))
+
+        # podmieniona mapa -> tez nowy klucz
+        model_key = live_model_key(self.model_path, self.mbtiles_path)
+        os.utime(self.mbtiles_path, (2_000_000, 2_000_000))
+        self.assertNotEqual(live_model_key(self.model_path, self.mbtiles_path), model_key)
+
+    def test_concurrent_requests_share_one_predict(self):
+        model = self.CountingModel()
+        batcher = PredictionBatcher(model, window=0.2)
+        batches = [np.full((n, 1), float(i)) for i, n in enumerate((3, 5, 2))]
+        futures = [batcher.predict(arr) for arr in batches]
+        results = [quiet(future.result, timeout=5) for future in futures]
+
+        self.assertEqual(model.calls, [10])
+        for i, (arr, probs) in enumerate(zip(batches, results)):
+            self.assertEqual(len(probs), len(arr))
+            self.assertTrue((probs[:, 0] == i).all())
+
+    def test_predict_error_reaches_every_request(self):
+        class FailingModel:
+            def predict(self, arr, verbose=0):
+                raise RuntimeError("out of memory")
+
+        batcher = PredictionBatcher(FailingModel(), window=0.1)
+        futures = [batcher.predict(np.zeros((2, 1))) for _ in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+
+class OverlayTileTests(TempDirTestCase):
+    ZOOM = 10
+    ORIGIN = (100 * 256 + 10, 200 * 256 + 20)
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(8)
+        self.labels = rng.integers(0, len(CLASS_NAMES), (100, 150)).astype(np.uint8)
+        self.labels[:5, :5] = LABEL_NODATA
+        self.mask_path = os.path.join(self.tmp, "a_20240101_mask.png")
+        save_indexed_png(self.mask_path, self.labels)
+
+    def decode(self, png):
+        with Image.open(io.BytesIO(png)) as img:
+            return np.asarray(img), img.info.get("transparency")
+
+    def expected(self, z, x, y):
+        scale = 2.0 ** (self.ZOOM - z)
+        centre = (np.arange(256) + 0.5) * scale
+        cols = np.floor(x * 256 * scale + centre - self.ORIGIN[0]).astype(int)
+        rows = np.floor(y * 256 * scale + centre - self.ORIGIN[1]).astype(int)
+        out = np.full((256, 256), LABEL_NODATA, dtype=np.uint8)
+        for i, r in enumerate(rows):
+            for j, c in enumerate(cols):
+                if 0 <= r < self.labels.shape[0] and 0 <= c < self.labels.shape[1]:
+                    out[i, j] = self.labels[r, c]
+        return out
+
+    def test_native_zoom_tile_and_transparency(self):
+        indices, transparency = self.decode(overlay_tile(self.mask_path, self.ZOOM, self.ORIGIN, 10, 100, 200))
+        self.assertEqual(transparency, LABEL_NODATA)
+        np.testing.assert_array_equal(indices[20:120, 10:160], self.labels)
+        self.assertTrue((indices[:20] == LABEL_NODATA).all())
+        self.assertTrue((indices[:, 160:] == LABEL_NODATA).all())
+
+    def test_downsampled_and_upsampled_tiles(self):
+        for z, x, y in ((9, 50, 100), (8, 25, 50), (11, 200, 400), (11, 201, 400)):
+            indices, _ = self.decode(overlay_tile(self.mask_path, self.ZOOM, self.ORIGIN, z, x, y))
+            np.testing.assert_array_equal(indices, self.expected(z, x, y), (z, x, y))
+
+    def test_tile_outside_analysis_is_empty(self):
+        self.assertEqual(overlay_tile(self.mask_path, self.ZOOM, self.ORIGIN, 10, 50, 50), empty_overlay_tile())
+        with Image.open(io.BytesIO(empty_overlay_tile())) as img:
+            self.assertEqual(img.size, (256, 256))
+            self.assertEqual(img.getextrema()[1], (0, 0))
+
+
+class FixIsolatedSealakeTests(SimpleTestCase):
+    def reference(self, pred_grid, raw_probs, isolation_threshold=2, min_forest_prob=0.15):
+        sealake, forest = CLASS_NAMES.index("SeaLake"), CLASS_NAMES.index("Forest")
+        h, w = pred_grid.shape
+        out = pred_grid.copy()
+        for y in range(h):
+            for x in range(w):
+                if pred_grid[y, x] != sealake:
+                    continue
+                window = pred_grid[max(0, y - 1):y + 2, max(0, x - 1):x + 2]
+                if np.sum(window == sealake) - 1 <= isolation_threshold and raw_probs[y, x, forest] >= min_forest_prob:
+                    out[y, x] = forest
+        return out
+
+    def test_matches_per_tile_loop(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            h, w = rng.integers(1, 30, 2)
+            grid = rng.choice([-1, 1, 2, 9, 9, 9], size=(h, w))
+            conf = rng.random((h, w))
+            probs = rng.random((h, w, len(CLASS_NAMES)))
+            fixed, changes = fix_isolated_sealake(grid, conf, probs, CLASS_NAMES)
+            np.testing.assert_array_equal(fixed, self.reference(grid, probs))
+            ys, xs = np.nonzero(fixed != grid)
+            self.assertEqual(list(zip(changes["y"], changes["x"])), list(zip(ys, xs)))
+            np.testing.assert_allclose(changes["sealake_confidence"], conf[ys, xs], rtol=1e-6)
+
+
+class SmoothPredictionsTests(TempDirTestCase):
+    def reference(self, pred_grid, conf_grid, global_prob, thresh, neighborhood):
+        h, w = pred_grid.shape
+        r = neighborhood // 2
+        out = pred_grid.copy()
+        records = []
+        for y in range(h):
+            for x in range(w):
+                cls = pred_grid[y, x]
+                if cls == -1 or conf_grid[y, x] >= thresh:
+                    continue
+                window = pred_grid[max(0, y - r):y + r + 1, max(0, x - r):x + r + 1].ravel()
+                majority = np.bincount(window[window >= 0]).argmax()
+                local = conf_grid[y, x] * global_prob[cls] * CLASS_PRIORITY.get(CLASS_NAMES[cls], 1.0)
+                neigh = global_prob[majority] * CLASS_PRIORITY.get(CLASS_NAMES[majority], 1.0)
+                if neigh > local:
+                    out[y, x] = majority
+                    records.append(((y, x), CLASS_NAMES[cls], CLASS_NAMES[majority]))
+        return out, records
+
+    def test_matches_per_tile_loop(self):
+        rng = np.random.default_rng(1)
+        for neighborhood in (3, 5):
+            for _ in range(10):
+                h, w = rng.integers(1, 25, 2)
+                grid = rng.choice(np.arange(-1, len(CLASS_NAMES)), size=(h, w))
+                conf = rng.random((h, w))
+                global_prob = rng.random(len(CLASS_NAMES))
+                smoothed, change_log = quiet(smooth_predictions, grid, conf, global_prob, 0.6, neighborhood)
+                expected, expected_records = self.reference(grid, conf, global_prob, 0.6, neighborhood)
+                np.testing.assert_array_equal(smoothed, expected)
+                records = change_log_to_records(change_log)
+                self.assertEqual([(r["tile"], r["from"], r["to"]) for r in records], expected_records)
+
+    def test_no_candidates(self):
+        grid = np.zeros((3, 3), dtype=np.int64)
+        smoothed, change_log = quiet(smooth_predictions, grid, np.ones((3, 3)), np.ones(10) / 10, 0.6, 3)
+        np.testing.assert_array_equal(smoothed, grid)
+        self.assertEqual(len(change_log), 0)
+
+    def test_change_log_npz_round_trip(self):
+        rng = np.random.default_rng(2)
+        grid = rng.integers(0, len(CLASS_NAMES), (20, 20))
+        _, change_log = quiet(smooth_predictions, grid, rng.random((20, 20)), rng.random(10), 0.6, 3)
+        path = save_change_log(os.path.join(self.tmp, "log.npz"), change_log)
+        loaded = load_change_log(path)
+        self.assertEqual(change_log_to_records(loaded["smoothing"]), change_log_to_records(change_log))
+        self.assertIsNone(loaded["sealake"])
+        self.assertEqual(loaded["class_names"], CLASS_NAMES)
+
+
+class BoundaryAnalysisTests(SimpleTestCase):
+    def reference(self, mask_idx, class_names):
+        """poprzednia petla: pary (y, x)-(y, x+1) i (y, x)-(y+1, x) dla y < h-1, x < w-1"""
+        h, w = mask_idx.shape
+        adjacency = {c: {c2: 0 for c2 in class_names} for c in class_names}
+        for y in range(h - 1):
+            for x in range(w - 1):
+                for c1, c2 in ((mask_idx[y, x], mask_idx[y, x + 1]), (mask_idx[y, x], mask_idx[y + 1, x])):
+                    if c1 != c2 and c1 >= 0 and c2 >= 0:
+                        adjacency[class_names[c1]][class_names[c2]] += 1
+                        adjacency[class_names[c2]][class_names[c1]] += 1
+        total = sum(sum(v.values()) for v in adjacency.values())
+        return {c: {c2: n / total if total else 0 for c2, n in row.items()} for c, row in adjacency.items()}
+
+    def test_matches_pixel_loop(self):
+        rng = np.random.default_rng(3)
+        palette = np.array([COLORS[c] for c in CLASS_NAMES] + [(7, 7, 7)], dtype=np.uint8)
+        for shape in ((1, 1), (2, 5), (17, 23), (40, 31)):
+            # ostatni kolor spoza palety -> brak klasy
+            mask_idx = rng.integers(0, len(CLASS_NAMES) + 1, shape)
+            mask = palette[mask_idx]
+            mask_idx[mask_idx == len(CLASS_NAMES)] = -1
+            result = compute_boundary_analysis(mask, CLASS_NAMES)
+            expected = self.reference(mask_idx, CLASS_NAMES)
+            for c in CLASS_NAMES:
+                for c2 in CLASS_NAMES:
+                    self.assertAlmostEqual(result[c][c2], expected[c][c2], msg=(shape, c, c2))
+
+
+class GridStatsTests(SimpleTestCase):
+    def test_grid_equals_pixel_stats_with_partial_tiles(self):
+        rng = np.random.default_rng(5)
+        for tile_size in (1, 3, 8):
+            for _ in range(8):
+                gh, gw = rng.integers(1, 10, 2)
+                # czesciowe kafelki na brzegu (pomijane przez klasyfikator)
+                h = gh * tile_size + int(rng.integers(0, tile_size))
+                w = gw * tile_size + int(rng.integers(0, tile_size))
+                grid = rng.choice(np.arange(-1, len(CLASS_NAMES)), size=(gh, gw))
+                labels = np.full((h, w), LABEL_NODATA, dtype=np.uint8)
+                valid = np.zeros((h, w), dtype=np.uint8)
+                tiles = np.repeat(np.repeat(grid, tile_size, axis=0), tile_size, axis=1)
+                inside = tiles >= 0
+                labels[:gh * tile_size, :gw * tile_size][inside] = tiles[inside]
+                valid[:gh * tile_size, :gw * tile_size][inside] = 255
+                expected = quiet(compute_label_stats, labels, CLASS_NAMES, valid, 10, BOUNDS)
+                result = quiet(compute_grid_stats, grid, tile_size, (h, w), CLASS_NAMES, 10, BOUNDS)
+                assert_stats_close(self, expected, result)
+
+
+class RowAreaTests(SimpleTestCase):
+    def test_default_origin_is_bounds_north_west(self):
+        origin = lonlat_to_pixel(BOUNDS[0], BOUNDS[3], 10)
+        np.testing.assert_array_equal(pixel_row_areas_km2(10, BOUNDS, 50),
+                                      pixel_row_areas_km2(10, BOUNDS, 50, origin_px=origin))
+
+    def test_crop_and_padded_mosaic_give_same_areas(self):
+        rng = np.random.default_rng(9)
+        mosaic_origin = (280 * 256, 170 * 256)
+        crop = rng.integers(0, len(CLASS_NAMES), (60, 80)).astype(np.uint8)
+        # pelna mozaika kafelkow: crop w srodku, reszta bez klasy
+        mosaic = np.full((256, 256), LABEL_NODATA, dtype=np.uint8)
+        mosaic[100:160, 30:110] = crop
+        full = quiet(compute_label_stats, mosaic, CLASS_NAMES, None, 10, BOUNDS, origin_px=mosaic_origin)
+        cropped = quiet(compute_label_stats, crop, CLASS_NAMES, None, 10, BOUNDS,
+                        origin_px=(mosaic_origin[0] + 30, mosaic_origin[1] + 100))
+        for c in CLASS_NAMES:
+            self.assertAlmostEqual(full["areas_sq_km"][c], cropped["areas_sq_km"][c])
+        # wiersz 100 mozaiki blizej rownika niz jej gorny wiersz -> wiekszy piksel w km2
+        self.assertGreater(pixel_row_areas_km2(10, BOUNDS, 1, origin_px=(0, mosaic_origin[1] + 100))[0],
+                        pixel_row_areas_km2(10, BOUNDS, 1, origin_px=(0, mosaic_origin[1]))[0])
+
+
+class StatsAccumulatorTests(SimpleTestCase):
+    def test_merged_strips_equal_whole_raster(self):
+        rng = np.random.default_rng(11)
+        values = np.r_[np.arange(len(CLASS_NAMES)), LABEL_NODATA].astype(np.uint8)
+        p = [0.35, 0.35] + [0.03] * 8 + [0.06]
+        for zoom, bounds in ((None, None), (10, BOUNDS)):
+            for _ in range(10):
+                h, w = rng.integers(2, 40, 2)
+                labels = rng.choice(values, size=(h, w), p=p).astype(np.uint8)
+                valid = ((labels != LABEL_NODATA) * 255).astype(np.uint8)
+                conf = rng.random((h, w))
+                edges = [0, *sorted(set(rng.integers(1, h, size=3).tolist())), h]
+                strips = [
+                    StatsAccumulator.from_strip(labels[a:b], CLASS_NAMES, a, valid[a:b], conf[a:b], zoom, bounds)
+                    for a, b in zip(edges[:-1], edges[1:])
+                ]
+                # dowolne grupowanie sasiednich pasow
+                if len(strips) > 2:
+                    strips = [strips[0], strips[1].merge(strips[2]), *strips[3:]]
+                expected = quiet(compute_label_stats, labels, CLASS_NAMES, valid, zoom, bounds)
+                result = quiet(merge_accumulators(strips).finalize)
+                assert_stats_close(self, expected, {k: result[k] for k in expected})
+                self.assertAlmostEqual(result["mean_confidence"], conf[labels < len(CLASS_NAMES)].mean())
+
+
+class ArtifactWriterTests(SimpleTestCase):
+    def test_status_pending_then_ready(self):
+        release = threading.Event()
+        statuses = []
+        waited = []
+        key = f"writer-ok-{time.monotonic_ns()}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            future = submit_artifacts(key, release.wait, statuses.append)
+            # zapis czeka -> job widoczny, status jeszcze nie ustawiony
+            self.assertIs(artifacts_job(key), future)
+            waiter = threading.Thread(target=lambda: waited.append(wait_for_artifacts(key, timeout=5)))
+            waiter.start()
+            self.assertEqual(statuses, [])
+            release.set()
+            waiter.join(5)
+            self.assertEqual(future.result(timeout=5), ARTIFACTS_READY)
+        self.assertEqual(waited, [ARTIFACTS_READY])
+        self.assertEqual(statuses, [ARTIFACTS_READY])
+        # po zakonczeniu job znika z rejestru (done callback)
+        for _ in range(100):
+            if artifacts_job(key) is None:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(artifacts_job(key))
+        self.assertIsNone(wait_for_artifacts(key))
+
+    def test_exception_marks_failed(self):
+        statuses = []
+
+        def boom():
+            raise OSError("disk full")
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            future = submit_artifacts(f"writer-fail-{time.monotonic_ns()}", boom, statuses.append)
+            self.assertEqual(future.result(timeout=5), ARTIFACTS_FAILED)
+        self.assertEqual(statuses, [ARTIFACTS_FAILED])
+
+
+class LandcoverFeaturesTests(SimpleTestCase):
+    zoom, origin = 12, (1_160_000, 710_000)
+
+    def features(self, grid, cell_size, **kwargs):
+        return quiet(lambda: list(landcover_features(grid, cell_size, self.zoom, self.origin, CLASS_NAMES, **kwargs)))
+
+    def area_in_cells(self, geometry, cell_size):
+        # lon/lat -> komorki siatki (odwrotnosc Web Mercator)
+        world_px = 256 * 2 ** self.zoom
+
+        def to_cells(coords):
+            x = (coords[:, 0] + 180.0) / 360.0 * world_px
+            y = (1 - np.arcsinh(np.tan(np.radians(coords[:, 1]))) / np.pi) / 2 * world_px
+            return (np.column_stack([x, y]) - self.origin) / cell_size
+
+        return shapely.area(shapely.transform(geometry, to_cells))
+
+    def test_area_equals_cell_count(self):
+        grid = np.random.default_rng(3).choice([0, 1, 2, LABEL_NODATA], size=(40, 50)).astype(np.uint8)
+        features = self.features(grid, 4)
+        for k in range(3):
+            cells = sum(f["properties"]["cells"] for f in features if f["properties"]["class_index"] == k)
+            self.assertEqual(cells, int((grid == k).sum()))
+        for feature in features:
+            cells = feature["properties"]["cells"]
+            self.assertAlmostEqual(self.area_in_cells(feature["geometry"], 4), cells, delta=0.01 * cells)
+
+    def test_large_grid_sampled(self):
+        grid = np.random.default_rng(5).choice([0, 1, LABEL_NODATA], size=(61, 83)).astype(np.uint8)
+        features = self.features(grid, 2, max_cells=1000)
+        # 61*83 > 1000 -> co 3. komorka, niepelne komorki na koncu obciete
+        sampled = grid[:60:3, :81:3]
+        for k in range(2):
+            cells = sum(f["properties"]["cells"] for f in features if f["properties"]["class_index"] == k)
+            self.assertEqual(cells, int((sampled == k).sum()))
+        for feature in features:
+            cells = feature["properties"]["cells"]
+            self.assertAlmostEqual(self.area_in_cells(feature["geometry"], 6), cells, delta=0.01 * cells)
+
+
+class MBTilesPoolTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, "src.mbtiles")
+        write_mbtiles(self.path, {(3, 2, 1): solid_tile((10, 20, 30), 8), (5, 0, 0): solid_tile((0, 0, 0), 8)})
+
+    def test_connections_reused(self):
+        pool = MBTilesPool(self.path)
+        try:
+            for _ in range(3):
+                pool.max_zoom()
+            stats = pool.stats()
+            self.assertEqual((stats["opened"], stats["reused"], stats["idle"], stats["in_use"]), (1, 2, 1, 0))
+            self.assertEqual(stats["queries"], 3)
+        finally:
+            pool.close()
+
+    def test_tile_and_max_zoom(self):
+        pool = MBTilesPool(self.path)
+        try:
+            # tile_row w adresacji TMS
+            blob = pool.tile(3, 2, (1 << 3) - 1 - 1)
+            self.assertEqual(cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_COLOR)[0, 0].tolist(), [10, 20, 30])
+            self.assertIsNone(pool.tile(3, 2, 1))
+            self.assertEqual(pool.max_zoom(), 5)
+        finally:
+            pool.close()
+
+    def test_extra_connections_closed(self):
+        pool = MBTilesPool(self.path, max_idle=1)
+        try:
+            with pool.connection(), pool.connection():
+                self.assertEqual(pool.stats()["in_use"], 2)
+            stats = pool.stats()
+            self.assertEqual((stats["opened"], stats["closed"], stats["idle"]), (2, 1, 1))
+        finally:
+            pool.close()
+
+    def test_shared_per_path_until_replaced(self):
+        pool = mbtiles_pool(self.path)
+        self.assertIs(mbtiles_pool(os.path.join(self.tmp, ".", "src.mbtiles")), pool)
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 10 ** 9))
+        self.assertIsNot(mbtiles_pool(self.path), pool)
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            MBTilesPool(os.path.join(self.tmp, "none.mbtiles")).max_zoom()
+
+
+class ConditionalFileResponseTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, "mask.png")
+        with open(self.path, "wb") as f:
+            f.write(b"\x89PNG" + b"0" * 64)
+        self.factory = RequestFactory()
+
+    def test_etag_then_not_modified(self):
+        response = conditional_file_response(self.factory.get("/"), self.path, "image/png")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        response.close()
+
+        request = self.factory.get("/", HTTP_IF_NONE_MATCH=etag)
+        response = conditional_file_response(request, self.path, "image/png")
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_changed_file_new_etag(self):
+        first = file_etag(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"1")
+        self.assertNotEqual(file_etag(self.path), first)
+        self.assertNotEqual(file_etag(self.path, 3, 1, 2), file_etag(self.path, 3, 2, 1))
+
+    def test_missing_mbtiles_no_tile_etag(self):
+        self.assertIsNone(tile_etag(os.path.join(self.tmp, "none.mbtiles"), 1, 0, 0))
+
+
+class ExtractWindowArrayTests(TempDirTestCase):
+    ZOOM = 3
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, "synthetic.mbtiles")
+        # (4, 3) brakuje -> czarny
+        write_mbtiles(self.path, {
+            (self.ZOOM, x, y): solid_tile(self.color(x, y))
+            for x in range(2, 5) for y in range(1, 4) if (x, y) != (4, 3)
+        })
+
+    @staticmethod
+    def color(x, y):
+        return (x * 40, y * 60, 200)
+
+    def extract(self, window):
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            image = extract_window_array(self.path, self.ZOOM, window)
+        return image, log.getvalue()
+
+    def test_window_across_tiles(self):
+        window = (2 * 256 + 100, 1 * 256 + 50, 4 * 256 + 30, 3 * 256 + 20)
+        image, _ = self.extract(window)
+        self.assertEqual(image.shape, (window[3] - window[1], window[2] - window[0], 3))
+
+        left, top = window[:2]
+        for x in range(2, 5):
+            for y in range(1, 4):
+                x0, y0 = max(x * 256, window[0]) - left, max(y * 256, window[1]) - top
+                x1, y1 = min((x + 1) * 256, window[2]) - left - 1, min((y + 1) * 256, window[3]) - top - 1
+                expected = [0, 0, 0] if (x, y) == (4, 3) else list(self.color(x, y))
+                self.assertEqual(image[y0, x0].tolist(), expected, (x, y))
+                self.assertEqual(image[y1, x1].tolist(), expected, (x, y))
+
+    def test_second_read_from_cache(self):
+        window = (2 * 256, 256, 3 * 256 + 10, 2 * 256)
+        first, first_log = self.extract(window)
+        second, second_log = self.extract(window)
+        np.testing.assert_array_equal(first, second)
+        self.assertIn("(0 cached, 2 queried)", first_log)
+        self.assertIn("(2 cached, 0 queried)", second_log)
+
+
+class MaskCropWindowTests(SimpleTestCase):
+    def test_matches_full_mask_crop(self):
+        bounds = [19.5, 49.8, 20.6, 50.4]
+        image_shape = (600, 900, 3)
+        geometries = [
+            shapely.MultiPolygon([
+                shapely.Polygon([(19.6, 49.85), (20.5, 49.9), (20.3, 50.35), (19.7, 50.2)],
+                                [[(19.9, 50.0), (20.1, 50.0), (20.0, 50.1)]]),
+                shapely.box(20.45, 50.3, 20.7, 50.5),
+            ]),
+            # wieksza niz bounds -> okno przyciete do obrazu
+            shapely.box(19.4, 49.7, 20.7, 50.5),
+        ]
+        image = np.random.default_rng(2).integers(0, 255, image_shape, dtype=np.uint8)
+        for geometry in geometries:
+            mask = create_mask_from_geometry(image_shape, geometry, bounds, 12)
+            _, expected_mask, expected_offset = crop_array_by_mask(image, mask)
+            crop_mask, offset = mask_crop_window(image_shape, geometry, bounds)
+            self.assertEqual(offset, expected_offset)
+            np.testing.assert_array_equal(crop_mask, expected_mask)
+
+    def test_outside_bounds(self):
+        with self.assertRaises(ValueError):
+            mask_crop_window((100, 100), shapely.box(30.0, 60.0, 31.0, 61.0), [19.5, 49.8, 20.6, 50.4])
+
+
+class WindowedMosaicTests(TempDirTestCase):
+    ZOOM = 3
+    BBOX = [-80.0, 10.0, -10.0, 60.0]
+
+    def test_window_equals_mosaic_crop(self):
+        rng = np.random.default_rng(8)
+        path = os.path.join(self.tmp, "noise.mbtiles")
+        # szum (PNG bezstratny) -> porownanie co do piksela; kafelek (3, 3) brakuje
+        write_mbtiles(path, {
+            (self.ZOOM, x, y): rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)
+            for x in range(2, 4) for y in range(1, 4) if (x, y) != (3, 3)
+        })
+        mosaic = quiet(extract_tiles_array, path, self.BBOX, self.ZOOM)
+        left, top, right, bottom = bbox_mosaic_window(self.BBOX, self.ZOOM)
+        self.assertEqual(mosaic.shape[:2], (bottom - top, right - left))
+        np.testing.assert_array_equal(
+            quiet(extract_tiles_array, path, self.BBOX, self.ZOOM, cropped=True),
+            crop_array_to_bbox(mosaic, self.BBOX, self.ZOOM),
+        )
+        for window in [(left + 100, top + 30, right - 40, bottom - 200), (left + 256, top, left + 257, bottom)]:
+            image = quiet(extract_window_array, path, self.ZOOM, window)
+            expected = mosaic[window[1] - top:window[3] - top, window[0] - left:window[2] - left]
+            np.testing.assert_array_equal(image, expected, str(window))
+
+
+@unittest.skipUnless(geotiff_available(), "rasterio not installed")
+class GeoTiffExportTests(TempDirTestCase):
+    zoom = 10
+
+    def test_labels_round_trip_georeferenced(self):
+        import rasterio
+        from rasterio.warp import transform
+
+        rng = np.random.default_rng(4)
+        labels = rng.choice([0, 1, 2, LABEL_NODATA], size=(520, 600)).astype(np.uint8)
+        origin = lonlat_to_pixel(BOUNDS[0], BOUNDS[3], self.zoom)
+        path = quiet(export_label_geotiff, os.path.join(self.tmp, "labels.tif"), labels, self.zoom, origin, CLASS_NAMES)
+
+        with rasterio.open(path) as src:
+            np.testing.assert_array_equal(src.read(1), labels)
+            self.assertEqual(src.crs.to_epsg(), 3857)
+            self.assertEqual(src.nodata, LABEL_NODATA)
+            self.assertEqual(src.block_shapes[0], (256, 256))
+            self.assertEqual(src.overviews(1), [2])
+            # lewy gorny naroznik = origin w globalnej siatce pikseli
+            lon, lat = transform(src.crs, "EPSG:4326", [src.transform.c], [src.transform.f])
+            self.assertEqual(lonlat_to_pixel(lon[0], lat[0], self.zoom), tuple(origin))
+        np.testing.assert_array_equal(read_geotiff_window(path, 300, 100, 50, 40), labels[100:140, 300:350])
+
+    def test_confidence_nan_nodata(self):
+        import rasterio
+
+        confidence = np.random.default_rng(6).random((300, 300)).astype(np.float32)
+        confidence[:10] = np.nan
+        path = quiet(export_confidence_geotiff, os.path.join(self.tmp, "conf.tif"), confidence, self.zoom, (0, 0))
+        with rasterio.open(path) as src:
+            np.testing.assert_array_equal(src.read(1), confidence)
+            self.assertTrue(np.isnan(src.nodata))
+
+
+class InMemoryCropTests(TempDirTestCase):
+    zoom = 12
+
+    def test_array_crop_matches_jpeg_crop(self):
+        bbox = [19.9, 50.0, 20.1, 50.1]
+        left, top, right, bottom = bbox_mosaic_window(bbox, self.zoom)
+        mosaic = np.random.default_rng(9).integers(0, 255, (bottom - top, right - left, 3), dtype=np.uint8)
+        mosaic = cv2.GaussianBlur(mosaic, (0, 0), 3)
+        stitched = os.path.join(self.tmp, "stitched.jpg")
+        write_display_jpeg(stitched, mosaic)
+
+        cropped = crop_array_to_bbox(mosaic, bbox, self.zoom)
+        self.assertTrue(np.shares_memory(cropped, mosaic))
+        from_file = cv2.imread(quiet(crop_to_bbox, stitched, bbox, self.zoom))
+        self.assertEqual(from_file.shape, cropped.shape)
+        # JPEG dwa razy -> tylko blad kompresji
+        self.assertLess(np.abs(from_file.astype(int) - cropped).mean(), 3)
+
+        # origin wycietego obrazu = naroznik mozaiki + offset wyciecia
+        crop_left, crop_top, _, _ = bbox_crop_window(bbox, self.zoom)
+        self.assertEqual(bbox_pixel_origin(bbox, self.zoom, cropped=True), (left + crop_left, top + crop_top))
+        np.testing.assert_array_equal(cropped[0, 0], mosaic[crop_top, crop_left])
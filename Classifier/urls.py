@@ -6,9 +6,15 @@ urlpatterns = [
     path('analyze-bbox/', views.analyze_bbox, name='analyze_bbox'),
     path('', views.map_page, name='map_page'),
     path('tiles/<int:z>/<int:x>/<int:y>.jpg', views.tile_from_mbtiles, name='tile'),
+    path('classify_tiles/<int:z>/<int:x>/<int:y>.png', views.classify_tile, name='classify_tile'),
+    path('api/tile-stats/', views.tile_stats, name='tile_stats'),
     # path('analyze_area/', views.analyze_area, name='analyze_area'),
     # path('city/<str:city_name>/', views.city, name='city_statistics'),
     path("analysis/<int:analysis_id>/stats/", views.get_analysis_stats, name="get_analysis_stats"),
+    path("analysis/<int:analysis_id>/overlay/<int:z>/<int:x>/<int:y>.png", views.analysis_overlay_tile,
+         name="analysis_overlay_tile"),
+    path("analysis/<str:analysis_type>/<int:analysis_id>/overlay/<int:z>/<int:x>/<int:y>.png",
+         views.analysis_overlay_tile, name="analysis_overlay_tile_typed"),
     path("city_tiles/<str:city>/<int:z>/<int:x>/<int:y>.jpg", views.city_tile_from_mbtiles, name="city_tile"),
 
     # newwww
@@ -25,10 +31,18 @@ urlpatterns = [
     path('analysis-preview/<str:analysis_type>/<int:analysis_id>/',
            views.get_analysis_preview,
            name='analysis_preview'),
+    path('analysis-residential/<str:analysis_type>/<int:analysis_id>/',
+           views.get_analysis_residential,
+           name='analysis_residential'),
     path('download-analysis/<str:analysis_type>/<int:analysis_id>/<str:file_type>/',
            views.download_analysis_file,
            name='download_analysis_file'),
+    path('analysis-change-log/<str:analysis_type>/<int:analysis_id>/',
+           views.get_analysis_change_log,
+           name='analysis_change_log'),
     path('wojewodztwo/<int:analysis_id>/download/<str:image_type>/', views.download_wojewodztwo_image,
                  name='download_wojewodztwo_image'),
+    path('wojewodztwo/<int:analysis_id>/boundary.svg', views.wojewodztwo_boundary_overlay,
+                 name='wojewodztwo_boundary'),
     # path('wojewodztwo/<str:wojewodztwo_name>/', views.analyze_wojewodztwo, name='analyze_wojewodztwo'),
               ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
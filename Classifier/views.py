@@ -2,21 +2,56 @@
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.http import HttpResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 import base64
-import sqlite3
+import time
+from functools import lru_cache
+from django.db import connection
 
 from Classifier.src.utils.convert import to_serializable
-from Classifier.src.utils.mbtiles_extract import extract_tiles_from_mbtiles, crop_to_bbox
+from Classifier.src.utils.mbtiles_extract import (
+    bbox_mosaic_window, extract_tiles_array, extract_tiles_from_mbtiles, extract_window_array,
+    write_display_jpeg
+)
+from Classifier.src.utils.change_log import load_change_log, change_log_to_records, sealake_changes_to_records
 from Classifier.models import Analysis, WojewodztwoAnalysis
+from Classifier.src.postprocess import create_boundary_overlay
+from Classifier.src.artifacts import (
+    blended_artifact, geotiff_artifact, landcover_artifact, residential_artifact, thumbnail_artifact
+)
+from Classifier.src.export import geotiff_available
+from Classifier.src.overlay import overlay_tile
+from Classifier.src.live import live_tile
+from Classifier.src.config import DEFAULT_CONFIG
+from Classifier.src.postprocess import boundary_crop_offset
+from Classifier.src.utils.mbtiles_extract import bbox_pixel_origin
+from Classifier.src.utils.http_cache import (
+    ARTIFACT_MAX_AGE, TILE_MAX_AGE, conditional_file_response, file_etag, tile_etag
+)
+from Classifier.src.utils.mbtiles_pool import mbtiles_pool, mbtiles_pool_stats
+from Classifier.src.utils.tile_cache import cached_tile, configure_tile_cache, tile_cache, TILE_CACHE_BYTES
+from Classifier.src.writer import (
+    ARTIFACTS_PENDING, ARTIFACTS_FAILED, artifacts_job, submit_artifacts, wait_for_artifacts
+)
 from Classifier.src.stats import *
 from Classifier.src.utils.wojewodztwo_processor import *
 from src.utils.cache_key import make_cache_key
 from src.pipeline import run_analysis
 
+# wspolny cache kafelkow procesu (TILE_CACHE_DIR: katalog dzielony przez workery)
+configure_tile_cache(
+    getattr(settings, "TILE_CACHE_BYTES", TILE_CACHE_BYTES),
+    getattr(settings, "TILE_CACHE_DIR", None)
+)
+
 def map_page(request):
     return render(request, 'map_analyze.html')
 
@@ -56,38 +91,39 @@ def analyze_bbox(request):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         stitched_path = os.path.join(settings.MEDIA_ROOT, f"Classifier/outputs/stitched/area_{timestamp}.jpg")
 
-        stitched_path = extract_tiles_from_mbtiles(
-            mbtiles_path=mbtiles_path,
-            bbox=bbox,
-            zoom=zoom,
-            output_path=stitched_path
-        )
-
-        if not os.path.exists(stitched_path):
-            return JsonResponse({"error": "Failed to stitch area from MBTiles"}, status=500)
-
+        # tylko piksele bbox (okno liczone przed pobraniem kafelkow) -> klasyfikacja bez JPEG pomiedzy
+        image = extract_tiles_array(mbtiles_path=mbtiles_path, bbox=bbox, zoom=zoom, cropped=mode == "cropped")
         if mode == "cropped":
-            cropped_path = crop_to_bbox(stitched_path, bbox, zoom)
+            cropped_path = os.path.splitext(stitched_path)[0] + "_cropped.jpg"
         else:
             cropped_path = stitched_path
 
+        # JPEG tylko do podgladu / artefaktow (blended, residential)
+        original_jpeg = write_display_jpeg(cropped_path, image)
+
         stats, outputs = run_analysis(
             image_path=cropped_path,
+            image=image,
             model_path=model_path,
             options={
                 **params,
                 'zoom': zoom,
-                'bounds': bbox
+                'bounds': bbox,
+                # gorny wiersz obrazu: rog bbox (cropped) albo pierwszego kafelka (pelna mozaika)
+                'origin_px': bbox_pixel_origin(bbox, zoom, cropped=mode == "cropped"),
+                'ASYNC_OUTPUTS': True
             }
         )
 
         mask_path = outputs.get("mask_path") or outputs.get("mask")
         blended_path = outputs.get("blended_path") or outputs.get("blended")
+        artifacts_status = outputs.get("artifacts_status")
 
         if isinstance(mask_path, list):
             mask_path = mask_path[0] if mask_path else None
 
-        if not mask_path or not isinstance(mask_path, (str, bytes, os.PathLike)) or not os.path.exists(mask_path):
+        if not mask_path or not isinstance(mask_path, (str, bytes, os.PathLike)) or \
+                (artifacts_status != ARTIFACTS_PENDING and not os.path.exists(mask_path)):
             print("[WARN] No valid mask_path:", mask_path)
             mask_path = None
 
@@ -107,29 +143,20 @@ def analyze_bbox(request):
             bbox_miny=bbox[1],
             bbox_maxx=bbox[2],
             bbox_maxy=bbox[3],
-            cache_key=cache_key
+            cache_key=cache_key,
+            artifacts_status=artifacts_status
         )
+        queue_analysis_artifacts(a, outputs)
 
         # preview_path = outputs.get("fig") or mask_path or preview_overlay_path
         # img_b64 = None
         # if preview_path and os.path.exists(preview_path):
         #     with open(preview_path, "rb") as f:
         #         img_b64 = base64.b64encode(f.read()).decode("utf-8")
-        original_image_b64 = None
-        mask_image_b64 = None
-        blended_image_b64 = None
-
-        if cropped_path and os.path.exists(cropped_path):
-            with open(cropped_path, "rb") as f:
-                original_image_b64 = base64.b64encode(f.read()).decode("utf-8")
+        original_image_b64 = base64.b64encode(original_jpeg).decode("utf-8")
 
-        if mask_path and os.path.exists(mask_path):
-            with open(mask_path, "rb") as f:
-                mask_image_b64 = base64.b64encode(f.read()).decode("utf-8")
-
-        if blended_path and os.path.exists(blended_path):
-            with open(blended_path, "rb") as f:
-                blended_image_b64 = base64.b64encode(f.read()).decode("utf-8")
+        # maska/blended zapisywane w tle -> URL (preview czeka na writer)
+        preview_url = reverse("analysis_preview", args=["bbox", a.id])
 
         tabs = [
             {
@@ -159,9 +186,12 @@ def analyze_bbox(request):
             }
         ]
 
-        residential_image_b64 = outputs.get("residential_image")
+        # residential liczony na zadanie (osobny URL), tylko gdy klasa wystepuje
+        residential_url = None
+        if mask_path and stats_clean.get("areas_pct", {}).get("Residential", 0) > 0:
+            residential_url = reverse("analysis_residential", args=["bbox", a.id])
 
-        print(f"[views] Residential outputs; {residential_image_b64 is not None}")
+        print(f"[views] Residential outputs; {residential_url is not None}")
 
         return JsonResponse({
             "cached": False,
@@ -169,9 +199,11 @@ def analyze_bbox(request):
             "stats": stats_clean,
             "tabs": tabs,
             "original_image": f"data:image/jpeg;base64,{original_image_b64}" if original_image_b64 else None,
-            "mask_image": f"data:image/png;base64,{mask_image_b64}" if mask_image_b64 else None,
-            "preview_image": f"data:image/png;base64,{blended_image_b64}" if blended_image_b64 else None,
-            "residential_image": residential_image_b64,  # NEW
+            "mask_image": f"{preview_url}?image=mask" if mask_path else None,
+            "preview_image": f"{preview_url}?image=blended" if blended_path else None,
+            "artifacts_status": a.artifacts_status,
+            "residential_image": residential_url,  # NEW
+            "overlay_tiles": overlay_tiles_url(a.id),
             "paths": {
                 "original": cropped_path,
                 "mask": mask_path,
@@ -197,45 +229,195 @@ def make_bbox_cache_key(bbox, model_path, params, zoom):
     key_str = json.dumps(data, sort_keys=True)
     return hashlib.sha256(key_str.encode()).hexdigest()[:32]
 
+# max czas oczekiwania podgladu / pobrania na zapis artefaktow w tle (kafelki nie czekaja wcale)
+ARTIFACTS_WAIT_TIMEOUT = 3
+# pending dluzej niz to bez zadania writera w tym procesie -> proces writera zginal, status failed
+ARTIFACTS_STALE_AFTER = timedelta(minutes=30)
+
+
+def queue_analysis_artifacts(analysis, outputs):
+    """
+    Hands outputs["write_artifacts"] (ASYNC_OUTPUTS) + the land cover GeoJSON to the background writer,
+    the writer thread stores ready/failed in analysis.artifacts_status.
+    """
+    write_fn = outputs.pop("write_artifacts", None)
+    if write_fn is None:
+        return None
+
+    model, pk = type(analysis), analysis.pk
+
+    def write_all():
+        write_fn()
+        # GeoJSON zaraz po analizie; blad nie psuje statusu (odtwarzany przy pobraniu)
+        try:
+            landcover_artifact(analysis.mask_path, *analysis_georeference(analysis))
+        except Exception as e:
+            print(f"[WARN] Land cover GeoJSON failed for {analysis.mask_path}: {e}")
+
+    def set_status(status):
+        try:
+            model.objects.filter(pk=pk).update(artifacts_status=status)
+        finally:
+            # polaczenie watku writera
+            connection.close()
+
+    return submit_artifacts(analysis.mask_path, write_all, on_status=set_status)
+
+
+def wait_for_analysis_artifacts(analysis, timeout=ARTIFACTS_WAIT_TIMEOUT):
+    """
+    pending -> waits up to timeout for the writer job of this process, or polls the DB record
+    (writer in another worker); timeout=0 never blocks. Stale pending records are marked failed.
+    Returns the final (or still pending) status.
+    """
+    if analysis.artifacts_status != ARTIFACTS_PENDING:
+        return analysis.artifacts_status
+
+    if artifacts_job(analysis.mask_path) is None and \
+            analysis.created_at < timezone.now() - ARTIFACTS_STALE_AFTER:
+        type(analysis).objects.filter(pk=analysis.pk, artifacts_status=ARTIFACTS_PENDING) \
+            .update(artifacts_status=ARTIFACTS_FAILED)
+        print(f"[WRITER] Stale pending artifacts of {analysis.mask_path} marked failed")
+        analysis.artifacts_status = ARTIFACTS_FAILED
+        return analysis.artifacts_status
+    if timeout <= 0:
+        return analysis.artifacts_status
+
+    deadline = time.monotonic() + timeout
+    try:
+        wait_for_artifacts(analysis.mask_path, timeout=timeout)
+    except TimeoutError:
+        pass
+
+    while True:
+        analysis.refresh_from_db(fields=["artifacts_status"])
+        if analysis.artifacts_status != ARTIFACTS_PENDING or time.monotonic() >= deadline:
+            return analysis.artifacts_status
+        time.sleep(0.25)
+
+
+def analysis_image_path(analysis):
+    """image the analysis was run on (label raster has its shape)"""
+    if isinstance(analysis, WojewodztwoAnalysis):
+        return analysis.cropped_image_path
+    return analysis.image_path
+
+
+def blended_image_path(analysis):
+    """fig_path on disk, built from the stored label raster on first request (None if not possible)"""
+    if not analysis.fig_path or not analysis.mask_path or not os.path.exists(analysis.mask_path):
+        return None
+    return blended_artifact(analysis.mask_path, analysis_image_path(analysis), analysis.fig_path)
+
+
+def wojewodztwo_stitched_size(analysis):
+    """(w, h) of the stitched mosaic the crop was cut from: saved JPEG header, else from bounds"""
+    stitched = analysis.original_image_path
+    if stitched and os.path.exists(stitched):
+        from PIL import Image
+        with Image.open(stitched) as header:
+            return header.size
+    x0, y0, x1, y1 = bbox_mosaic_window(analysis.bounds, analysis.zoom)
+    return x1 - x0, y1 - y0
+
+
+def analysis_georeference(analysis):
+    """
+    (zoom, global Web Mercator pixel of the analysed image's top-left corner)
+    zapisane w metadanych analizy; starsze analizy bez origin_px -> odtwarzane z bbox / granicy
+    """
+    metadata = {}
+    if analysis.metadata_json and os.path.exists(analysis.metadata_json):
+        with open(analysis.metadata_json) as f:
+            metadata = json.load(f)
+    zoom = metadata.get("zoom")
+    origin = metadata.get("origin_px")
+    if zoom is not None and origin is not None:
+        return zoom, tuple(origin)
+
+    if isinstance(analysis, WojewodztwoAnalysis):
+        zoom = analysis.zoom
+        x0, y0 = bbox_pixel_origin(analysis.bounds, zoom, cropped=False)
+        dx, dy = boundary_crop_offset(analysis.geometry, analysis.bounds, wojewodztwo_stitched_size(analysis))
+        return zoom, (x0 + dx, y0 + dy)
+
+    if zoom is None:
+        zoom = (analysis.config or {}).get("ZOOM", 8)
+    bbox = [analysis.bbox_minx, analysis.bbox_miny, analysis.bbox_maxx, analysis.bbox_maxy]
+    cropped = (analysis.image_path or "").endswith("_cropped.jpg")
+    return zoom, bbox_pixel_origin(bbox, zoom, cropped=cropped)
+
+
+def artifacts_unavailable_response(analysis, timeout=ARTIFACTS_WAIT_TIMEOUT):
+    """None when artifacts are on disk, else 202 + Retry-After (still writing) / 500 (writer failed)"""
+    status = wait_for_analysis_artifacts(analysis, timeout=timeout)
+    if status == ARTIFACTS_PENDING:
+        response = JsonResponse({"status": status, "message": "Artifacts are still being written"}, status=202)
+        response["Retry-After"] = "2"
+        return response
+    if status == ARTIFACTS_FAILED:
+        return JsonResponse({"status": status, "error": "Writing analysis artifacts failed"}, status=500)
+    return None
+
+
+POLAND_MBTILES = os.path.join(settings.BASE_DIR, "data/raw/satellite-2017-11-02_europe_poland.mbtiles")
+
+
+def city_mbtiles_path(city):
+    """city MBTiles, else the Poland file, else None"""
+    mbtiles_path = os.path.join(settings.BASE_DIR, f"data/raw/satellite-2017-11-02_poland_{city.lower()}.mbtiles")
+    if os.path.exists(mbtiles_path):
+        return mbtiles_path
+    # optional: fallback to main file
+    return POLAND_MBTILES if os.path.exists(POLAND_MBTILES) else None
+
 
+@cache_control(public=True, max_age=TILE_MAX_AGE, immutable=True)
+@condition(etag_func=lambda request, z, x, y: tile_etag(POLAND_MBTILES, z, x, y))
 def tile_from_mbtiles(request, z, x, y):
-    mbtiles_path = "data/raw/satellite-2017-11-02_europe_poland.mbtiles"
-    conn = sqlite3.connect(mbtiles_path)
-    cur = conn.cursor()
-    cur.execute("SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", (z, x, y))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
+    tile = cached_tile(POLAND_MBTILES, z, x, y)
+    if tile is None:
         raise Http404("Tile not found")
-    return HttpResponse(row[0], content_type="image/jpeg")
+    return HttpResponse(tile, content_type="image/jpeg")
 
+def classify_tile(request, z, x, y):
+    """
+    GET /classify_tiles/<z>/<x>/<y>.png?model=<path> - live land-cover tile (same tile rows as /tiles/),
+    classified on request; concurrent tiles are batched into one predict, results kept in the tile store
+    """
+    model_path = request.GET.get("model", DEFAULT_CONFIG["MODEL_PATH"])
+    networks_dir = os.path.abspath(os.path.join(settings.BASE_DIR, "Classifier/inputs/networks"))
+    model_abs = os.path.abspath(os.path.join(settings.BASE_DIR, model_path))
+    if not model_abs.startswith(networks_dir + os.sep):
+        return HttpResponse("Invalid model", status=400)
+    if not os.path.exists(model_abs):
+        raise Http404("Model not found")
+
+    mbtiles_path = os.path.join(settings.BASE_DIR, DEFAULT_CONFIG["MAP_PATH"])
+    response = HttpResponse(live_tile(mbtiles_path, model_abs, z, x, y), content_type="image/png")
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+def tile_stats(request):
+    """GET /api/tile-stats/ - MBTiles connection pool + tile cache statistics of this process"""
+    return JsonResponse({"pools": mbtiles_pool_stats(), "cache": tile_cache().stats()})
+
+@cache_control(public=True, max_age=TILE_MAX_AGE, immutable=True)
+@condition(etag_func=lambda request, city, z, x, y: tile_etag(city_mbtiles_path(city) or "", z, x, y))
 def city_tile_from_mbtiles(request, city, z, x, y):
     """
     Serve tiles from a city-specific MBTiles file.
     Example path: data/raw/satellite-2017-11-02_poland_wroclaw.mbtiles
     """
-    mbtiles_path = os.path.join(settings.BASE_DIR, f"data/raw/satellite-2017-11-02_poland_{city.lower()}.mbtiles")
+    mbtiles_path = city_mbtiles_path(city)
+    if mbtiles_path is None:
+        raise Http404(f"No MBTiles found for {city}")
 
-    if not os.path.exists(mbtiles_path):
-        # optional: fallback to main file
-        fallback_path = os.path.join(settings.BASE_DIR, "data/raw/satellite-2017-11-02_europe_poland.mbtiles")
-        if os.path.exists(fallback_path):
-            mbtiles_path = fallback_path
-        else:
-            raise Http404(f"No MBTiles found for {city}")
-
-    conn = sqlite3.connect(mbtiles_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
-        (z, x, (1 << z) - 1 - y)
-    )
-    row = cur.fetchone()
-    conn.close()
-    if not row:
+    tile = cached_tile(mbtiles_path, z, x, (1 << z) - 1 - y)
+    if tile is None:
         raise Http404(f"Tile {z}/{x}/{y} not found for {city}")
 
-    return HttpResponse(row[0], content_type="image/jpeg")
+    return HttpResponse(tile, content_type="image/jpeg")
 
 from django.http import FileResponse
 
@@ -244,6 +426,9 @@ def get_analysis_stats(request, analysis_id):
     try:
         a = Analysis.objects.get(pk=analysis_id)
         if "download" in request.GET:
+            pending = artifacts_unavailable_response(a)
+            if pending is not None:
+                return pending
             json_path = a.stats_json or None
             if json_path and os.path.exists(json_path):
                 return FileResponse(open(json_path, "rb"), as_attachment=True, filename=f"analysis_{a.id}_stats.json")
@@ -381,43 +566,11 @@ def wojewodztwo_detail_view(request, wojewodztwo_id):
             'Poziom powiększenia': str(analysis.zoom),
         }
 
-        def get_thumb_path(original_path):
-            if not original_path:
-                return None
-            base, ext = os.path.splitext(original_path)
-            return f"{base}_thumb.jpg"
-
         def ensure_thumbnail(original_path):
             if not original_path or not os.path.exists(original_path):
                 print(f"[DEBUG] Original path missing: {original_path}")
                 return None
-
-            thumb_path = get_thumb_path(original_path)
-
-            if not os.path.exists(thumb_path):
-                try:
-                    from Classifier.src.postprocess import create_thumbnail
-                    thumb_path = create_thumbnail(original_path, max_size=(800, 800), quality=85)
-                    print(f"[DEBUG] Created thumb: {thumb_path}")
-                except Exception as e:
-                    print(f"[ERROR] Could not create thumbnail: {e}")
-                    return None
-
-            return thumb_path
-
-        boundary_image_path = None
-        if analysis.cropped_image_path and os.path.exists(analysis.cropped_image_path):
-            try:
-                from Classifier.src.postprocess import create_boundary_version
-                boundary_image_path = create_boundary_version(
-                    cropped_image_path=analysis.cropped_image_path,
-                    geometry=wojewodztwo['geometry'],
-                    bounds=wojewodztwo['bounds'],
-                    zoom=analysis.zoom
-                )
-                print(f"[DEBUG] b image: {boundary_image_path}")
-            except Exception as e:
-                boundary_image_path = analysis.cropped_image_path
+            return thumbnail_artifact(original_path, max_size=(800, 800), quality=85)
 
         image_data = {
             'has_original': False,
@@ -425,7 +578,11 @@ def wojewodztwo_detail_view(request, wojewodztwo_id):
             'has_blended': False,
         }
 
-        display_image = boundary_image_path or analysis.cropped_image_path
+        # granica jako cache'owany SVG nakladany przez frontend (bez ponownego kodowania JPEG)
+        if analysis.cropped_image_path and os.path.exists(analysis.cropped_image_path):
+            image_data['boundary_url'] = reverse("wojewodztwo_boundary", args=[analysis.id])
+
+        display_image = analysis.cropped_image_path
 
         if display_image and os.path.exists(display_image):
             image_data['has_original'] = True
@@ -451,9 +608,10 @@ def wojewodztwo_detail_view(request, wojewodztwo_id):
                 except Exception as e:
                     print(f"[ERROR] Failed to read mask thumb: {e}")
 
-        if analysis.fig_path and os.path.exists(analysis.fig_path):
+        blended_path = blended_image_path(analysis)
+        if blended_path:
             image_data['has_blended'] = True
-            thumb_path = ensure_thumbnail(analysis.fig_path)
+            thumb_path = ensure_thumbnail(blended_path)
 
             if thumb_path and os.path.exists(thumb_path):
                 try:
@@ -593,89 +751,59 @@ def analyze_wojewodztwo(request):
             f"{wojewodztwo_slug}_zoom{zoom}_cropped_mask.png"
         )
 
-        if os.path.exists(base_cropped_path) and os.path.exists(base_mask_path):
-            print(f"[INFO] cropp debug stitched missing {zoom}")
-            cropped_path = base_cropped_path
-            cropped_mask = cv2.imread(base_mask_path, cv2.IMREAD_GRAYSCALE)
-
-            stitched_path = cropped_path.replace("_cropped.jpg", "_stitched.jpg")
-            if not os.path.exists(stitched_path):
-                print(f"[INFO]+ stitched")
-                conn = sqlite3.connect(mbtiles_path)
-                cur = conn.cursor()
-                cur.execute("SELECT MAX(zoom_level) FROM tiles")
-                max_zoom_result = cur.fetchone()
-                conn.close()
-                max_available_zoom = max_zoom_result[0] if max_zoom_result and max_zoom_result[0] else 13
-                actual_zoom = min(zoom, max_available_zoom)
-
-                bbox = wojewodztwo['bounds']
-                stitched_path = os.path.join(
-                    output_base,
-                    f"{wojewodztwo_slug}_zoom{actual_zoom}_stitched.jpg"
-                )
-                stitched_path = extract_tiles_from_mbtiles(
-                    mbtiles_path=mbtiles_path,
-                    bbox=bbox,
-                    zoom=actual_zoom,
-                    output_path=stitched_path
-                )
-        else:
-            print(f"[INFO] Creating new cropped image for zoom {zoom}")
-            conn = sqlite3.connect(mbtiles_path)
-            cur = conn.cursor()
-            cur.execute("SELECT MAX(zoom_level) FROM tiles")
-            max_zoom_result = cur.fetchone()
-            conn.close()
-
-            max_available_zoom = max_zoom_result[0] if max_zoom_result and max_zoom_result[0] else 13
-            actual_zoom = min(zoom, max_available_zoom)
-
-            print(f"[INFO] Zoom level {actual_zoom}")
-
-            bbox = wojewodztwo['bounds']
-            stitched_path = os.path.join(
-                output_base,
-                f"{wojewodztwo_slug}_zoom{actual_zoom}_stitched.jpg"
-            )
-            stitched_path = extract_tiles_from_mbtiles(
+        max_available_zoom = mbtiles_pool(mbtiles_path).max_zoom() or 13
+        actual_zoom = min(zoom, max_available_zoom)
+        bbox = wojewodztwo['bounds']
+        stitched_path = os.path.join(
+            output_base,
+            f"{wojewodztwo_slug}_zoom{actual_zoom}_stitched.jpg"
+        )
+        # pelna mozaika tylko na zadanie; georeferencja / granica licza jej rozmiar z bounds
+        if payload.get("save_stitched") and not os.path.exists(stitched_path):
+            extract_tiles_from_mbtiles(
                 mbtiles_path=mbtiles_path,
                 bbox=bbox,
                 zoom=actual_zoom,
                 output_path=stitched_path
             )
+        if not os.path.exists(stitched_path):
+            stitched_path = ""
 
-            if not os.path.exists(stitched_path):
-                return JsonResponse({"error": "Failed to extract tiles"}, status=500)
+        # okno przyciecia z wierzcholkow granicy -> pobierane / dekodowane tylko kafelki w nim
+        mx0, my0, mx1, my1 = bbox_mosaic_window(bbox, actual_zoom)
+        cropped_mask, (x, y) = mask_crop_window((my1 - my0, mx1 - mx0), wojewodztwo['shapely_geom'], bbox)
+        h, w = cropped_mask.shape
+        crop_origin = (mx0 + x, my0 + y)
 
-            # Create mask
-            img = cv2.imread(stitched_path)
-            if img is None:
-                return JsonResponse({
-                    "error": f"Failed to read extracted image: {stitched_path}"
-                }, status=500)
-
-            mask = create_mask_from_geometry(
-                img.shape,
-                wojewodztwo['shapely_geom'],
-                bbox,
-                actual_zoom
-            )
+        if os.path.exists(base_cropped_path) and os.path.exists(base_mask_path):
+            print(f"[INFO] Using cached cropped image for zoom {zoom}")
+            cropped_path = base_cropped_path
+            image = None
+        else:
+            print(f"[INFO] Creating new cropped image for zoom {zoom}")
+            print(f"[INFO] Zoom level {actual_zoom}")
+            image = extract_window_array(mbtiles_path, actual_zoom, (*crop_origin, crop_origin[0] + w, crop_origin[1] + h))
 
-            cropped_path, cropped_mask, crop_offset = crop_image_by_mask(
-                stitched_path, mask, base_cropped_path
-            )
+            # cache kolejnych analiz (inne parametry / model): cropped JPEG + maska
+            cropped_path = base_cropped_path
+            write_display_jpeg(cropped_path, image, quality=95)
+            cv2.imwrite(base_mask_path, cropped_mask)
 
         stats, outputs = run_analysis(
             image_path=cropped_path,
+            image=image,
             model_path=model_path,
             options={
                 **params,
                 'mask': cropped_mask,
-                'zoom': zoom,
-                'bounds': wojewodztwo['bounds']
+                # zoom faktycznie pobranych kafelkow (zadany moze byc przyciety do MBTiles)
+                'zoom': actual_zoom,
+                'bounds': wojewodztwo['bounds'],
+                'origin_px': crop_origin,
+                'ASYNC_OUTPUTS': True
             }
         )
+        artifacts_pending = outputs.get("artifacts_status") == ARTIFACTS_PENDING
 
         mask_path = outputs.get("mask_path") or outputs.get("mask")
         blended_path = outputs.get("blended_path") or outputs.get("blended")
@@ -694,17 +822,19 @@ def analyze_wojewodztwo(request):
             model_path=model_path,
             config=params,  # Store full params for display
             zoom=zoom,
-            original_image_path=stitched_path if 'stitched_path' in locals() else None,
+            original_image_path=stitched_path,
             cropped_image_path=cropped_path,
-            mask_path=mask_path if mask_path and os.path.exists(str(mask_path)) else None,
-            fig_path=blended_path if blended_path and os.path.exists(str(blended_path)) else None,
+            mask_path=mask_path if mask_path and (artifacts_pending or os.path.exists(str(mask_path))) else None,
+            fig_path=blended_path if blended_path and mask_path and (artifacts_pending or os.path.exists(str(mask_path))) else None,
             stats=stats_clean,
             stats_json=outputs.get("stats_json"),
             metadata_json=outputs.get("metadata_json"),
             change_log_path=outputs.get("change_log"),
             total_area_km2=total_area_km2,
-            cache_key=cache_key
+            cache_key=cache_key,
+            artifacts_status=outputs.get("artifacts_status")
         )
+        queue_analysis_artifacts(analysis, outputs)
 
         return JsonResponse({
             "success": True,
@@ -719,41 +849,31 @@ def analyze_wojewodztwo(request):
         traceback.print_exc()
         return JsonResponse({"error": str(e)}, status=500)
 
+@cache_control(public=True, max_age=TILE_MAX_AGE, immutable=True)
+@condition(etag_func=lambda request, wojewodztwo_id, z, x, y: tile_etag(POLAND_MBTILES, z, x, y))
 def wojewodztwo_tiles(request, wojewodztwo_id, z, x, y):
     """
     provide
     GET /wojewodztwo_tiles/<wojewodztwo_id>/{z}/{x}/{y}.jpg - same process for /tiles/
     """
-    mbtiles_path = os.path.join(
-        settings.BASE_DIR,
-        "data/raw/satellite-2017-11-02_europe_poland.mbtiles"
-    )
+    mbtiles_path = POLAND_MBTILES
 
     if not os.path.exists(mbtiles_path):
         raise Http404("MBTiles file not found")
 
+    # MBTiles uses TMS, so we need to flip Y
+    # For TMS: y_tms = (2^z - 1) - y_xyz
+    y_tms = (2 ** int(z) - 1) - int(y)
     try:
-        conn = sqlite3.connect(mbtiles_path)
-        cur = conn.cursor()
-
-        # MBTiles uses TMS, so we need to flip Y
-        # For TMS: y_tms = (2^z - 1) - y_xyz
-        y_tms = (2 ** int(z) - 1) - int(y)
-        cur.execute(
-            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
-            (z, x, y_tms)
-        )
-        row = cur.fetchone()
-        conn.close()
-
-        if not row:
-            raise Http404("Tile not found")
-
-        return HttpResponse(row[0], content_type="image/jpeg")
-
+        tile = cached_tile(mbtiles_path, z, x, y_tms)
     except Exception as e:
         raise Http404(f"Error fetching tile: {e}")
 
+    if tile is None:
+        raise Http404("Tile not found")
+
+    return HttpResponse(tile, content_type="image/jpeg")
+
 def api_list_wojewodztwa(request):
     """
     fetch analysis status
@@ -779,6 +899,78 @@ def api_list_wojewodztwa(request):
 
     return JsonResponse({'wojewodztwa': result})
 
+def wojewodztwo_boundary_overlay(request, analysis_id):
+    """
+    GET /wojewodztwo/<analysis_id>/boundary.svg - transparent boundary overlay for the cropped image
+    """
+    try:
+        analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
+    except WojewodztwoAnalysis.DoesNotExist:
+        return HttpResponse("Analysis not found", status=404)
+
+    if not analysis.cropped_image_path or not os.path.exists(analysis.cropped_image_path):
+        return HttpResponse("Image not found", status=404)
+
+    svg_path = create_boundary_overlay(
+        analysis.cropped_image_path,
+        analysis.geometry,
+        analysis.bounds,
+        stitched_size=wojewodztwo_stitched_size(analysis)
+    )
+    if not svg_path:
+        return HttpResponse("Boundary not available", status=404)
+
+    return conditional_file_response(request, svg_path, 'image/svg+xml')
+
+@lru_cache(maxsize=64)
+def _overlay_georeference(analysis_type, analysis_id, mask_path):
+    # mask_path w kluczu: nowa analiza pod tym samym id nie uzywa starej georeferencji
+    model = WojewodztwoAnalysis if analysis_type == 'wojewodztwo' else Analysis
+    return analysis_georeference(model.objects.get(id=analysis_id))
+
+
+def overlay_tiles_url(analysis_id, analysis_type=None):
+    """Leaflet URL template of analysis_overlay_tile: the reversed route with {z}/{x}/{y} placeholders"""
+    if analysis_type is None:
+        url = reverse("analysis_overlay_tile", args=[analysis_id, 0, 0, 0])
+    else:
+        url = reverse("analysis_overlay_tile_typed", args=[analysis_type, analysis_id, 0, 0, 0])
+    # koncowka z/x/y trasy -> placeholdery Leafleta
+    return url[:-len("0/0/0.png")] + "{z}/{x}/{y}.png"
+
+
+def analysis_overlay_tile(request, analysis_id, z, x, y, analysis_type='bbox'):
+    """
+    GET /analysis/<id>/overlay/{z}/{x}/{y}.png - XYZ tile of the classification overlay
+    (palette PNG from the stored label raster, transparent outside the analysis)
+    """
+    try:
+        if analysis_type == 'bbox':
+            analysis = Analysis.objects.get(id=analysis_id)
+        elif analysis_type == 'wojewodztwo':
+            analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
+        else:
+            return HttpResponse("Invalid analysis type", status=400)
+    except (Analysis.DoesNotExist, WojewodztwoAnalysis.DoesNotExist):
+        return HttpResponse("Analysis not found", status=404)
+
+    # kafelki nie blokuja workera: 202 + Retry-After, mapa pobierze ponownie
+    pending = artifacts_unavailable_response(analysis, timeout=0)
+    if pending is not None:
+        return pending
+    if not analysis.mask_path or not os.path.exists(analysis.mask_path):
+        return HttpResponse("Mask not found", status=404)
+
+    etag = file_etag(analysis.mask_path, z, x, y)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        zoom, origin_px = _overlay_georeference(analysis_type, analysis.id, analysis.mask_path)
+        response = HttpResponse(overlay_tile(analysis.mask_path, zoom, origin_px, z, x, y), content_type="image/png")
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=ARTIFACT_MAX_AGE)
+    return response
+
+
 def download_wojewodztwo_image(request, analysis_id, image_type):
     """
     Download images from wojewodztwo analysis
@@ -787,10 +979,15 @@ def download_wojewodztwo_image(request, analysis_id, image_type):
     try:
         analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
 
+        if image_type in ('mask', 'blended'):
+            pending = artifacts_unavailable_response(analysis)
+            if pending is not None:
+                return pending
+
         file_path_map = {
             'original': analysis.cropped_image_path,
             'mask': analysis.mask_path,
-            'blended': analysis.fig_path,
+            'blended': blended_image_path(analysis) if image_type == 'blended' else analysis.fig_path,
         }
 
         file_path = file_path_map.get(image_type)
@@ -807,9 +1004,7 @@ def download_wojewodztwo_image(request, analysis_id, image_type):
         if not any(file_abs.startswith(os.path.abspath(d)) for d in allowed_dirs):
             return HttpResponse("Access denied", status=403)
 
-        return FileResponse(open(file_path, 'rb'),
-                            as_attachment=True,
-                            filename=os.path.basename(file_path))
+        return conditional_file_response(request, file_path, as_attachment=True)
 
     except WojewodztwoAnalysis.DoesNotExist:
         return HttpResponse("Analysis not found", status=404)
@@ -856,7 +1051,7 @@ def history(request):
         files_available = {
             "stats_json": a.stats_json and os.path.exists(a.stats_json),
             "metadata_json": a.metadata_json and os.path.exists(a.metadata_json),
-            "fig": a.fig_path and os.path.exists(a.fig_path),
+            "fig": bool(a.fig_path and a.mask_path and os.path.exists(a.mask_path)),
             "mask": a.mask_path and os.path.exists(a.mask_path),
         }
         stats_translated = translate_stats(a.stats or {})
@@ -877,7 +1072,7 @@ def history(request):
         files_available = {
             "stats_json": a.stats_json and os.path.exists(a.stats_json),
             "metadata_json": a.metadata_json and os.path.exists(a.metadata_json),
-            "fig": a.fig_path and os.path.exists(a.fig_path),
+            "fig": bool(a.fig_path and a.mask_path and os.path.exists(a.mask_path)),
             "mask": a.mask_path and os.path.exists(a.mask_path),
         }
 
@@ -905,6 +1100,8 @@ def history(request):
         "page_obj": page_obj,
         "total_count": len(analyses_data),
         "title": "Historia analiz",
+        # GeoTIFF tylko z rasterio
+        "geotiff_available": geotiff_available(),
     })
 
 def generate_short_desc(areas_pct):
@@ -940,7 +1137,7 @@ def generate_short_desc(areas_pct):
 
 def get_analysis_preview(request, analysis_type, analysis_id):
     """
-    preview for history
+    preview for history (?image=mask|blended)
     """
     try:
         if analysis_type == 'bbox':
@@ -948,7 +1145,14 @@ def get_analysis_preview(request, analysis_type, analysis_id):
         else:
             analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
 
-        preview_path = analysis.fig_path or analysis.mask_path
+        pending = artifacts_unavailable_response(analysis)
+        if pending is not None:
+            return pending
+
+        if request.GET.get("image") == "mask":
+            preview_path = analysis.mask_path
+        else:
+            preview_path = blended_image_path(analysis) or analysis.mask_path
 
         if not preview_path or not os.path.exists(preview_path):
             return HttpResponse("Image not found", status=404)
@@ -962,15 +1166,45 @@ def get_analysis_preview(request, analysis_type, analysis_id):
             return HttpResponse("Access denied", status=403)
 
         # Serve image
-        return FileResponse(open(preview_path, 'rb'), content_type='image/png')
+        content_type = 'image/png' if preview_path.endswith('.png') else 'image/jpeg'
+        return conditional_file_response(request, preview_path, content_type)
 
     except (Analysis.DoesNotExist, WojewodztwoAnalysis.DoesNotExist):
         return HttpResponse("Analysis not found", status=404)
 
+def get_analysis_residential(request, analysis_type, analysis_id):
+    """
+    Residential pixels of the original image (RGBA PNG cropped to their bbox),
+    computed from the stored label raster on first request and cached next to the mask
+    """
+    try:
+        if analysis_type == 'bbox':
+            analysis = Analysis.objects.get(id=analysis_id)
+        elif analysis_type == 'wojewodztwo':
+            analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
+        else:
+            return HttpResponse("Invalid analysis type", status=400)
+    except (Analysis.DoesNotExist, WojewodztwoAnalysis.DoesNotExist):
+        return HttpResponse("Analysis not found", status=404)
+
+    pending = artifacts_unavailable_response(analysis)
+    if pending is not None:
+        return pending
+
+    if not analysis.mask_path or not os.path.exists(analysis.mask_path):
+        return HttpResponse("Mask not found", status=404)
+
+    output_path = residential_artifact(analysis.mask_path, analysis_image_path(analysis))
+    if output_path is None:
+        return HttpResponse("No residential area", status=404)
+
+    return conditional_file_response(request, output_path, 'image/png')
+
 def download_analysis_file(request, analysis_type, analysis_id, file_type):
     """
     analysis_type: bbox, wojewodztwo
-    file_type: fig, metadata, mask
+    file_type: fig, metadata, mask, labels_tif, confidence_tif (GeoTIFF, EPSG:3857),
+    geojson (class region polygons, lon/lat)
     """
     try:
         if analysis_type == 'bbox':
@@ -980,10 +1214,36 @@ def download_analysis_file(request, analysis_type, analysis_id, file_type):
         else:
             return HttpResponse("Invalid analysis type", status=400)
 
+        pending = artifacts_unavailable_response(analysis)
+        if pending is not None:
+            return pending
+
+        if file_type in ('labels_tif', 'confidence_tif'):
+            if not geotiff_available():
+                return HttpResponse("GeoTIFF export requires rasterio", status=501)
+            if not analysis.mask_path or not os.path.exists(analysis.mask_path):
+                return HttpResponse("File not found", status=404)
+            zoom, origin_px = analysis_georeference(analysis)
+            geotiff_path = geotiff_artifact(
+                analysis.mask_path, file_type.replace('_tif', ''), zoom, origin_px
+            )
+        else:
+            geotiff_path = None
+
+        if file_type == 'geojson':
+            if not analysis.mask_path or not os.path.exists(analysis.mask_path):
+                return HttpResponse("File not found", status=404)
+            landcover_path = landcover_artifact(analysis.mask_path, *analysis_georeference(analysis))
+        else:
+            landcover_path = None
+
         file_path_map = {
+            'geojson': landcover_path,
+            'labels_tif': geotiff_path,
+            'confidence_tif': geotiff_path,
             'stats_json': analysis.stats_json,
             'metadata_json': analysis.metadata_json,
-            'fig': analysis.fig_path,
+            'fig': blended_image_path(analysis) if file_type == 'fig' else analysis.fig_path,
             'mask': analysis.mask_path,
         }
 
@@ -1002,16 +1262,76 @@ def download_analysis_file(request, analysis_type, analysis_id, file_type):
     file_abs = os.path.abspath(file_path)
     if not any(file_abs.startswith(os.path.abspath(d)) for d in allowed_dirs):
         return HttpResponse("Access denied", status=403)
-    with open(file_path, 'rb') as f:
-        response = HttpResponse(f.read())
-        if file_path.endswith('.json'):
-            response['Content-Type'] = 'application/json'
-        elif file_path.endswith('.png'):
-            response['Content-Type'] = 'image/png'
-        elif file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
-            response['Content-Type'] = 'image/jpeg'
-        elif file_path.endswith('.zip'):
-            response['Content-Type'] = 'application/zip'
-
-        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
+    content_type = None
+    if file_path.endswith('.json'):
+        content_type = 'application/json'
+    elif file_path.endswith('.png'):
+        content_type = 'image/png'
+    elif file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
+        content_type = 'image/jpeg'
+    elif file_path.endswith('.tif'):
+        content_type = 'image/tiff'
+    elif file_path.endswith('.geojson'):
+        content_type = 'application/geo+json'
+    elif file_path.endswith('.zip'):
+        content_type = 'application/zip'
+
+    return conditional_file_response(request, file_path, content_type, as_attachment=True)
+
+
+def get_analysis_change_log(request, analysis_type, analysis_id):
+    """
+    Paginated JSON view of the stored (compact) change log
+    GET ?kind=smoothing|sealake&page=1&per_page=500, ?download -> full JSON attachment
+    """
+    try:
+        if analysis_type == 'bbox':
+            analysis = Analysis.objects.get(id=analysis_id)
+        elif analysis_type == 'wojewodztwo':
+            analysis = WojewodztwoAnalysis.objects.get(id=analysis_id)
+        else:
+            return JsonResponse({"error": "Invalid analysis type"}, status=400)
+    except (Analysis.DoesNotExist, WojewodztwoAnalysis.DoesNotExist):
+        return JsonResponse({"error": "Analysis not found"}, status=404)
+
+    pending = artifacts_unavailable_response(analysis)
+    if pending is not None:
+        return pending
+
+    log_path = analysis.change_log_path
+    if not log_path or not os.path.exists(log_path):
+        return JsonResponse({"error": "No change log stored."}, status=404)
+
+    kind = request.GET.get("kind", "smoothing")
+    if kind not in ("smoothing", "sealake"):
+        return JsonResponse({"error": f"Unknown change log kind: {kind}"}, status=400)
+
+    log = load_change_log(log_path)
+    changes = log.get(kind)
+    if changes is None:
+        changes = []
+    if kind == "smoothing":
+        to_records = lambda c: change_log_to_records(c, log["class_names"])
+    else:
+        to_records = sealake_changes_to_records
+
+    if "download" in request.GET:
+        response = HttpResponse(json.dumps(to_records(changes)), content_type="application/json")
+        response['Content-Disposition'] = f'attachment; filename="analysis_{analysis.id}_{kind}_change_log.json"'
         return response
+
+    try:
+        per_page = min(max(int(request.GET.get("per_page", 500)), 1), 5000)
+    except ValueError:
+        per_page = 500
+    paginator = Paginator(changes, per_page)
+    page_obj = paginator.get_page(request.GET.get("page", 1))
+
+    return JsonResponse({
+        "kind": kind,
+        "page": page_obj.number,
+        "num_pages": paginator.num_pages,
+        "per_page": per_page,
+        "total": paginator.count,
+        "changes": to_records(page_obj.object_list),
+    })
@@ -124,6 +124,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# MBTiles tile cache (per process, bytes); TILE_CACHE_DIR = shared on-disk tier for several workers
+TILE_CACHE_BYTES = 64 * 1024 * 1024
+TILE_CACHE_DIR = None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
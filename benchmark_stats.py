@@ -0,0 +1,112 @@
+"""
+script-benchmark dla stats.py (vectorized vs stara petla per-pixel)
+python benchmark_stats.py [--sizes 64 128 256 512] [--grid-sizes 512 2048 4096]
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from Classifier.src.config import CLASS_NAMES, COLORS
+from Classifier.src.stats import (
+    compute_boundary_analysis, compute_grid_stats, compute_label_stats, mask_to_labels
+)
+
+
+def boundary_analysis_loop(classification_mask, class_names):
+    """reference: poprzednia implementacja (dwie petle per pixel)"""
+    h, w, _ = classification_mask.shape
+    adjacency = {cls: {cls2: 0 for cls2 in class_names} for cls in class_names}
+
+    mask_idx = np.zeros((h, w), dtype=int)
+    color_to_idx = {tuple(v): i for i, v in enumerate([COLORS[c] for c in class_names])}
+
+    for y in range(h):
+        for x in range(w):
+            color = tuple(classification_mask[y, x])
+            mask_idx[y, x] = color_to_idx.get(color, -1)
+    for y in range(h - 1):
+        for x in range(w - 1):
+            c1, c2 = mask_idx[y, x], mask_idx[y, x + 1]
+            c3, c4 = mask_idx[y, x], mask_idx[y + 1, x]
+            if c1 != c2 and c1 >= 0 and c2 >= 0:
+                adjacency[class_names[c1]][class_names[c2]] += 1
+                adjacency[class_names[c2]][class_names[c1]] += 1
+            if c3 != c4 and c3 >= 0 and c4 >= 0:
+                adjacency[class_names[c3]][class_names[c4]] += 1
+                adjacency[class_names[c4]][class_names[c3]] += 1
+
+    total = sum(sum(v.values()) for v in adjacency.values())
+    for c in adjacency:
+        for c2 in adjacency[c]:
+            adjacency[c][c2] = adjacency[c][c2] / total if total > 0 else 0
+
+    return adjacency
+
+
+def random_pred_grid(size, tile_size=32, seed=0):
+    rng = np.random.default_rng(seed)
+    grid = -(-size // tile_size)
+    return rng.integers(-1, len(CLASS_NAMES), size=(grid, grid))
+
+
+def random_tile_mask(size, tile_size=32, seed=0):
+    """tile-uniform RGB mask + masked (black) tiles"""
+    pred_grid = random_pred_grid(size, tile_size, seed)
+    palette = np.array([(0, 0, 0)] + [COLORS[c] for c in CLASS_NAMES], dtype=np.uint8)
+    labels = np.repeat(np.repeat(pred_grid + 1, tile_size, axis=0), tile_size, axis=1)[:size, :size]
+    return palette[labels]
+
+
+def grid_vs_pixel_stats(size, tile_size=32):
+    """compute_label_stats (pixel) vs compute_grid_stats (pred_grid)"""
+    # tylko pelne kafelki, jak w run_analysis
+    size = size // tile_size * tile_size
+    pred_grid = random_pred_grid(size, tile_size)
+    labels = mask_to_labels(random_tile_mask(size, tile_size), CLASS_NAMES)
+    valid = (labels != 255).astype(np.uint8) * 255
+
+    pixel, t_pixel = timed(compute_label_stats, labels, CLASS_NAMES, valid, 10, [17.0, 50.0, 18.0, 51.0])
+    grid, t_grid = timed(compute_grid_stats, pred_grid, tile_size, labels.shape, CLASS_NAMES,
+                         10, [17.0, 50.0, 18.0, 51.0])
+    for key in ("areas_pct", "fragmentation_index"):
+        for c in CLASS_NAMES:
+            assert abs(pixel[key][c] - grid[key][c]) < 1e-12, (size, key, c)
+    return t_pixel, t_grid
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256, 512])
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[512, 2048, 4096])
+    args = parser.parse_args()
+
+    print(f"{'size':>8s} {'loop [s]':>10s} {'numpy [s]':>10s} {'speedup':>9s}")
+    for size in args.sizes:
+        mask = random_tile_mask(size)
+        expected, t_loop = timed(boundary_analysis_loop, mask, CLASS_NAMES)
+        result, t_np = timed(compute_boundary_analysis, mask, CLASS_NAMES)
+
+        for c in CLASS_NAMES:
+            for c2 in CLASS_NAMES:
+                assert abs(expected[c][c2] - result[c][c2]) < 1e-12, (size, c, c2)
+
+        print(f"{size:>8d} {t_loop:>10.4f} {t_np:>10.4f} {t_loop / max(t_np, 1e-9):>8.1f}x")
+
+    print(f"\n{'size':>8s} {'pixel [s]':>10s} {'grid [s]':>10s} {'speedup':>9s}")
+    for size in args.grid_sizes:
+        t_pixel, t_grid = grid_vs_pixel_stats(size)
+        print(f"{size:>8d} {t_pixel:>10.4f} {t_grid:>10.4f} {t_pixel / max(t_grid, 1e-9):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()